@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""Benchmark suite for the per-record cost of FlaskExtraLoggerFormatter.format
+
+Run it from the repository root, with Flask installed:
+
+.. code-block:: sh
+
+   $ PYTHONPATH=. python benchmarks/format_benchmark.py --output results.json
+
+To compare the results with an earlier run, save them as a baseline first, then
+pass it to later runs:
+
+.. code-block:: sh
+
+   $ PYTHONPATH=. python benchmarks/format_benchmark.py --save-baseline baseline.json
+   $ PYTHONPATH=. python benchmarks/format_benchmark.py --baseline baseline.json
+
+The runner exits with status 1 if any scenario got slower than the baseline by
+more than the tolerance (20% by default).
+"""
+
+import argparse
+from contextlib import contextmanager
+import json
+import logging
+import platform
+import sys
+import timeit
+
+from flask import Flask, Blueprint
+
+import flask_logging_extras
+
+try:
+    from importlib.metadata import version
+except ImportError:  # pragma: no cover
+    version = None
+
+NUMBER = 20000
+REPEAT = 5
+
+
+def bench_resolver():
+    return 'resolved value'
+
+
+@contextmanager
+def null_context():
+    yield
+
+
+def make_app(resolvers=0, static=False, enabled=True):
+    app = Flask('bench')
+    app.config['FLASK_LOGGING_EXTRAS'] = {
+        'ENABLED': enabled,
+        'BLUEPRINT': {
+            'FORMAT_NAME': 'bp',
+        },
+        'RESOLVERS': dict(('kw{}'.format(i), 'static value' if static else '__main__.bench_resolver')
+                          for i in range(resolvers)),
+    }
+
+    bp = Blueprint('bench_blueprint', __name__)
+
+    @app.route('/app')
+    def app_route():
+        return ''
+
+    @bp.route('/blueprint')
+    def bp_route():
+        return ''
+
+    app.register_blueprint(bp)
+
+    return app
+
+
+def make_formatter(resolvers=0, **kwargs):
+    fmt = ' '.join(['%(message)s', '%(bp)s'] + ['%(kw{})s'.format(i) for i in range(resolvers)])
+
+    return flask_logging_extras.FlaskExtraLoggerFormatter(fmt=fmt, **kwargs)
+
+
+def scenario(resolvers=0, static=False, context='request_blueprint', enabled=True, **kwargs):
+    app = make_app(resolvers, static, enabled)
+    formatter = make_formatter(resolvers, **kwargs)
+    flask_logging_extras.FlaskLoggingExtras(app)
+
+    if context == 'no_app':
+        ctx = null_context()
+    elif context == 'app':
+        ctx = app.app_context()
+    elif context == 'request_app':
+        ctx = app.test_request_context('/app')
+    else:
+        ctx = app.test_request_context('/blueprint')
+
+    return formatter, ctx
+
+
+def scenarios():
+    yield 'stock_formatter', (logging.Formatter(fmt='%(message)s'), null_context())
+    yield 'no_app_context', scenario(context='no_app')
+    yield 'app_context', scenario(context='app')
+    yield 'request_no_blueprint', scenario(context='request_app')
+    yield 'request_blueprint', scenario(context='request_blueprint')
+    yield 'request_blueprint_stats', scenario(context='request_blueprint', collect_stats=True)
+    yield 'disabled', scenario(5, enabled=False)
+
+    for count in (0, 5, 50):
+        yield 'resolvers_{}_callable'.format(count), scenario(count)
+        yield 'resolvers_{}_static'.format(count), scenario(count, static=True)
+
+    yield 'resolvers_5_callable_context', scenario(5, enrichment='context')
+    yield 'resolvers_50_static_context', scenario(50, static=True, enrichment='context')
+
+    for time_mode in (None, 'cached', 'iso8601'):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(asctime)s %(message)s',
+                                                                   time_mode=time_mode)
+        yield 'asctime_{}'.format(time_mode or 'stock'), (formatter, null_context())
+
+
+def measure(formatter, ctx, number=NUMBER, repeat=REPEAT):
+    """Get the best per-record time of ``formatter.format``, in nanoseconds
+    """
+
+    timings = []
+
+    with ctx:
+        for _ in range(repeat):
+            records = [logging.LogRecord('bench', logging.INFO, __file__, 1, 'message', None, None)
+                       for _ in range(number)]
+            timings.append(timeit.timeit(lambda: [formatter.format(record) for record in records], number=1))
+
+    return min(timings) / number * 1e9
+
+
+def compare(results, baseline, tolerance):
+    """Print the results next to the baseline, and return the names of the regressed scenarios
+    """
+
+    regressions = []
+
+    for name, value in sorted(results.items()):
+        reference = baseline.get(name)
+
+        if reference is None:
+            print('{:<28} {:10.0f} ns'.format(name, value))
+
+            continue
+
+        change = value / reference - 1
+        print('{:<28} {:10.0f} ns {:10.0f} ns {:+7.1%}'.format(name, value, reference, change))
+
+        if change > tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 2)[1])
+    parser.add_argument('--number', type=int, default=NUMBER, help='records per repetition')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='number of repetitions')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results with this JSON file')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file as a new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown compared to the baseline')
+    args = parser.parse_args(argv)
+
+    results = dict((name, measure(formatter, ctx, args.number, args.repeat))
+                   for name, (formatter, ctx) in scenarios())
+    report = {
+        'python': platform.python_version(),
+        'flask': version('flask') if version else None,
+        'flask_logging_extras': flask_logging_extras.__version__,
+        'unit': 'ns/record',
+        'results': results,
+    }
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+
+    baseline = {}
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    regressions = compare(results, baseline, args.tolerance)
+
+    if regressions:
+        print('Regressions: {}'.format(', '.join(regressions)))
+
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
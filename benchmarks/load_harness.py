@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Load harness for the cost of logging in real Flask requests
+
+Every scenario builds an app with a few blueprints and resolvers, whose views
+log a few records each, and drives it from several threads, either through the
+test client or through a local WSGI server.  The records are formatted, then
+written to ``os.devnull``.
+
+Run it from the repository root, with Flask installed:
+
+.. code-block:: sh
+
+   $ PYTHONPATH=. python benchmarks/load_harness.py --threads 8 --requests 2000
+   $ PYTHONPATH=. python benchmarks/load_harness.py --server --output results.json
+
+Each scenario is run ``--repeat`` times, and the run with the best throughput
+is reported.  The ``disabled`` scenario sets ``ENABLED`` to ``False``,
+``stock_formatter`` uses :class:`logging.Formatter` without the extension, and
+the other scenarios turn on one optional fast path each.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+
+from flask import Flask, Blueprint
+
+import flask_logging_extras
+
+try:
+    from http.client import HTTPConnection
+except ImportError:  # pragma: no cover
+    from httplib import HTTPConnection
+
+THREADS = 8
+REQUESTS = 500
+REPEAT = 3
+BLUEPRINTS = 4
+RECORDS_PER_REQUEST = 5
+FORMAT = '%(asctime)s %(levelname)s [%(bp)s] [%(user)s] [%(client)s] [%(region)s] %(message)s'
+
+
+def get_user():
+    return 'user-42'
+
+
+def get_client():
+    return '127.0.0.1'
+
+
+def make_app(logger, enabled=True, **config):
+    app = Flask('load_harness')
+    app.config['FLASK_LOGGING_EXTRAS'] = dict({
+        'ENABLED': enabled,
+        'BLUEPRINT': {
+            'FORMAT_NAME': 'bp',
+        },
+        'RESOLVERS': {
+            'user': '__main__.get_user',
+            'client': '__main__.get_client',
+            'region': 'eu-west',
+        },
+    }, **config)
+
+    for number in range(BLUEPRINTS):
+        bp = Blueprint('blueprint_{}'.format(number), __name__)
+
+        @bp.route('/items/<int:item_id>')
+        def item(item_id):
+            for record_no in range(RECORDS_PER_REQUEST):
+                logger.info('Loading item %d, step %d', item_id, record_no)
+
+            return 'item {}'.format(item_id)
+
+        app.register_blueprint(bp, url_prefix='/bp{}'.format(number))
+
+    return app
+
+
+def make_logger(formatter, handlers=1):
+    logger = logging.getLogger('load_harness')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    for _ in range(handlers):
+        handler = logging.StreamHandler(open(os.devnull, 'w'))
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+
+    return logger
+
+
+def scenario(enabled=True, config=None, formatter_kwargs=None, handlers=1, stock=False):
+    if stock:
+        formatter = logging.Formatter(FORMAT.replace(' [%(bp)s] [%(user)s] [%(client)s] [%(region)s]', ''))
+    else:
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt=FORMAT, **(formatter_kwargs or {}))
+
+    logger = make_logger(formatter, handlers)
+    app = make_app(logger, enabled, **(config or {}))
+
+    if not stock:
+        flask_logging_extras.FlaskLoggingExtras(app)
+
+    return app
+
+
+def scenarios():
+    yield 'stock_formatter', dict(stock=True)
+    yield 'disabled', dict(enabled=False)
+    yield 'enabled', dict()
+    yield 'cached_time', dict(formatter_kwargs={'time_mode': 'cached'})
+    yield 'cached_resolvers', dict(config={'CACHE_RESOLVERS': True})
+    yield 'context_enrichment', dict(config={'CACHE_RESOLVERS': True}, formatter_kwargs={'enrichment': 'context'})
+    yield 'shared_formatting_2_handlers', dict(config={'SHARE_FORMATTED': True}, handlers=2)
+    yield 'all_fast_paths', dict(config={'CACHE_RESOLVERS': True},
+                                 formatter_kwargs={'time_mode': 'cached', 'enrichment': 'context'})
+    yield 'profiler_every_100', dict(config={'PROFILER': {'EVERY': 100, 'LOGGER': 'load_harness.profiler'}})
+
+
+def client_worker(app, requests, latencies):
+    client = app.test_client()
+
+    for number in range(requests):
+        path = '/bp{}/items/{}'.format(number % BLUEPRINTS, number)
+        start = time.perf_counter()
+        client.get(path)
+        latencies.append(time.perf_counter() - start)
+
+
+def server_worker(address, requests, latencies):
+    connection = HTTPConnection(*address)
+
+    for number in range(requests):
+        path = '/bp{}/items/{}'.format(number % BLUEPRINTS, number)
+        start = time.perf_counter()
+        connection.request('GET', path)
+        connection.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+
+    connection.close()
+
+
+def start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(app, threads=THREADS, requests=REQUESTS, server=False):
+    """Drive ``app`` from ``threads`` threads, and get its throughput and latency
+    """
+
+    http_server = None
+
+    if server:
+        http_server = start_server(app)
+        target, argument = server_worker, http_server.server_address[:2]
+    else:
+        target, argument = client_worker, app
+
+    # Warm up, so the configuration is processed and the code paths are hot
+    target(argument, BLUEPRINTS * 5, [])
+
+    latencies = [[] for _ in range(threads)]
+    workers = [threading.Thread(target=target, args=(argument, requests, latencies[number]))
+               for number in range(threads)]
+    start = time.perf_counter()
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    elapsed = time.perf_counter() - start
+
+    if http_server is not None:
+        http_server.shutdown()
+        http_server.server_close()
+
+    latencies = sorted(latency for thread_latencies in latencies for latency in thread_latencies)
+
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 2)[1])
+    parser.add_argument('--threads', type=int, default=THREADS, help='number of client threads')
+    parser.add_argument('--requests', type=int, default=REQUESTS, help='requests per thread')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs per scenario; the fastest one is kept')
+    parser.add_argument('--server', action='store_true', help='use a local WSGI server instead of the test client')
+    parser.add_argument('--scenario', action='append', help='only run this scenario (can be repeated)')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    print('{:<30} {:>10} {:>10} {:>10}'.format('scenario', 'req/s', 'p50 ms', 'p99 ms'))
+
+    for name, kwargs in scenarios():
+        if args.scenario and name not in args.scenario:
+            continue
+
+        runs = []
+
+        for _ in range(args.repeat):
+            gc.collect()
+            runs.append(run(scenario(**kwargs), args.threads, args.requests, args.server))
+
+        result = results[name] = max(runs, key=lambda result: result['requests_per_second'])
+        print('{:<30} {requests_per_second:10.0f} {p50_ms:10.3f} {p99_ms:10.3f}'.format(name, **result))
+
+    if args.output:
+        report = {
+            'python': platform.python_version(),
+            'flask_logging_extras': flask_logging_extras.__version__,
+            'threads': args.threads,
+            'requests_per_thread': args.requests,
+            'repeat': args.repeat,
+            'records_per_request': RECORDS_PER_REQUEST,
+            'driver': 'server' if args.server else 'test_client',
+            'results': results,
+        }
+
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -30,10 +30,33 @@ log message format, and the value is a default value that is substituted if
 no value is present in the message record.
 """
 
+import bisect
+from collections import OrderedDict
+from collections.abc import Mapping
+import contextvars
+import functools
 from importlib import import_module
+import itertools
+import json
 import logging
+import re
+from string import Formatter, Template
+import threading
+import time
+import traceback
+import warnings
+import weakref
+import zlib
 
-from flask import has_request_context, request, current_app, has_app_context
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
 
 __version_info__ = ('2', '0', '0')
 __version__ = '.'.join(__version_info__)
@@ -41,25 +64,1251 @@ __author__ = 'Gergely Polonkai'
 __license__ = 'MIT'
 __copyright__ = '(c) 2015-2018 Benchmarked.games'
 
+_EXTENSION_NAME = 'flask_logging_extras'
+_RESOLVER_CACHE_KEY = 'flask_logging_extras.resolver_cache'
+_REQUEST_STATE_KEY = 'flask_logging_extras.request_state'
+_PROFILE_KEY = 'flask_logging_extras.profile'
+_RECORD_EXTRAS_ATTR = '_flask_logging_extras'
+_PERCENT_FIELD_RE = re.compile(r'%\(([^)]+)\)')
+_DOTTED_NAME_RE = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)+$')
+_perf_counter = time.perf_counter
+_perf_counter_ns = time.perf_counter_ns
+_init_lock = threading.RLock()
+_formatters = weakref.WeakSet()
+# The output of formatters with SHARE_FORMATTED set, by record and formatter fingerprint
+_formatted_records = weakref.WeakKeyDictionary()
+_request_state = contextvars.ContextVar('flask_logging_extras_request_state', default=None)
+
+
+def _stringify_keys(obj):
+    """Convert mapping keys the JSON encoders can’t handle (like tuples) to strings, recursively
+    """
+
+    if isinstance(obj, Mapping):
+        return dict((key if key is None or isinstance(key, (str, int, float, bool)) else str(key),
+                     _stringify_keys(value))
+                    for key, value in obj.items())
+
+    if isinstance(obj, (list, tuple)):
+        return [_stringify_keys(value) for value in obj]
+
+    return obj
+
+
+def _json_dumps_stdlib(obj):
+    try:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=str)
+    except TypeError:
+        # Like tuple keys
+        return json.dumps(_stringify_keys(obj), separators=(',', ':'), ensure_ascii=False, default=str)
+
+
+def _json_dumps(obj):
+    """Serialise ``obj`` as compact JSON, with the fastest available encoder
+
+    Values the encoder can’t handle are converted using :func:`str`.
+    """
+
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str).decode('utf-8')
+        except TypeError:
+            # Like non-string keys, or integers over 64 bits
+            return _json_dumps_stdlib(obj)
+
+    if ujson is not None:
+        try:
+            return ujson.dumps(obj, ensure_ascii=False)
+        except (TypeError, ValueError, OverflowError):
+            pass
+
+    return _json_dumps_stdlib(obj)
+
+
+# Flask is imported only when it is first needed, so importing this module
+# stays cheap; _import_flask() replaces these placeholders with the real
+# objects (so only the placeholder called first ever runs)
+request = current_app = request_started = request_tearing_down = None
+
+
+def _import_flask():
+    global has_request_context, request, current_app, has_app_context, request_started, request_tearing_down
+
+    from flask import has_request_context, request, current_app, has_app_context, request_started, \
+        request_tearing_down
+
+
+def has_request_context():  # pragma: no cover
+    _import_flask()
+
+    return has_request_context()
+
+
+def has_app_context():  # pragma: no cover
+    _import_flask()
+
+    return has_app_context()
+
+
+def _import_by_string(fqn):
+    try:
+        mod_name, var_name = fqn.rsplit('.', 1)
+    except ValueError:
+        mod_name = fqn
+        var_name = None
+
+    mod = import_module(mod_name)
+
+    if var_name is None:
+        return mod
+
+    try:
+        var = getattr(mod, var_name)
+    except AttributeError:
+        raise AttributeError('{var_name} not found in {mod_name}'.format(var_name=var_name, mod_name=mod_name))
+
+    return var
+
+
+def _format_fields(fmt, style=None):
+    """Get the set of record attributes referenced by the format string ``fmt``
+
+    ``style`` is the style object of the formatter.  If the referenced fields
+    can’t be determined, ``None`` is returned.
+    """
+
+    try:
+        if isinstance(style, logging.StrFormatStyle):
+            return set(re.split(r'[.\[]', field_name, maxsplit=1)[0]
+                       for _, field_name, _, _ in Formatter().parse(fmt)
+                       if field_name)
+
+        if isinstance(style, logging.StringTemplateStyle):
+            return set(match.group('named') or match.group('braced')
+                       for match in Template.pattern.finditer(fmt)
+                       if match.group('named') or match.group('braced'))
+    except ValueError:
+        return None
+
+    return set(_PERCENT_FIELD_RE.findall(fmt))
+
+
+def _resolve(var_name, resolver, cache, args=()):
+    if not callable(resolver):
+        return resolver
+
+    if cache is None:
+        return resolver(*args)
+
+    try:
+        return cache[var_name]
+    except KeyError:
+        value = cache[var_name] = resolver(*args)
+
+        return value
+
+
+def _resolve_node(var_name, resolver, depends, source, values, cache):
+    """Resolve ``var_name`` using the already resolved values of its dependencies
+
+    ``values`` holds the values resolved for the current record.  Keywords
+    filled by a mapping resolver have that resolver as their ``source``; if
+    it didn’t return a mapping (e.g. it returned its ``FALLBACK``), they are
+    ``None``.
+    """
+
+    if source is not None:
+        mapping = _unwrap(values[source])
+
+        return mapping.get(var_name) if isinstance(mapping, Mapping) else None
+
+    if cache is not None and var_name in cache:
+        return cache[var_name]
+
+    return _resolve(var_name, resolver, cache, tuple(_unwrap(values[name]) for name in depends))
+
+
+def _resolver_order(requirements):
+    """Sort the resolvers so each of them comes after the ones it requires
+
+    ``requirements`` maps each resolver name to the names it depends on.
+    """
+
+    order = []
+    done = set()
+    visiting = []
+
+    def visit(name):
+        if name in done:
+            return
+
+        if name in visiting:
+            cycle = visiting[visiting.index(name):] + [name]
+
+            raise ValueError('Resolver dependency cycle: {}'.format(' -> '.join(cycle)))
+
+        visiting.append(name)
+
+        for dependency in requirements[name]:
+            if dependency not in requirements:
+                raise ValueError('Resolver {name} depends on unknown resolver {dependency}'.format(
+                    name=name, dependency=dependency))
+
+            visit(dependency)
+
+        visiting.pop()
+        done.add(name)
+        order.append(name)
+
+    for name in requirements:
+        visit(name)
+
+    return order
+
+
+class _LazyValue(object):
+    """A resolver value that is computed only when it is rendered
+
+    The value and its string representation are computed at most once, so the
+    same object can be rendered by several formatters.  It supports ``%s``,
+    ``%r``, ``{}`` and ``$`` style formatting; use :attr:`value` to get the
+    actual value.
+    """
+
+    __slots__ = ('_var_name', '_resolver', '_cache', '_value', '_str', '_evaluated')
+
+    def __init__(self, var_name, resolver, cache):
+        self._var_name = var_name
+        self._resolver = resolver
+        self._cache = cache
+        self._str = None
+        self._evaluated = False
+
+    @property
+    def value(self):
+        if not self._evaluated:
+            self._value = _resolve(self._var_name, self._resolver, self._cache)
+            self._evaluated = True
+            self._resolver = self._cache = None
+
+        return self._value
+
+    def __str__(self):
+        if self._str is None:
+            self._str = str(self.value)
+
+        return self._str
+
+    def __repr__(self):
+        return repr(self.value)
+
+    def __format__(self, format_spec):
+        if not format_spec:
+            return str(self)
+
+        return format(self.value, format_spec)
+
+
+def _unwrap(value):
+    """Get the actual value of a record attribute, evaluating it if it’s lazy
+    """
+
+    if isinstance(value, _LazyValue):
+        return value.value
+
+    return value
+
+
+def _evaluate_lazy_values(record):
+    """Replace the lazy values of ``record`` with their actual value
+    """
+
+    for name, value in list(record.__dict__.items()):
+        if isinstance(value, _LazyValue):
+            record.__dict__[name] = value.value
+
+
+def _clear_resolver_cache(sender, **kwargs):
+    request.environ.pop(_RESOLVER_CACHE_KEY, None)
+
+
+class _RequestProfiler(object):
+    """Profile every ``every``-th request, and log a summary of its hot paths
+
+    The summary is logged during teardown, so formatters tag it with the
+    blueprint of the profiled request.
+    """
+
+    SORT_KEYS = ('cumulative', 'tottime')
+
+    def __init__(self, every, logger_name, level, limit, sort):
+        if sort not in self.SORT_KEYS:
+            raise ValueError('Unknown profiler sort key {sort!r}'.format(sort=sort))
+
+        self.every = every
+        self.logger = logging.getLogger(logger_name)
+        self.level = level if isinstance(level, int) else logging.getLevelName(level)
+        self.limit = limit
+        self.sort = sort
+        self._counter = itertools.count(1)
+
+    def start(self, sender, **kwargs):
+        if next(self._counter) % self.every or not self.logger.isEnabledFor(self.level):
+            return
+
+        import cProfile
+
+        profile = cProfile.Profile()
+
+        try:
+            profile.enable()
+        except ValueError:  # pragma: no cover
+            # Another profiler is already running (since Python 3.12, even in another thread)
+            return
+
+        request.environ[_PROFILE_KEY] = (profile, _perf_counter())
+
+    def stop(self, sender, **kwargs):
+        started = request.environ.pop(_PROFILE_KEY, None)
+
+        if started is None:
+            return
+
+        profile, start_time = started
+        profile.disable()
+        elapsed = (_perf_counter() - start_time) * 1000
+        self.logger.log(self.level, 'Profile of %s %s (%.1f ms):\n%s', request.method, request.path, elapsed,
+                        self.summary(profile))
+
+    def summary(self, profile):
+        """Get the ``limit`` most expensive functions of ``profile``, one per line
+        """
+
+        import pstats
+
+        stats = pstats.Stats(profile).stats
+        index = 3 if self.sort == 'cumulative' else 2
+        lines = []
+
+        for (filename, lineno, function), row in sorted(stats.items(), key=lambda item: -item[1][index])[:self.limit]:
+            lines.append('{cumulative:10.3f} ms {own:10.3f} ms {calls:>8} {filename}:{lineno}({function})'.format(
+                cumulative=row[3] * 1000,
+                own=row[2] * 1000,
+                calls=row[1],
+                filename=filename,
+                lineno=lineno,
+                function=function))
+
+        return '\n'.join(lines)
+
+
+class _RequestState(object):
+    """Per-request values captured when the request starts
+
+    It is stored in a context variable, so it is available in asyncio tasks and
+    in functions run with :func:`copy_current_logging_context`, even where there
+    is no request context.
+    """
+
+    __slots__ = ('app', 'blueprint', 'cache', 'token', 'start_ns', 'request_id', 'log_count', 'context')
+
+    def __init__(self, app, blueprint, cache, request_id=None):
+        self.app = app
+        self.blueprint = blueprint
+        self.cache = cache
+        self.token = None
+        self.start_ns = _perf_counter_ns()
+        self.request_id = request_id
+        self.log_count = itertools.count(1)
+        self.context = None
+
+
+class _RequestContext(object):
+    """The keyword values shared by every record of a request, in ``'context'`` enrichment mode
+    """
+
+    __slots__ = ('values', '_filled_plans')
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        # The formatter plans whose keywords are already filled in
+        self._filled_plans = set()
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def as_dict(self):
+        return dict(self.values)
+
+
+class _RecordExtras(object):
+    """The keyword values of a record, in ``'context'`` enrichment mode
+
+    Values computed for each record are kept in :attr:`values`; the rest is
+    looked up in :attr:`context`.  Records without such values get the
+    :class:`_RequestContext` itself instead.
+    """
+
+    __slots__ = ('context', 'values')
+
+    def __init__(self, context):
+        self.context = context
+        self.values = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            return self.context.values[name]
+
+    def as_dict(self):
+        values = dict(self.context.values)
+        values.update(self.values)
+
+        return values
+
+
+class _RecordMapping(object):
+    """Look up a keyword of a record, whether it’s an attribute or stored in its extras
+    """
+
+    __slots__ = ('attributes', 'extras')
+
+    def __init__(self, attributes, extras):
+        self.attributes = attributes
+        self.extras = extras
+
+    def __getitem__(self, name):
+        try:
+            return self.attributes[name]
+        except KeyError:
+            if self.extras is None:
+                raise
+
+        return self.extras[name]
+
+
+class _FormatValues(object):
+    """A stand-in for a record, with the record attributes and its keywords as attributes
+    """
+
+
+def _current_request_state():
+    return _request_state.get()
+
+
+def _current_app():
+    """Get the current app, or the app of the current request state, or ``None``
+    """
+
+    state = _current_request_state()
+
+    if state is not None:
+        return state.app
+
+    if has_app_context():
+        return current_app._get_current_object()
+
+    return None
+
+
+def copy_current_logging_context(func):
+    """Wrap ``func`` so it runs in a copy of the current context
+
+    Records logged by ``func`` get the blueprint name and cached resolver values
+    of the request the function was wrapped in, even if it runs in another
+    thread (or after the request has finished).
+
+    .. code-block:: python
+
+       @app.route('/')
+       def index():
+           threading.Thread(target=copy_current_logging_context(background_job)).start()
+    """
+
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+
+    return wrapper
+
+
+def submit(executor, func, *args, **kwargs):
+    """Submit ``func`` to a :class:`concurrent.futures.Executor` in a copy of the current context
+
+    See :func:`copy_current_logging_context`.
+    """
+
+    return executor.submit(copy_current_logging_context(func), *args, **kwargs)
+
+
+class _GuardedResolver(object):
+    """A resolver wrapper that measures calls, and stops calling failing resolvers
+
+    A call fails if it raises an exception, or if it takes longer than
+    ``timeout`` seconds (the resolver is not interrupted, as it may need the
+    request context; the value it returns is still used).  After
+    ``max_failures`` consecutive failures the circuit opens: for ``cooldown``
+    seconds, the resolver is not called, and ``fallback`` is used instead.  The
+    first call after the cooldown closes the circuit if it succeeds.
+    """
+
+    OPTIONS = ('TIMEOUT', 'FALLBACK', 'MAX_FAILURES', 'COOLDOWN')
+    #: Upper bounds of the latency histogram buckets, in seconds
+    BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, float('inf'))
+
+    def __init__(self, resolver, timeout=None, fallback='<unavailable>', max_failures=3, cooldown=30):
+        self.resolver = resolver
+        self.timeout = timeout
+        self.fallback = fallback
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+
+        self.calls = 0
+        self.errors = 0
+        self.slow_calls = 0
+        self.short_circuited = 0
+        self.total_time = 0.0
+        self.histogram = [0] * len(self.BUCKETS)
+
+        self._failures = 0
+        self._open_until = None
+        self._lock = threading.Lock()
+
+    def __call__(self, *args):
+        if self._open_until is not None:
+            if _perf_counter() < self._open_until:
+                with self._lock:
+                    self.short_circuited += 1
+
+                return self.fallback
+
+        start = _perf_counter()
+        error = None
+
+        try:
+            value = self.resolver(*args)
+        except Exception as exc:
+            error = exc
+            value = self.fallback
+
+        elapsed = _perf_counter() - start
+        failed = error is not None or (self.timeout is not None and elapsed > self.timeout)
+
+        with self._lock:
+            self.calls += 1
+            self.total_time += elapsed
+            self.histogram[bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+
+            if error is not None:
+                self.errors += 1
+            elif failed:
+                self.slow_calls += 1
+
+            if failed:
+                self._failures += 1
+
+                if self._failures >= self.max_failures:
+                    self._open_until = _perf_counter() + self.cooldown
+            else:
+                self._failures = 0
+                self._open_until = None
+
+        return value
+
+    @property
+    def is_open(self):
+        return self._open_until is not None and _perf_counter() < self._open_until
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'slow_calls': self.slow_calls,
+                'short_circuited': self.short_circuited,
+                'total_time': self.total_time,
+                'histogram': list(zip(self.BUCKETS, self.histogram)),
+                'open': self.is_open,
+            }
+
+
+def get_resolver_stats(app):
+    """Get the call statistics of the resolvers of ``app``
+
+    Only resolvers with guard options (``TIMEOUT``, ``FALLBACK``,
+    ``MAX_FAILURES``, ``COOLDOWN``, either in their own configuration or in
+    ``RESOLVER_DEFAULTS``) are measured, or all of them if ``RESOLVER_METRICS``
+    is set.  The result is a dictionary keyed by keyword; each value holds the
+    number of calls, errors, slow calls and calls skipped while the circuit was
+    open, the total time spent in the resolver, and the latency histogram as a
+    list of ``(upper bound, count)`` pairs.
+    """
+
+    return dict((var_name, resolver.stats())
+                for var_name, resolver in _AppConfig.for_app(app).guarded_resolvers.items())
+
+
+_CAUSE_MESSAGE = '\nThe above exception was the direct cause of the following exception:\n\n'
+_CONTEXT_MESSAGE = '\nDuring handling of the above exception, another exception occurred:\n\n'
+
+try:
+    _EXCEPTION_GROUP = BaseExceptionGroup
+except NameError:  # pragma: no cover
+    _EXCEPTION_GROUP = None
+
+
+def _exception_chain(exc):
+    """Get the chain of ``exc`` as ``(exception, message)`` pairs, in the order they are printed
+
+    The message is the text printed after the exception (if it’s not the last
+    one of the chain), the same as :mod:`traceback` does.
+    """
+
+    chain = []
+    seen = set()
+    message = None
+
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        chain.append((exc, message))
+
+        if exc.__cause__ is not None:
+            exc, message = exc.__cause__, _CAUSE_MESSAGE
+        elif exc.__context__ is not None and not exc.__suppress_context__:
+            exc, message = exc.__context__, _CONTEXT_MESSAGE
+        else:
+            exc = None
+
+    chain.reverse()
+
+    return chain
+
+
+class _TracebackCache(object):
+    """A bounded LRU cache of rendered tracebacks
+
+    Tracebacks are keyed on their structure: the type of each exception in the
+    chain, and the code object, line number and instruction of each frame.  Only
+    the frames are cached; the exception messages are rendered every time.
+
+    If ``collapse`` is set, a traceback is rendered in full only once every
+    ``collapse`` seconds; repeats within that window are replaced by a short
+    reference to the full one.
+    """
+
+    def __init__(self, maxsize=128, collapse=None):
+        self.maxsize = maxsize
+        self.collapse = collapse
+        self.hits = 0
+        self.misses = 0
+        # key => [frames of each exception, digest, window start, count]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(chain):
+        key = []
+
+        for exc, message in chain:
+            frames = []
+            tb = exc.__traceback__
+
+            while tb is not None:
+                frames.append((tb.tb_frame.f_code, tb.tb_lineno, tb.tb_lasti))
+                tb = tb.tb_next
+
+            key.append((type(exc), tuple(frames), message))
+
+        return tuple(key)
+
+    def _entry(self, chain):
+        key = self._key(chain)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+                return entry
+
+        frames = []
+
+        for exc, _ in chain:
+            if exc.__traceback__ is None:
+                frames.append('')
+            else:
+                frames.append('Traceback (most recent call last):\n' + ''.join(traceback.format_tb(exc.__traceback__)))
+
+        digest = '{:08x}'.format(zlib.crc32(''.join(frames).encode('utf-8', 'replace')) & 0xffffffff)
+        entry = [frames, digest, None, 0]
+
+        with self._lock:
+            self.misses += 1
+            entry = self._entries.setdefault(key, entry)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return entry
+
+    def render(self, exc_info, blueprint=None, collapse=False):
+        """Render the traceback of ``exc_info``, or ``None`` if it can’t be cached
+        """
+
+        exc = exc_info[1]
+
+        if exc is None:
+            return None
+
+        chain = _exception_chain(exc)
+
+        if _EXCEPTION_GROUP is not None and any(isinstance(link, _EXCEPTION_GROUP) for link, _ in chain):
+            # Sub-exceptions are rendered as a tree; leave them to the stock formatter
+            return None
+        entry = self._entry(chain)
+        frames, digest = entry[0], entry[1]
+
+        if collapse and self.collapse is not None:
+            now = _perf_counter()
+
+            with self._lock:
+                if entry[2] is None or now - entry[2] >= self.collapse:
+                    entry[2] = now
+                    entry[3] = 1
+                    count = 1
+                else:
+                    entry[3] += 1
+                    count = entry[3]
+
+            if count > 1:
+                header = 'Traceback {digest} repeated ({count} times in {window}s{blueprint})\n'.format(
+                    digest=digest,
+                    count=count,
+                    window=self.collapse,
+                    blueprint=', blueprint {}'.format(blueprint) if blueprint else '')
+
+                return (header + ''.join(traceback.format_exception_only(type(exc), exc))).rstrip('\n')
+
+        parts = []
+
+        for (exc, message), exc_frames in zip(chain, frames):
+            parts.append(exc_frames)
+            parts.extend(traceback.format_exception_only(type(exc), exc))
+
+            if message is not None:
+                parts.append(message)
+
+        text = ''.join(parts).rstrip('\n')
+
+        if collapse and self.collapse is not None:
+            text += '\n(traceback {digest})'.format(digest=digest)
+
+        return text
+
+
+class _FormatStats(object):
+    """Record counters of formatters, keyed by ``(blueprint, level name, logger name)``
+
+    Each thread counts into its own dictionary, so counting needs no locking;
+    the shards are only merged when the counters are read.  The shards of
+    finished threads are folded into a single one when a new thread starts
+    counting.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = {}
+
+    def _register(self):
+        counters = self._local.counters = {}
+
+        with self._lock:
+            live = []
+
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+
+            live.append((threading.current_thread(), counters))
+            self._shards = live
+
+        return counters
+
+    @staticmethod
+    def _merge(target, shard):
+        for key, (count, size, elapsed) in shard.copy().items():
+            entry = target.get(key)
+
+            if entry is None:
+                target[key] = [count, size, elapsed]
+            else:
+                entry[0] += count
+                entry[1] += size
+                entry[2] += elapsed
+
+    def add(self, key, size, elapsed):
+        try:
+            counters = self._local.counters
+        except AttributeError:
+            counters = self._register()
+
+        entry = counters.get(key)
+
+        if entry is None:
+            counters[key] = [1, size, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += size
+            entry[2] += elapsed
+
+    def snapshot(self):
+        totals = {}
+
+        with self._lock:
+            self._merge(totals, self._retired)
+
+            for _, shard in self._shards:
+                self._merge(totals, shard)
+
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._retired = {}
+
+            for _, shard in self._shards:
+                shard.clear()
+
+
+_format_stats = _FormatStats()
+
+
+def get_format_stats():
+    """Get the counters of the formatters created with ``collect_stats=True``
+
+    The result is a dictionary keyed by ``(blueprint, level name, logger
+    name)``; each value holds the number of formatted records (``count``), the
+    total length of the formatted output (``bytes``; it is counted in
+    characters, which only differs for non-ASCII output), and the total time
+    spent formatting them (``format_ns``).
+    """
+
+    return dict((key, {'count': count, 'bytes': size, 'format_ns': elapsed})
+                for key, (count, size, elapsed) in _format_stats.snapshot().items())
+
+
+def reset_format_stats():
+    """Reset the counters returned by :func:`get_format_stats`
+    """
+
+    _format_stats.reset()
+
+
+def _prometheus_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_stats_prometheus():
+    """Get the counters returned by :func:`get_format_stats` in the Prometheus text format
+    """
+
+    metrics = (
+        ('records_total', 'Number of formatted log records', lambda values: values[0]),
+        ('bytes_total', 'Length of the formatted log records', lambda values: values[1]),
+        ('format_seconds_total', 'Time spent formatting log records', lambda values: values[2] / 1e9),
+    )
+    stats = sorted(_format_stats.snapshot().items(), key=lambda item: tuple(str(part) for part in item[0]))
+    lines = []
+
+    for name, description, getter in metrics:
+        name = 'flask_logging_extras_' + name
+        lines.append('# HELP {name} {description}'.format(name=name, description=description))
+        lines.append('# TYPE {name} counter'.format(name=name))
+
+        for (blueprint, level, logger), values in stats:
+            lines.append('{name}{{blueprint="{blueprint}",level="{level}",logger="{logger}"}} {value}'.format(
+                name=name,
+                blueprint=_prometheus_label(blueprint),
+                level=_prometheus_label(level),
+                logger=_prometheus_label(logger),
+                value=getter(values)))
+
+    return '\n'.join(lines) + '\n'
+
+
+def _format_stats_view():
+    from flask import Response
+
+    return Response(format_stats_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+class _AppConfig(object):
+    """The processed ``FLASK_LOGGING_EXTRAS`` configuration of an app
+
+    Use :meth:`for_app` to get it; it is created only once per app, and stored
+    in ``app.extensions``.
+    """
+
+    def __init__(self, app):
+        _import_flask()
+
+        config = app.config.get('FLASK_LOGGING_EXTRAS', {})
+        self.enabled = config.get('ENABLED', True)
+        self.stats_route = config.get('STATS_ROUTE')
+        profiler_config = config.get('PROFILER', {})
+
+        if profiler_config.get('EVERY'):
+            self.profiler = _RequestProfiler(profiler_config['EVERY'],
+                                             profiler_config.get('LOGGER', 'flask_logging_extras.profiler'),
+                                             profiler_config.get('LEVEL', logging.INFO),
+                                             profiler_config.get('LIMIT', 15),
+                                             profiler_config.get('SORT', 'cumulative'))
+        else:
+            self.profiler = None
+
+        blueprint_config = config.get('BLUEPRINT', {})
+        self.bp_var = blueprint_config.get('FORMAT_NAME', 'blueprint')
+        self.bp_app = blueprint_config.get('APP_BLUEPRINT', '<app>')
+        self.bp_noreq = blueprint_config.get('NO_REQUEST_BLUEPRINT', '<not a request>')
+
+        request_config = config.get('REQUEST', {})
+        self.request_id_var = request_config.get('ID_NAME')
+        self.request_id_header = request_config.get('ID_HEADER', 'X-Request-ID')
+        self.request_noreq = request_config.get('NO_REQUEST_VALUE', '-')
+        self.request_fields = [(var_name, kind)
+                               for var_name, kind in ((request_config.get('DURATION_NAME'), 'duration'),
+                                                      (self.request_id_var, 'id'),
+                                                      (request_config.get('COUNT_NAME'), 'count'))
+                               if var_name]
+
+        self.resolvers = {}
+        self.cached_resolvers = set()
+        self.lazy_resolvers = set()
+        self.share_formatted = config.get('SHARE_FORMATTED', False)
+        cache_default = config.get('CACHE_RESOLVERS', False)
+        lazy_default = config.get('LAZY_RESOLVERS', False)
+
+        guard_defaults = dict((key, value) for key, value in config.get('RESOLVER_DEFAULTS', {}).items()
+                              if key in _GuardedResolver.OPTIONS)
+        metrics = config.get('RESOLVER_METRICS', False)
+        self.guarded_resolvers = {}
+        self.dependencies = {}
+        self.keyword_sources = {}
+
+        for var_name, resolver_fqn in config.get('RESOLVERS', {}).items():
+            cache = cache_default
+            lazy = lazy_default
+            guard_config = dict(guard_defaults)
+
+            explicit = isinstance(resolver_fqn, dict)
+
+            if explicit:
+                cache = resolver_fqn.get('CACHE', cache_default)
+                lazy = resolver_fqn.get('LAZY', lazy_default)
+                self.dependencies[var_name] = tuple(resolver_fqn.get('DEPENDS', ()))
+
+                for keyword in resolver_fqn.get('KEYWORDS', ()):
+                    self.keyword_sources[keyword] = var_name
+
+                guard_config.update((key, value) for key, value in resolver_fqn.items()
+                                    if key in _GuardedResolver.OPTIONS)
+                resolver_fqn = resolver_fqn.get('RESOLVER')
+
+            if resolver_fqn is None:
+                resolver = None
+            elif explicit:
+                try:
+                    resolver = _import_by_string(resolver_fqn)
+                except (ImportError, AttributeError, ValueError, TypeError) as exc:
+                    # A RESOLVER key must name a resolver, so this is most probably a typo
+                    raise ImportError('Cannot import resolver {var_name}: {exc}'.format(var_name=var_name,
+                                                                                       exc=exc))
+            else:
+                try:
+                    resolver = _import_by_string(resolver_fqn)
+                except (ImportError, AttributeError, ValueError, TypeError) as exc:
+                    # Not an importable name, so it’s a static value.  Static
+                    # values like 'test.staging' look like a name, but so do
+                    # typos, so warn about them
+                    resolver = resolver_fqn
+
+                    if isinstance(resolver_fqn, str) and _DOTTED_NAME_RE.match(resolver_fqn):
+                        warnings.warn('Resolver {var_name} ({fqn}) cannot be imported ({exc}), so it is used as '
+                                      'a static value'.format(var_name=var_name, fqn=resolver_fqn, exc=exc),
+                                      RuntimeWarning)
+
+            if callable(resolver) and (metrics or guard_config):
+                resolver = self.guarded_resolvers[var_name] = _GuardedResolver(
+                    resolver, **dict((key.lower(), value) for key, value in guard_config.items()))
+
+            self.resolvers[var_name] = resolver
+
+            if cache:
+                self.cached_resolvers.add(var_name)
+
+            if lazy and callable(resolver):
+                self.lazy_resolvers.add(var_name)
+
+        for keyword, source in self.keyword_sources.items():
+            if keyword in self.resolvers:
+                raise ValueError('Keyword {keyword} of resolver {source} is also a resolver'.format(
+                    keyword=keyword, source=source))
+
+            if source in self.lazy_resolvers:
+                self.lazy_resolvers.add(keyword)
+
+        self.requirements = dict((var_name, self.dependencies.get(var_name, ())) for var_name in self.resolvers)
+        self.requirements.update((keyword, (source,)) for keyword, source in self.keyword_sources.items())
+        self.resolver_order = _resolver_order(self.requirements)
+
+        if not self.enabled:
+            return
+
+        if self.profiler is not None:
+            request_started.connect(self.profiler.start, app)
+            request_tearing_down.connect(self.profiler.stop, app)
+
+        if self.cached_resolvers:
+            request_tearing_down.connect(_clear_resolver_cache, app)
+
+        request_started.connect(self._capture_request_state, app)
+        request_tearing_down.connect(self._release_request_state, app)
+
+    @classmethod
+    def for_app(cls, app):
+        """Get the processed configuration of ``app``, creating it if necessary
+        """
+
+        app_config = app.extensions.get(_EXTENSION_NAME)
+
+        if app_config is not None:
+            return app_config
+
+        with _init_lock:
+            app_config = app.extensions.get(_EXTENSION_NAME)
+
+            if app_config is None:
+                app_config = app.extensions[_EXTENSION_NAME] = cls(app)
+
+        return app_config
+
+    def _capture_request_state(self, sender, **kwargs):
+        state = self.request_state(sender)
+        state.token = _request_state.set(state)
+
+    def request_state(self, app):
+        """Get the captured values of the current request of ``app``, capturing them if needed
+
+        The values are captured when the request starts, and stored in the
+        request state context variable until teardown.  If that happened before
+        the configuration got processed, they are captured when the first record
+        of the request is formatted, and only kept in the WSGI environment.
+        """
+
+        state = request.environ.get(_REQUEST_STATE_KEY)
+
+        if state is not None:
+            return state
+
+        request_id = None
+
+        if self.request_id_var:
+            import uuid
+
+            request_id = request.headers.get(self.request_id_header) if self.request_id_header else None
+            request_id = request_id or uuid.uuid4().hex
+
+        state = request.environ[_REQUEST_STATE_KEY] = _RequestState(
+            app,
+            request.blueprint or self.bp_app,
+            request.environ.setdefault(_RESOLVER_CACHE_KEY, {}),
+            request_id)
+
+        return state
+
+    @staticmethod
+    def _release_request_state(sender, **kwargs):
+        state = _request_state.get()
+
+        if state is None or state.app is not sender:
+            return
+
+        try:
+            _request_state.reset(state.token)
+        except ValueError:
+            _request_state.set(None)
+
+    def current_blueprint(self):
+        """Get the blueprint name to log, the same way formatters do
+        """
+
+        state = _current_request_state()
+
+        if state is not None:
+            return state.blueprint
+
+        if has_request_context():
+            return request.blueprint or self.bp_app
+
+        return self.bp_noreq
+
+    def resolution_order(self, names):
+        """Get the resolvers needed to compute ``names``, in evaluation order
+        """
+
+        needed = set()
+        pending = [name for name in names if name in self.requirements]
+
+        while pending:
+            name = pending.pop()
+
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.requirements[name])
+
+        return [name for name in self.resolver_order if name in needed]
 
-def _import_by_string(fqn):
-    try:
-        mod_name, var_name = fqn.rsplit('.', 1)
-    except ValueError:
-        mod_name = fqn
-        var_name = None
+    def resolve(self, var_name):
+        """Get the value of the resolver ``var_name``, using the request cache if it’s enabled
+        """
 
-    mod = import_module(mod_name)
+        if var_name not in self.requirements:
+            return None
 
-    if var_name is None:
-        return mod
+        cache = None
 
-    try:
-        var = getattr(mod, var_name)
-    except AttributeError:
-        raise ImportError('{var_name} not found in {mod_name}'.format(var_name=var_name, mod_name=mod_name))
+        if self.cached_resolvers:
+            state = _current_request_state()
 
-    return var
+            if state is not None:
+                cache = state.cache
+            elif has_request_context():
+                cache = request.environ.setdefault(_RESOLVER_CACHE_KEY, {})
+
+        values = {}
+
+        for name in self.resolution_order((var_name,)):
+            values[name] = _resolve_node(name,
+                                         self.resolvers.get(name),
+                                         self.dependencies.get(name, ()),
+                                         self.keyword_sources.get(name),
+                                         values,
+                                         cache if name in self.cached_resolvers else None)
+
+        return values[var_name]
+
+
+class _FormatterPlan(object):
+    """The parts of an app configuration a formatter needs for each record
+
+    Only the blueprint variable and the resolvers referenced by ``fields`` (the
+    fields of the format string, or ``None`` if they are unknown) are kept.
+    """
+
+    __slots__ = ('bp_var', 'bp_app', 'bp_noreq', 'request_fields', 'request_noreq', 'resolvers', 'graph',
+                 'fingerprint', 'static_values', 'no_request_context', 'context_fields', 'record_fields',
+                 'no_request_fields')
+
+    def __init__(self, app_config, fields, formatter_fingerprint=None):
+        self.static_values = None
+
+        if app_config is None:
+            self.bp_var = self.bp_app = self.bp_noreq = self.request_noreq = None
+            self.request_fields = []
+            self.resolvers = []
+            self.graph = None
+            self.fingerprint = None
+            self.no_request_context = None
+            self.context_fields = self.record_fields = self.no_request_fields = []
+
+            return
+
+        def uses_field(name):
+            return fields is None or name in fields
+
+        self.bp_var = app_config.bp_var if app_config.bp_var and uses_field(app_config.bp_var) else None
+        self.bp_app = app_config.bp_app
+        self.bp_noreq = app_config.bp_noreq
+        self.request_fields = [(var_name, kind) for var_name, kind in app_config.request_fields if uses_field(var_name)]
+        self.request_noreq = app_config.request_noreq
+        self.resolvers = [(var_name,
+                           resolver,
+                           var_name in app_config.cached_resolvers,
+                           var_name in app_config.lazy_resolvers)
+                          for var_name, resolver in app_config.resolvers.items()
+                          if uses_field(var_name)]
+
+        # Resolvers with dependencies (or keywords filled by a mapping resolver)
+        # are evaluated in dependency order, with each dependency resolved only
+        # once per record, even if it is not rendered itself
+        order = app_config.resolution_order(name for name in app_config.requirements if uses_field(name))
+
+        if any(app_config.requirements[name] for name in order):
+            self.graph = [(var_name,
+                           app_config.resolvers.get(var_name),
+                           app_config.dependencies.get(var_name, ()),
+                           app_config.keyword_sources.get(var_name),
+                           var_name in app_config.cached_resolvers,
+                           var_name in app_config.lazy_resolvers,
+                           uses_field(var_name))
+                          for var_name in order]
+        else:
+            self.graph = None
+
+        # The keywords of the 'context' enrichment mode, as (name, kind,
+        # resolver, cached, lazy) tuples.  Context fields are computed once
+        # per request; outside of requests, only the static resolvers are
+        # shared.  Resolvers of the graph are always computed per record
+        self.context_fields = [(self.bp_var, 'blueprint', None, False, False)] if self.bp_var else []
+        self.record_fields = []
+        statics = {}
+
+        for var_name, kind in self.request_fields:
+            plan_fields = self.context_fields if kind == 'id' else self.record_fields
+            plan_fields.append((var_name, kind, None, False, False))
+
+        if self.graph is None:
+            for var_name, resolver, cached, lazy in self.resolvers:
+                if not callable(resolver):
+                    statics[var_name] = resolver
+
+                plan_fields = self.context_fields if cached or not callable(resolver) else self.record_fields
+                plan_fields.append((var_name, 'resolver', resolver, cached, lazy))
+
+        self.no_request_context = _RequestContext(statics)
+        self.no_request_fields = [field for field in self.context_fields + self.record_fields
+                                  if field[0] not in statics]
+
+        if not app_config.enabled:
+            # The placeholders of a disabled app get the values used outside of
+            # requests, or None for callable resolvers
+            self.static_values = [(self.bp_var, self.bp_noreq)] if self.bp_var else []
+            self.static_values.extend((var_name, self.request_noreq) for var_name, _ in self.request_fields)
+            self.static_values.extend((var_name, None if callable(resolver) or source else resolver)
+                                      for var_name, resolver, source in (
+                                          (var_name,
+                                           app_config.resolvers.get(var_name),
+                                           app_config.keyword_sources.get(var_name))
+                                          for var_name in app_config.resolver_order)
+                                      if uses_field(var_name))
+
+        if app_config.share_formatted and formatter_fingerprint is not None:
+            self.fingerprint = (formatter_fingerprint,
+                                app_config,
+                                self.bp_var,
+                                tuple(self.request_fields),
+                                tuple(sorted(var_name for var_name, _, _, _ in self.resolvers)))
+        else:
+            self.fingerprint = None
 
 
 class FlaskExtraLoggerFormatter(logging.Formatter):
@@ -104,6 +1353,10 @@ class FlaskExtraLoggerFormatter(logging.Formatter):
            'RESOLVERS': {
                'categoy': '<unset>',
                'client': 'log_helper.get_client',
+               'tenant': {
+                   'RESOLVER': 'log_helper.get_tenant',
+                   'CACHE': True,
+               },
            },
        }
 
@@ -139,61 +1392,769 @@ class FlaskExtraLoggerFormatter(logging.Formatter):
        # This will produce a log message like this:
        # [2018-05-02 12:44:48.944] [INFO] [<unset>] [<NOT REQUEST>] Message
        logger.info('Message')
+
+    The ``REQUEST`` section adds built-in per-request fields, each enabled by
+    setting its keyword name:
+
+    .. code-block:: python
+
+       'REQUEST': {
+           'DURATION_NAME': 'elapsed',     # milliseconds since the request started
+           'ID_NAME': 'request_id',        # taken from ID_HEADER, or generated
+           'ID_HEADER': 'X-Request-ID',
+           'COUNT_NAME': 'record_no',      # 1 for the first record of the request, and so on
+           'NO_REQUEST_VALUE': '-',
+       },
+
+    These values are captured once, when the request starts (or when its first
+    record is formatted, if the formatter wasn’t initialised before the
+    request), so they need :mod:`contextvars`.  Records logged
+    outside of a request get ``NO_REQUEST_VALUE``.
+
+    A resolver can be given either as a string (an importable name or a static
+    value) or as a dictionary with a ``RESOLVER`` and a ``CACHE`` key.  Cached
+    resolvers are called at most once per request; the value is dropped when the
+    request is torn down.  ``CACHE_RESOLVERS`` sets the default for resolvers
+    that don’t specify ``CACHE``.
+
+    Resolvers with ``'LAZY': True`` (or all of them, if ``LAZY_RESOLVERS`` is
+    set) are not called when the record is formatted, only when their value is
+    actually rendered.  The record gets a proxy object that is rendered the same
+    way by every handler; it works with ``%(name)s``, ``%(name)r``, ``{name}``
+    and ``$name``, but not with numeric conversions like ``%(name)d``.
+
+    Resolvers can share expensive lookups.  A resolver with a ``DEPENDS`` list
+    is called with the values of the listed resolvers as positional arguments,
+    and a resolver with a ``KEYWORDS`` list must return a mapping; each listed
+    keyword gets the value stored under its name in that mapping:
+
+    .. code-block:: python
+
+       'RESOLVERS': {
+           'user': {'RESOLVER': 'log_helper.get_user', 'CACHE': True},
+           'client': {'RESOLVER': 'log_helper.get_client', 'DEPENDS': ['user']},
+           'account': {'RESOLVER': 'log_helper.get_account', 'KEYWORDS': ['tenant', 'plan']},
+       },
+
+    Dependencies are resolved once per record (or once per request, if they
+    are cached), in an order computed when the configuration is processed.
+    Dependency cycles raise :class:`ValueError`.
+
+    Resolver names are imported when the configuration is processed.  A
+    string that can’t be imported is used as a static value, with a
+    :class:`RuntimeWarning` if it looks like a dotted name.  If the
+    ``RESOLVER`` key of a resolver dictionary can’t be imported,
+    :class:`ImportError` is raised instead.
+
+    If ``ENABLED`` is ``False``, formatters initialised with the app don’t look
+    at the request context: the blueprint name, the request fields and the
+    callable resolvers get their out-of-request value
+    (``NO_REQUEST_BLUEPRINT``, ``NO_REQUEST_VALUE`` and ``None``), and static
+    resolvers their value.  Formatters initialised only with disabled apps
+    still check which app is current, so records of other apps are formatted
+    with their own configuration; apart from that check, they cost about as
+    much as a :class:`logging.Formatter`.
+
+    Callable resolvers can be guarded against slow or failing backends with the
+    ``TIMEOUT``, ``FALLBACK``, ``MAX_FAILURES`` and ``COOLDOWN`` keys (defaults
+    for all resolvers can be set in ``RESOLVER_DEFAULTS``).  A resolver that
+    raises, or runs longer than ``TIMEOUT`` seconds, ``MAX_FAILURES`` times in
+    a row is replaced by ``FALLBACK`` for ``COOLDOWN`` seconds.  See
+    :func:`get_resolver_stats` for the collected metrics.
+
+    The ``PROFILER`` section profiles every ``EVERY``-th request with
+    :mod:`cProfile`, and logs the ``LIMIT`` (15) most expensive functions,
+    sorted by ``SORT`` (``'cumulative'`` or ``'tottime'``) to the ``LOGGER``
+    (``'flask_logging_extras.profiler'``) logger at ``LEVEL`` (``INFO``) when the
+    request is torn down, so the summary is tagged with the blueprint of the
+    profiled request.  Requests are not profiled while another profiler is
+    active.
+
+    If ``SHARE_FORMATTED`` is set, formatters with the same configuration
+    (format string, date format, style and resolvers) format each record only
+    once, and reuse each other’s output when the record is passed to several
+    handlers.  Don’t use it if filters modify records between handlers.  The
+    resolved values and the rendered traceback are shared between all
+    formatters anyway, as they are stored on the record.
+
+    The ``enrichment`` keyword argument selects how the keywords are attached
+    to the record:
+
+    ``'attributes'``
+        each keyword becomes an attribute of the record
+    ``'context'``
+        the values that are the same for the whole request (the blueprint
+        name, the request ID, and cached and static resolvers) are computed
+        once, and stored in a single object shared by all records of the
+        request; only the other values are stored with the record.  The
+        keywords are not record attributes; only the format string and
+        :meth:`enrich` can see them.  This is faster if most keywords are
+        shared, but slower if most of them are computed for each record
+
+    ``traceback_cache`` enables a cache of at most that many rendered
+    tracebacks, keyed on the exception types and the frames they were raised
+    through, so the same failure repeated by many requests is rendered only
+    once (the exception messages are still rendered for each record).  With
+    ``collapse_tracebacks`` set to a number of seconds, each traceback is logged
+    in full only once in that window, ending with a ``(traceback <hash>)``
+    line; repeats are logged as ``Traceback <hash> repeated (<count> times in
+    <window>s, blueprint <blueprint>)`` followed by the exception message.
+
+    With ``collect_stats=True``, the formatter counts the records it formats,
+    the length of its output and the time it takes, per blueprint, level and
+    logger; see :func:`get_format_stats`.
+
+    The ``time_mode`` keyword argument selects how ``%(asctime)s`` is rendered:
+
+    ``None``
+        the same way as :class:`logging.Formatter`
+    ``'cached'``
+        the same output as :class:`logging.Formatter`, but the time is only
+        converted and passed to :func:`time.strftime` once per second
+    ``'iso8601'``
+        UTC time in ISO-8601 format with milliseconds, like
+        ``2018-05-02T12:44:48.944Z``, also cached per second; ``datefmt`` is
+        ignored
+    ``'epoch_ns'``
+        nanoseconds since the epoch.  The stock records only have a float
+        creation time, so the last digits are not precise; records with a
+        ``created_ns`` attribute (set by a record factory, for example from
+        :func:`time.time_ns`) use that instead
+
+    The format string is parsed when the formatter is created, and only the
+    blueprint name and the resolvers it actually references are computed for
+    each record.
     """
 
+    TIME_MODES = (None, 'cached', 'iso8601', 'epoch_ns')
+    ENRICHMENT_MODES = ('attributes', 'context')
+
     def __init__(self, *args, **kwargs):
+        time_mode = kwargs.pop('time_mode', None)
+        enrichment = kwargs.pop('enrichment', 'attributes')
+        traceback_cache = kwargs.pop('traceback_cache', None)
+        collapse_tracebacks = kwargs.pop('collapse_tracebacks', None)
+        collect_stats = kwargs.pop('collect_stats', False)
+
+        if time_mode not in self.TIME_MODES:
+            raise ValueError('Unknown time mode {time_mode!r}'.format(time_mode=time_mode))
+
+        if enrichment not in self.ENRICHMENT_MODES:
+            raise ValueError('Unknown enrichment mode {enrichment!r}'.format(enrichment=enrichment))
+
         super(FlaskExtraLoggerFormatter, self).__init__(*args, **kwargs)
 
+        self.time_mode = time_mode
+        self.enrichment = enrichment
+        self.collect_stats = collect_stats
+
+        if traceback_cache or collapse_tracebacks:
+            self._tracebacks = _TracebackCache(traceback_cache or 128, collapse_tracebacks)
+        else:
+            self._tracebacks = None
+        # (whole second, date format, rendered time) of the last formatted record
+        self._time_cache = (None, None, None)
+
         self.resolvers = {}
+        self.cached_resolvers = set()
         self.bp_var = None
         self.bp_app = None
         self.bp_noreq = None
-        self.__inited = False
+
+        self._fields = self._get_fields()
+        self._plans = weakref.WeakKeyDictionary()
+        self._default_plan = _FormatterPlan(None, self._fields)
+        # The plan of a disabled app this formatter got initialised with, and
+        # a weak reference to the app
+        self._disabled_plan = None
+        self._disabled_app = None
+
+        _formatters.add(self)
 
     def init_app(self, app):
         """Initialise the formatter with app-specific values from ``app``’s configuration
+
+        This is called automatically for the first record formatted within the
+        context of ``app``, but it’s better to call it (or
+        :meth:`FlaskLoggingExtras.init_app`) from the app factory so the
+        configuration is processed before the first request.
+
+        The formatter can be initialised with any number of apps; records are
+        formatted using the configuration of the current app.  Records logged
+        outside of an app context use the configuration of the first app.
         """
 
-        if self.__inited:
-            return
+        return self._get_plan(app)
 
-        config = app.config.get(
-            'FLASK_LOGGING_EXTRAS', {})
+    def _get_fields(self):
+        """Get the set of record attributes this formatter renders
 
-        blueprint_config = config.get('BLUEPRINT', {})
-        self.bp_var = blueprint_config.get('FORMAT_NAME', 'blueprint')
-        self.bp_app = blueprint_config.get('APP_BLUEPRINT', '<app>')
-        self.bp_noreq = blueprint_config.get('NO_REQUEST_BLUEPRINT', '<not a request>')
+        ``None`` means every configured keyword must be computed.
+        """
 
-        for var_name, resolver_fqn in config.get('RESOLVERS', {}).items():
-            if resolver_fqn is None:
-                resolver = None
+        return _format_fields(self._fmt, getattr(self, '_style', None))
+
+    def formatTime(self, record, datefmt=None):
+        if self.time_mode is None:
+            return logging.Formatter.formatTime(self, record, datefmt)
+
+        if self.time_mode == 'epoch_ns':
+            created_ns = record.__dict__.get('created_ns')
+
+            if created_ns is not None:
+                return '%d' % created_ns
+
+            return '%d' % (record.created * 1e9)
+
+        seconds = int(record.created)
+        cached_seconds, cached_datefmt, prefix = self._time_cache
+
+        if seconds != cached_seconds or datefmt != cached_datefmt:
+            if self.time_mode == 'iso8601':
+                prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
             else:
-                try:
-                    resolver = _import_by_string(resolver_fqn)
-                except ImportError:
-                    resolver = resolver_fqn
+                prefix = time.strftime(datefmt or getattr(self, 'default_time_format', '%Y-%m-%d %H:%M:%S'),
+                                       self.converter(seconds))
 
-            self.resolvers[var_name] = resolver
+            self._time_cache = (seconds, datefmt, prefix)
 
-            self.__inited = True
+        if self.time_mode == 'iso8601':
+            return '%s.%03dZ' % (prefix, record.msecs)
 
-    def format(self, record):
-        blueprint = None
+        default_msec_format = getattr(self, 'default_msec_format', '%s,%03d')
+
+        if datefmt or not default_msec_format:
+            return prefix
+
+        return default_msec_format % (prefix, record.msecs)
+
+    def _get_fingerprint(self):
+        """Get a hashable value that is equal for formatters producing the same output
+
+        ``None`` means the output of this formatter must never be shared.
+        """
+
+        style = getattr(self, '_style', None)
+
+        return (type(self),
+                self._fmt,
+                self.datefmt,
+                type(style),
+                tuple(sorted((getattr(style, '_defaults', None) or {}).items())),
+                self.converter,
+                getattr(self, 'default_time_format', None),
+                getattr(self, 'default_msec_format', None),
+                self.time_mode,
+                self._tracebacks.collapse if self._tracebacks is not None else None)
+
+    def _get_plan(self, app):
+        plan = self._plans.get(app)
+
+        if plan is not None:
+            return plan
+
+        with _init_lock:
+            plan = self._plans.get(app)
+
+            if plan is not None:  # pragma: no cover
+                # Another thread created it meanwhile
+                return plan
+
+            app_config = _AppConfig.for_app(app)
+            plan = _FormatterPlan(app_config, self._fields, self._get_fingerprint())
+
+            if not self._plans:
+                self.bp_var = app_config.bp_var
+                self.bp_app = app_config.bp_app
+                self.bp_noreq = app_config.bp_noreq
+                self.resolvers = dict(app_config.resolvers)
+                self.cached_resolvers = set(app_config.cached_resolvers)
+                self._default_plan = plan
+
+            self._plans[app] = plan
+            # Formatters that only know a disabled app can skip the request
+            # state lookup for that app; with more apps, the current app decides
+            self._disabled_plan = plan if len(self._plans) == 1 and plan.static_values is not None else None
+            self._disabled_app = weakref.ref(app) if self._disabled_plan is not None else None
+
+            if self._disabled_plan is not None and not self.collect_stats and \
+               (self._tracebacks is None or self._tracebacks.collapse is None):
+                # Skip the layers of format() that only matter to enabled apps
+                self.format = self._format_disabled
+            else:
+                self.__dict__.pop('format', None)
+
+        return plan
+
+    def enrich(self, record):
+        """Add the blueprint name and the resolved keywords to ``record``
+
+        Attributes already present on the record are left untouched.
+        """
+
+        self._enrich(record)
+
+        extras = record.__dict__.get(_RECORD_EXTRAS_ATTR)
+
+        if extras is not None:
+            for var_name, value in extras.as_dict().items():
+                record.__dict__.setdefault(var_name, value)
+
+    @staticmethod
+    def _enrich_static(record, plan):
+        attributes = record.__dict__
+
+        for var_name, value in plan.static_values:
+            if var_name not in attributes:
+                attributes[var_name] = value
+
+        return plan
+
+    def _enrich(self, record):
+        disabled_plan = self._disabled_plan
+
+        # Other apps may still be enabled, so the shortcut only applies to the
+        # disabled app and to records logged outside of any app context
+        if disabled_plan is not None and \
+           (not has_app_context() or self._plans.get(current_app._get_current_object()) is disabled_plan):
+            return self._enrich_static(record, disabled_plan)
+
+        state = _current_request_state()
+
+        if state is None and has_request_context():
+            app = current_app._get_current_object()
+            app_config = _AppConfig.for_app(app)
+
+            if app_config.enabled:
+                state = app_config.request_state(app)
+
+        if state is not None:
+            plan = self._get_plan(state.app)
+            blueprint = state.blueprint
+            cache = state.cache
+        else:
+            plan = self._default_plan
+            blueprint = None
+            cache = None
+
+            if has_app_context():
+                plan = self._get_plan(current_app._get_current_object())
+
+            if plan.static_values is not None:
+                return self._enrich_static(record, plan)
+
+        if self.enrichment == 'context':
+            self._attach_context(record, plan, state, blueprint, cache)
+
+            return plan
 
-        if has_app_context():
-            self.init_app(current_app)
+        if plan.bp_var and plan.bp_var not in record.__dict__:
+            setattr(record, plan.bp_var, blueprint or plan.bp_noreq)
 
-            if self.bp_var and has_request_context():
-                blueprint = request.blueprint or self.bp_app
+        for var_name, kind in plan.request_fields:
+            if var_name in record.__dict__:
+                continue
+
+            if state is None:
+                value = plan.request_noreq
+            elif kind == 'duration':
+                value = (_perf_counter_ns() - state.start_ns) / 1e6
+            elif kind == 'id':
+                value = state.request_id
+            else:
+                value = next(state.log_count)
 
-        if self.bp_var and self.bp_var not in record.__dict__:
-            setattr(record, self.bp_var, blueprint or self.bp_noreq)
+            setattr(record, var_name, value)
 
-        for var_name, resolver in self.resolvers.items():
+        if plan.graph is not None:
+            self._enrich_graph(record.__dict__, record.__dict__, plan, cache)
+
+            return plan
+
+        for var_name, resolver, cached, lazy in plan.resolvers:
             if var_name in record.__dict__:
                 continue
 
-            setattr(record, var_name, resolver() if callable(resolver) else resolver)
+            if lazy:
+                value = _LazyValue(var_name, resolver, cache if cached else None)
+            else:
+                value = _resolve(var_name, resolver, cache if cached else None)
+
+            setattr(record, var_name, value)
+
+        return plan
+
+    @staticmethod
+    def _enrich_graph(attributes, target, plan, cache):
+        values = {}
+
+        for var_name, resolver, depends, source, cached, lazy, rendered in plan.graph:
+            if var_name in attributes or var_name in target:
+                values[var_name] = attributes[var_name] if var_name in attributes else target[var_name]
+
+                continue
+
+            node_cache = cache if cached else None
+
+            if lazy:
+                value = _LazyValue(var_name,
+                                   functools.partial(_resolve_node, var_name, resolver, depends, source, values, None),
+                                   node_cache)
+            else:
+                value = _resolve_node(var_name, resolver, depends, source, values, node_cache)
+
+            values[var_name] = value
+
+            if rendered:
+                target[var_name] = value
+
+    @staticmethod
+    def _field_value(plan, var_name, kind, resolver, cached, lazy, state, blueprint, cache):
+        if kind == 'resolver':
+            if lazy:
+                return _LazyValue(var_name, resolver, cache if cached else None)
+
+            return _resolve(var_name, resolver, cache if cached else None)
+
+        if kind == 'blueprint':
+            return blueprint or plan.bp_noreq
+
+        if state is None:
+            return plan.request_noreq
+
+        if kind == 'duration':
+            return (_perf_counter_ns() - state.start_ns) / 1e6
+
+        if kind == 'id':
+            return state.request_id
+
+        return next(state.log_count)
+
+    def _attach_context(self, record, plan, state, blueprint, cache):
+        attributes = record.__dict__
+
+        if state is not None:
+            context = state.context
+
+            if context is None:
+                context = state.context = _RequestContext()
+
+            if plan not in context._filled_plans:
+                for var_name, kind, resolver, cached, lazy in plan.context_fields:
+                    context.values[var_name] = self._field_value(plan, var_name, kind, resolver, cached, lazy, state,
+                                                                 blueprint, cache)
+
+                context._filled_plans.add(plan)
+
+            fields = plan.record_fields
+        else:
+            context = plan.no_request_context
+            fields = plan.no_request_fields
+
+        extras = attributes.get(_RECORD_EXTRAS_ATTR)
+        shared = extras.context if isinstance(extras, _RecordExtras) else extras
+
+        if shared is not None and shared is not context:
+            # A formatter with another plan enriched the record outside of a
+            # request, with its own shared values; add the ones it doesn’t have
+            if not isinstance(extras, _RecordExtras):
+                extras = attributes[_RECORD_EXTRAS_ATTR] = _RecordExtras(extras)
+
+            for var_name, value in context.values.items():
+                if var_name not in shared.values:
+                    extras.values.setdefault(var_name, value)
+        elif not fields and plan.graph is None:
+            if extras is None:
+                attributes[_RECORD_EXTRAS_ATTR] = context
+
+            return
+        elif extras is None:
+            extras = attributes[_RECORD_EXTRAS_ATTR] = _RecordExtras(context)
+
+        values = extras.values
+
+        for var_name, kind, resolver, cached, lazy in fields:
+            if var_name not in attributes and var_name not in values:
+                values[var_name] = self._field_value(plan, var_name, kind, resolver, cached, lazy, state, blueprint,
+                                                     cache)
+
+        if plan.graph is not None:
+            self._enrich_graph(attributes, values, plan, cache)
+
+    def formatMessage(self, record):
+        extras = record.__dict__.get(_RECORD_EXTRAS_ATTR)
+
+        if extras is None:
+            # What logging.Formatter.formatMessage() does, without the call
+            return self._style.format(record)
+
+        # Merging the dictionaries is cheaper than looking up each keyword
+        # through a custom mapping
+        values = extras.as_dict()
+        values.update(record.__dict__)
+        stand_in = _FormatValues()
+        stand_in.__dict__ = values
+
+        return self._style.format(stand_in)
+
+    def formatException(self, ei):
+        if self._tracebacks is not None:
+            text = self._tracebacks.render(ei)
+
+            if text is not None:
+                return text
+
+        return super(FlaskExtraLoggerFormatter, self).formatException(ei)
+
+    @staticmethod
+    def _record_blueprint(record, plan):
+        if plan.bp_var:
+            attributes = record.__dict__
+
+            if plan.bp_var in attributes:
+                return attributes[plan.bp_var]
+
+            # The record was just enriched in 'context' mode with this plan
+            return attributes[_RECORD_EXTRAS_ATTR][plan.bp_var]
+
+        state = _current_request_state()
+
+        if state is not None:
+            return state.blueprint
+
+        return plan.bp_noreq
+
+    # Renders the enriched record; subclasses override it to render something
+    # else than the format string
+    _render = logging.Formatter.format
+
+    def format(self, record):
+        if not self.collect_stats:
+            return self._format_enriched(record, self._enrich(record))
+
+        start = _perf_counter_ns()
+        plan = self._enrich(record)
+        output = self._format_enriched(record, plan)
+        elapsed = _perf_counter_ns() - start
+
+        _format_stats.add((self._record_blueprint(record, plan), record.levelname, record.name), len(output), elapsed)
+
+        return output
+
+    def _format_disabled(self, record):
+        # Replaces format() while the formatter only knows a disabled app
+        disabled_plan = self._disabled_plan
+        disabled_app = self._disabled_app
+
+        if disabled_plan is None or \
+           (has_app_context() and current_app._get_current_object() is not disabled_app()):
+            return FlaskExtraLoggerFormatter.format(self, record)
+
+        attributes = record.__dict__
+
+        for var_name, value in disabled_plan.static_values:
+            if var_name not in attributes:
+                attributes[var_name] = value
+
+        return self._render(record)
+
+    def _format_enriched(self, record, plan):
+        tracebacks = self._tracebacks
+
+        if tracebacks is not None and tracebacks.collapse is not None and record.exc_info:
+            collapsed = tracebacks.render(record.exc_info, self._record_blueprint(record, plan), collapse=True)
+
+            if collapsed is not None:
+                # Other handlers may render the full traceback, so the
+                # collapsed one is used only while this formatter renders
+                exc_text = record.exc_text
+                record.exc_text = collapsed
+
+                try:
+                    return self._format(record, plan)
+                finally:
+                    record.exc_text = exc_text
+
+        return self._format(record, plan)
+
+    def _format(self, record, plan):
+        if plan.fingerprint is None:
+            return self._render(record)
+
+        rendered = _formatted_records.get(record)
+
+        if rendered is None:
+            rendered = _formatted_records[record] = {}
+        else:
+            try:
+                return rendered[plan.fingerprint]
+            except KeyError:
+                pass
+
+        output = rendered[plan.fingerprint] = self._render(record)
+
+        return output
+
+
+class FlaskLoggingExtras(object):
+    """Flask extension that initialises every :class:`FlaskExtraLoggerFormatter`
+
+    Usage:
+
+    .. code-block:: python
+
+       logging_extras = FlaskLoggingExtras()
+
+       def create_app():
+           app = Flask(__name__)
+           app.config['FLASK_LOGGING_EXTRAS'] = {...}
+           logging_extras.init_app(app)
+
+           return app
+
+    Formatters created after :meth:`init_app` is called (e.g. by a later
+    ``dictConfig()`` call) are initialised lazily, when they format their first
+    record within an app context.
+
+    If ``STATS_ROUTE`` is set in the configuration, :meth:`init_app` registers
+    a view at that URL serving :func:`format_stats_prometheus`.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Process the configuration of ``app`` and initialise the existing formatters with it
+        """
+
+        app_config = _AppConfig.for_app(app)
+
+        for formatter in list(_formatters):
+            formatter.init_app(app)
+
+        if app_config.stats_route:
+            app.add_url_rule(app_config.stats_route, 'flask_logging_extras_stats', _format_stats_view)
+
+
+class FlaskExtraJSONFormatter(FlaskExtraLoggerFormatter):
+    """A log formatter that emits each record as a single-line JSON object
+
+    The blueprint name and the resolvers are computed the same way as for
+    :class:`FlaskExtraLoggerFormatter`; only the keywords listed in ``fields``
+    are added to the output.
+
+    :param fmt: if ``fields`` is not set, the fields referenced by this format
+                string are used (in alphabetical order)
+    :param fields: the record attributes to emit, in this order.  ``message``
+                   is the rendered message and ``asctime`` is the formatted
+                   creation time.  Defaults to :attr:`DEFAULT_FIELDS`
+    :param static_fields: a dictionary of values added to every object (like
+                          the app name)
+    :param hostname: if set, the host name is added to every object under this
+                     key
+    :param time_mode: how ``asctime`` is rendered; see
+                      :class:`FlaskExtraLoggerFormatter`
+    :param enrichment: how the keywords are attached to the record; see
+                       :class:`FlaskExtraLoggerFormatter`
+    :param traceback_cache: the size of the traceback cache; see
+                            :class:`FlaskExtraLoggerFormatter`
+    :param collapse_tracebacks: the window for collapsing repeated tracebacks;
+                                see :class:`FlaskExtraLoggerFormatter`
+    :param collect_stats: whether to count the formatted records; see
+                          :func:`get_format_stats`
+
+    The static fields are serialised only once.  If :mod:`orjson` or
+    :mod:`ujson` is installed, it is used instead of :mod:`json`.
+
+    Usage with ``dictConfig()``:
+
+    .. code-block:: python
+
+       'formatters': {
+           'json': {
+               '()': 'flask_logging_extras.FlaskExtraJSONFormatter',
+               'fields': ['asctime', 'levelname', 'bp', 'client', 'message'],
+               'static_fields': {'app': 'my_app'},
+               'hostname': 'host',
+           },
+       },
+    """
+
+    DEFAULT_FIELDS = ('asctime', 'levelname', 'name', 'message')
+
+    def __init__(self, fmt=None, datefmt=None, style='%', fields=None, static_fields=None, hostname=None,
+                 time_mode=None, enrichment='attributes', traceback_cache=None, collapse_tracebacks=None,
+                 collect_stats=False):
+        if fields is None and fmt is None:
+            fields = self.DEFAULT_FIELDS
+
+        # If this is None, _get_fields() fills it from the format string
+        self.json_fields = None if fields is None else tuple(fields)
+
+        super(FlaskExtraJSONFormatter, self).__init__(fmt=fmt, datefmt=datefmt, style=style, time_mode=time_mode,
+                                                      enrichment=enrichment, traceback_cache=traceback_cache,
+                                                      collapse_tracebacks=collapse_tracebacks,
+                                                      collect_stats=collect_stats)
+
+        static_fields = dict(static_fields or {})
+
+        if hostname:
+            import socket
+
+            static_fields[hostname] = socket.gethostname()
+
+        duplicates = set(static_fields) & set(self.json_fields)
+
+        if duplicates:
+            raise ValueError('Static fields are also record fields: {}'.format(', '.join(sorted(duplicates))))
+
+        # The serialised static fields without the closing brace, so the
+        # dynamic part of each record can be appended to it
+        self._static_prefix = _json_dumps(static_fields)[:-1] if static_fields else None
+
+    def _get_fields(self):
+        if self.json_fields is None:
+            self.json_fields = tuple(sorted(super(FlaskExtraJSONFormatter, self)._get_fields() or ()))
+
+        return set(self.json_fields)
+
+    def _record_values(self, record):
+        values = {}
+        keywords = _RecordMapping(record.__dict__, record.__dict__.get(_RECORD_EXTRAS_ATTR))
+
+        for field in self.json_fields:
+            if field == 'message':
+                values[field] = record.getMessage()
+            elif field == 'asctime':
+                values[field] = self.formatTime(record, self.datefmt)
+            else:
+                try:
+                    values[field] = _unwrap(keywords[field])
+                except KeyError:
+                    values[field] = None
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            values['exc_info'] = record.exc_text
+
+        if getattr(record, 'stack_info', None):
+            values['stack_info'] = self.formatStack(record.stack_info)
+
+        return values
+
+    def _get_fingerprint(self):
+        return super(FlaskExtraJSONFormatter, self)._get_fingerprint() + (self.json_fields, self._static_prefix)
+
+    def _render(self, record):
+        dynamic = _json_dumps(self._record_values(record))
+
+        if self._static_prefix is None:
+            return dynamic
+
+        if dynamic == '{}':
+            return self._static_prefix + '}'
 
-        return super(FlaskExtraLoggerFormatter, self).format(record)
+        return self._static_prefix + ',' + dynamic[1:]
@@ -0,0 +1,364 @@
+# -*- coding: utf-8 -*-
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Log aggregation for pre-fork servers
+
+Worker processes send their records, already enriched with the blueprint name
+and the resolver values, to a single aggregator process over a Unix socket.
+The aggregator does the formatting and the I/O, so workers never share log
+files.
+
+In the aggregator process (e.g. started from gunicorn’s ``on_starting`` hook):
+
+.. code-block:: python
+
+   file_handler = logging.FileHandler('app.log')
+   file_handler.setFormatter(FlaskExtraLoggerFormatter(fmt='[%(bp)s] [%(client)s] %(message)s'))
+
+   aggregator = FlaskExtraAggregator('/run/my_app/log.sock', [file_handler])
+   aggregator.serve_forever()
+
+In the workers:
+
+.. code-block:: python
+
+   logging.getLogger('my_app').addHandler(FlaskExtraAggregatorHandler('/run/my_app/log.sock'))
+
+Records are sent in a compact binary format: a length-prefixed frame with the
+numeric fields packed by :mod:`struct`, followed by length-prefixed UTF-8
+strings.  Extra record attributes (like the blueprint name and resolver values)
+are sent as strings.
+"""
+
+import logging
+import os
+import queue as _queue_module
+import socket
+import struct
+import threading
+
+from . import _RECORD_EXTRAS_ATTR, _evaluate_lazy_values
+from .handlers import _ContextCaptureFormatter
+
+_FRAME_HEADER = struct.Struct('!I')
+# created, relativeCreated, thread, process, lineno, levelno, number of extra attributes
+_FIXED_FIELDS = struct.Struct('!ddQIIHH')
+_STRING_LENGTH = struct.Struct('!I')
+_NONE_LENGTH = 0xFFFFFFFF
+_STRING_FIELDS = ('name', 'msg', 'pathname', 'funcName', 'threadName', 'processName', 'exc_text', 'stack_info')
+_STANDARD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | frozenset(('message', 'asctime',
+                                                                                  _RECORD_EXTRAS_ATTR))
+_exception_formatter = logging.Formatter()
+
+
+def _pack_string(value):
+    if value is None:
+        return _STRING_LENGTH.pack(_NONE_LENGTH)
+
+    if not isinstance(value, bytes):
+        value = str(value).encode('utf-8', 'replace')
+
+    return _STRING_LENGTH.pack(len(value)) + value
+
+
+def encode_record(record):
+    """Encode ``record`` as a frame
+
+    The message is rendered, and the exception (if any) is formatted, as they
+    can’t be sent as objects.
+    """
+
+    attributes = record.__dict__
+
+    if record.exc_info and not record.exc_text:
+        record.exc_text = _exception_formatter.formatException(record.exc_info)
+
+    values = dict((name, attributes.get(name)) for name in _STRING_FIELDS)
+    values['msg'] = record.getMessage()
+    extras = [(name, value) for name, value in attributes.items() if name not in _STANDARD_ATTRIBUTES]
+
+    body = [_FIXED_FIELDS.pack(record.created,
+                               record.relativeCreated,
+                               (record.thread or 0) & 0xFFFFFFFFFFFFFFFF,
+                               (record.process or 0) & 0xFFFFFFFF,
+                               (record.lineno or 0) & 0xFFFFFFFF,
+                               record.levelno & 0xFFFF,
+                               len(extras))]
+    body.extend(_pack_string(values[name]) for name in _STRING_FIELDS)
+
+    for name, value in extras:
+        body.append(_pack_string(name))
+        body.append(_pack_string(value))
+
+    body = b''.join(body)
+
+    return _FRAME_HEADER.pack(len(body)) + body
+
+
+def decode_record(body):
+    """Create a :class:`logging.LogRecord` from the body of a frame (without the length header)
+    """
+
+    created, relative_created, thread, process, lineno, levelno, extra_count = _FIXED_FIELDS.unpack_from(body)
+    offset = _FIXED_FIELDS.size
+
+    def read_string():
+        length, = _STRING_LENGTH.unpack_from(body, offset)
+        start = offset + _STRING_LENGTH.size
+
+        if length == _NONE_LENGTH:
+            return None, start
+
+        return body[start:start + length].decode('utf-8'), start + length
+
+    attributes = {}
+
+    for name in _STRING_FIELDS:
+        attributes[name], offset = read_string()
+
+    for _ in range(extra_count):
+        name, offset = read_string()
+        attributes[name], offset = read_string()
+
+    try:
+        filename = os.path.basename(attributes['pathname'])
+        module = os.path.splitext(filename)[0]
+    except (TypeError, AttributeError):
+        filename = attributes['pathname']
+        module = 'Unknown module'
+
+    attributes.update({
+        'args': None,
+        'created': created,
+        'msecs': (created - int(created)) * 1000,
+        'relativeCreated': relative_created,
+        'thread': thread or None,
+        'filename': filename,
+        'module': module,
+        'process': process,
+        'lineno': lineno,
+        'levelno': levelno,
+        'levelname': logging.getLevelName(levelno),
+    })
+
+    return logging.makeLogRecord(attributes)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+
+    while size:
+        chunk = sock.recv(min(size, 65536))
+
+        if not chunk:
+            return None
+
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b''.join(chunks)
+
+
+class FlaskExtraAggregatorHandler(logging.Handler):
+    """A handler that sends records to a :class:`FlaskExtraAggregator` over a Unix socket
+
+    The blueprint name and the resolver values are added to the record before
+    it is sent, as the aggregator has no request context.
+
+    Sending blocks if the aggregator falls behind (once the socket buffers are
+    full).  With ``timeout`` set, records that can’t be sent within ``timeout``
+    seconds are dropped and counted in :attr:`dropped`.  If the aggregator is
+    not available, records are dropped, and connecting is retried with the next
+    record.
+    """
+
+    def __init__(self, address, timeout=None):
+        super(FlaskExtraAggregatorHandler, self).__init__()
+
+        self.address = address
+        self.timeout = timeout
+        self.dropped = 0
+        self._sock = None
+        self._pid = None
+        self._capture = _ContextCaptureFormatter()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+
+        try:
+            sock.connect(self.address)
+        except OSError:
+            sock.close()
+
+            raise
+
+        return sock
+
+    def emit(self, record):
+        try:
+            self._capture.enrich(record)
+            _evaluate_lazy_values(record)
+            frame = encode_record(record)
+        except Exception:
+            self.handleError(record)
+
+            return
+
+        # A socket inherited from a parent process must not be shared
+        if self._sock is None or self._pid != os.getpid():
+            try:
+                self._sock = self._connect()
+                self._pid = os.getpid()
+            except OSError:
+                self._sock = None
+                self.dropped += 1
+
+                return
+
+        try:
+            self._sock.sendall(frame)
+        except OSError:
+            self.dropped += 1
+            self._close_socket()
+
+    def _close_socket(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+
+            self._sock = None
+
+    def close(self):
+        self.acquire()
+
+        try:
+            self._close_socket()
+        finally:
+            self.release()
+
+        super(FlaskExtraAggregatorHandler, self).close()
+
+
+class FlaskExtraAggregator(object):
+    """Receive records from :class:`FlaskExtraAggregatorHandler` instances, and pass them to ``handlers``
+
+    Every connection is read by its own thread; the records are passed to the
+    handlers by a single writer thread, through a queue of at most
+    ``max_pending`` records.  When the queue is full, the aggregator stops
+    reading, which makes the senders block.
+    """
+
+    def __init__(self, address, handlers, max_pending=10000):
+        self.address = address
+        self.handlers = list(handlers)
+        self._queue = _queue_module.Queue(max_pending)
+        self._stop = threading.Event()
+        self._threads = []
+
+        if os.path.exists(address):
+            os.unlink(address)
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(address)
+        self._server.listen(128)
+        self._server.settimeout(0.1)
+
+    def _accept_connections(self):
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            conn.settimeout(None)
+            thread = threading.Thread(target=self._read_connection, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _read_connection(self, conn):
+        with conn:
+            while True:
+                header = _recv_exactly(conn, _FRAME_HEADER.size)
+
+                if header is None:
+                    return
+
+                length, = _FRAME_HEADER.unpack(header)
+                body = _recv_exactly(conn, length)
+
+                if body is None:
+                    return
+
+                self._queue.put(decode_record(body))
+
+    def _write_records(self):
+        while True:
+            record = self._queue.get()
+
+            if record is None:
+                break
+
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+        for handler in self.handlers:
+            handler.flush()
+
+    def start(self):
+        """Start serving in background threads
+        """
+
+        for target in (self._accept_connections, self._write_records):
+            thread = threading.Thread(target=target, name='FlaskExtraAggregator')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def serve_forever(self):
+        """Serve until :meth:`stop` is called (e.g. from a signal handler)
+        """
+
+        self.start()
+        self._stop.wait()
+        self.stop()
+
+    def stop(self):
+        """Stop accepting connections, and write the records received so far
+        """
+
+        self._stop.set()
+        self._server.close()
+
+        if self._threads:
+            self._threads[0].join()
+            self._queue.put(None)
+            self._threads[1].join()
+            self._threads = []
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)
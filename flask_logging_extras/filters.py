@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Logging filters for Flask apps
+"""
+
+import logging
+import random
+import threading
+import time
+import weakref
+
+from . import _AppConfig, _current_app, _unwrap
+
+_monotonic = time.monotonic
+
+# The keyword values of records counted together once MAX_KEYS is reached
+_OTHER = '<other>'
+
+
+def _hashable(value):
+    """Get ``value`` in a form that can be part of a bucket key
+
+    Unhashable values (like the dictionaries some resolvers return) are
+    replaced by their :func:`repr`.
+    """
+
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+
+    return value
+
+
+def _level_number(level):
+    if level is None or isinstance(level, int):
+        return level
+
+    return logging.getLevelName(level)
+
+
+class _RateLimitConfig(object):
+    """The processed ``RATE_LIMIT`` configuration of an app
+    """
+
+    def __init__(self, app):
+        self.app_config = _AppConfig.for_app(app)
+        config = app.config.get('FLASK_LOGGING_EXTRAS', {}).get('RATE_LIMIT')
+
+        self.enabled = config is not None
+        config = config or {}
+
+        self.default_limit = (config.get('RATE'), config.get('BURST'), config.get('SAMPLE_RATE', 1.0))
+        self.limits = dict((blueprint, (limit.get('RATE', self.default_limit[0]),
+                                        limit.get('BURST', self.default_limit[1]),
+                                        limit.get('SAMPLE_RATE', self.default_limit[2])))
+                           for blueprint, limit in config.get('BLUEPRINTS', {}).items())
+        self.keywords = tuple(config.get('KEYWORDS', ()))
+        self.exempt_level = _level_number(config.get('EXEMPT_LEVEL', logging.ERROR))
+        self.summary_interval = config.get('SUMMARY_INTERVAL', 60)
+        self.max_keys = config.get('MAX_KEYS', 10000)
+        self.summary_logger = logging.getLogger(config.get('SUMMARY_LOGGER', 'flask_logging_extras'))
+
+
+class _TokenBucket(object):
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.tokens = self.burst
+        self.updated = _monotonic()
+
+    def take(self):
+        now = _monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+
+        return True
+
+
+class FlaskExtraRateLimitFilter(logging.Filter):
+    """A filter that samples and rate limits records per blueprint
+
+    Records are counted in token buckets keyed on the blueprint name (computed
+    the same way :class:`~flask_logging_extras.FlaskExtraLoggerFormatter` does
+    it), the log level, and the values of the resolvers listed in ``KEYWORDS``.
+    Records that don’t fit in their bucket are dropped before they reach the
+    formatter.  Records at or above ``EXEMPT_LEVEL`` are never dropped.
+
+    The limits are read from the ``RATE_LIMIT`` section of the app
+    configuration; without it, every record passes:
+
+    .. code-block:: python
+
+       app.config['FLASK_LOGGING_EXTRAS'] = {
+           'RATE_LIMIT': {
+               'RATE': 10,                 # records per second
+               'BURST': 50,
+               'SAMPLE_RATE': 1.0,         # ratio of records kept before rate limiting
+               'KEYWORDS': ['client'],
+               'EXEMPT_LEVEL': 'ERROR',
+               'SUMMARY_INTERVAL': 60,     # seconds
+               'MAX_KEYS': 10000,
+               'BLUEPRINTS': {
+                   'noisy_blueprint': {'RATE': 1, 'BURST': 5, 'SAMPLE_RATE': 0.1},
+               },
+           },
+       }
+
+    A resolver in ``KEYWORDS`` that raises is treated as if it returned
+    ``None``, and unhashable values are keyed on their :func:`repr`.  At most
+    ``MAX_KEYS`` token buckets are kept; the least recently used one is
+    discarded to make room for a new one.  Once :attr:`suppressed` has
+    ``MAX_KEYS`` entries, records of new keyword values are counted under
+    ``'<other>'``.
+
+    The number of dropped records is kept in :attr:`suppressed`, and every
+    ``SUMMARY_INTERVAL`` seconds a summary like “Dropped 42 records from
+    blueprint noisy_blueprint” is logged to the ``SUMMARY_LOGGER`` logger
+    (``flask_logging_extras`` by default).
+
+    Records logged outside of an app context use the configuration of the
+    first app the filter has seen.
+    """
+
+    def __init__(self, name=''):
+        super(FlaskExtraRateLimitFilter, self).__init__(name)
+
+        self.suppressed = {}
+        self._configs = weakref.WeakKeyDictionary()
+        self._default_config = None
+        self._buckets = {}
+        self._pending = {}
+        self._next_summary = None
+        self._lock = threading.Lock()
+
+    def _get_config(self, app):
+        config = self._configs.get(app)
+
+        if config is None:
+            with self._lock:
+                config = self._configs.get(app)
+
+                if config is None:
+                    config = self._configs[app] = _RateLimitConfig(app)
+
+                    if self._default_config is None:
+                        self._default_config = config
+
+        return config
+
+    def _key(self, config, record):
+        blueprint = config.app_config.current_blueprint()
+        key = (blueprint, record.levelno)
+
+        if config.keywords:
+            key += tuple(_hashable(_unwrap(record.__dict__[keyword]) if keyword in record.__dict__
+                                   else self._resolve(config, keyword))
+                         for keyword in config.keywords)
+
+        return key
+
+    @staticmethod
+    def _resolve(config, keyword):
+        # Filters run inside the logging call, so resolver errors must not
+        # escape to the caller
+        try:
+            return config.app_config.resolve(keyword)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _count(counts, key, max_keys):
+        if key not in counts and len(counts) >= max_keys:
+            key = key[:2] + (_OTHER,) * (len(key) - 2)
+
+        counts[key] = counts.get(key, 0) + 1
+
+    def filter(self, record):
+        if not super(FlaskExtraRateLimitFilter, self).filter(record):
+            return False
+
+        if getattr(record, 'rate_limit_summary', False):
+            return True
+
+        app = _current_app()
+        config = self._default_config if app is None else self._get_config(app)
+
+        if config is None or not config.enabled:
+            return True
+
+        if config.exempt_level is not None and record.levelno >= config.exempt_level:
+            return True
+
+        key = self._key(config, record)
+        rate, burst, sample_rate = config.limits.get(key[0], config.default_limit)
+
+        with self._lock:
+            if sample_rate < 1 and random.random() >= sample_rate:
+                allowed = False
+            elif rate is None:
+                allowed = True
+            else:
+                # Re-inserting the bucket keeps the dictionary in least recently used order
+                bucket = self._buckets.pop(key, None)
+
+                if bucket is None:
+                    bucket = _TokenBucket(rate, burst)
+
+                    while len(self._buckets) >= config.max_keys:
+                        del self._buckets[next(iter(self._buckets))]
+
+                self._buckets[key] = bucket
+                allowed = bucket.take()
+
+            if not allowed:
+                self._count(self.suppressed, key, config.max_keys)
+                self._count(self._pending, key, config.max_keys)
+
+            summary = self._take_summary(config)
+
+        if summary:
+            self._log_summary(config, summary)
+
+        return allowed
+
+    def _take_summary(self, config):
+        now = _monotonic()
+
+        if self._next_summary is None:
+            self._next_summary = now + config.summary_interval
+
+        if now < self._next_summary or not self._pending:
+            return None
+
+        self._next_summary = now + config.summary_interval
+        summary, self._pending = self._pending, {}
+
+        return summary
+
+    @staticmethod
+    def _log_summary(config, summary):
+        for key, count in sorted(summary.items(), key=lambda item: tuple(str(part) for part in item[0])):
+            blueprint, levelno = key[:2]
+            config.summary_logger.warning(
+                'Dropped %d %s records from blueprint %s%s',
+                count,
+                logging.getLevelName(levelno),
+                blueprint,
+                ' ({})'.format(', '.join('{}={}'.format(keyword, value)
+                                         for keyword, value in zip(config.keywords, key[2:])))
+                if config.keywords else '',
+                extra={'rate_limit_summary': True})
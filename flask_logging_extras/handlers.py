@@ -0,0 +1,928 @@
+# -*- coding: utf-8 -*-
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Logging handlers for use with :class:`~flask_logging_extras.FlaskExtraLoggerFormatter`
+"""
+
+import atexit
+import collections
+import copy
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue as _queue_module
+import re
+import threading
+import time
+import weakref
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover
+    lz4_frame = None
+
+from flask import current_app, has_request_context, request, request_finished, request_tearing_down
+
+from . import FlaskExtraLoggerFormatter, _evaluate_lazy_values
+
+
+class _ContextCaptureFormatter(FlaskExtraLoggerFormatter):
+    """Formatter that computes every configured keyword, regardless of its format string
+    """
+
+    def _get_fields(self):
+        return None
+
+
+# Stream handlers with these emit() methods only write the formatted record;
+# others (like RotatingFileHandler) do more, so they get the records one by one
+_PLAIN_EMITS = (logging.StreamHandler.emit, logging.FileHandler.emit)
+
+
+def _write_batch(target, records, check_level=True):
+    """Pass ``records`` to the ``target`` handler, in a single write if possible
+
+    Handlers with an ``emit_batch`` method get all the records at once; stream
+    and file handlers with an open stream get all formatted records in a single
+    write (records that can’t be formatted are reported, and left out).  Other
+    handlers, including subclasses that override ``emit()``, get the records
+    one by one.  If ``check_level`` is false, records below the level of
+    ``target`` are passed to it, too.
+    """
+
+    filtered = []
+
+    for record in records:
+        if check_level and record.levelno < target.level:
+            continue
+
+        rv = target.filter(record)
+
+        if rv:
+            # Since Python 3.12, filters may return a replacement record
+            filtered.append(rv if isinstance(rv, logging.LogRecord) else record)
+
+    records = filtered
+
+    if not records:
+        return
+
+    emit_batch = getattr(target, 'emit_batch', None)
+    target.acquire()
+
+    try:
+        if emit_batch is not None:
+            emit_batch(records)
+
+            return
+
+        if type(target).emit not in _PLAIN_EMITS or target.stream is None:
+            # The records are already filtered, so handle() would filter them again
+            for record in records:
+                target.emit(record)
+
+            return
+
+        terminator = getattr(target, 'terminator', '\n')
+        chunks = []
+
+        for record in records:
+            try:
+                chunks.append(target.format(record) + terminator)
+            except Exception:
+                target.handleError(record)
+
+        if not chunks:
+            return
+
+        try:
+            target.stream.write(''.join(chunks))
+            target.flush()
+        except Exception:
+            target.handleError(records[-1])
+    finally:
+        target.release()
+
+
+class _RequestBuffer(object):
+    __slots__ = ('records', 'triggered')
+
+    def __init__(self, capacity):
+        self.records = collections.deque(maxlen=capacity)
+        self.triggered = False
+
+
+class FlaskExtraFingersCrossedHandler(logging.Handler):
+    """A handler that keeps the records of a request, and writes them only if the request fails
+
+    Records logged in a request are tagged with the blueprint name and the
+    resolver values, then kept in memory (at most ``capacity`` records per
+    request; the oldest ones are dropped).  When the request is torn down, the
+    buffer is discarded, unless a record at or above ``trigger_level`` was
+    logged, the request raised an exception or (with ``flush_on_server_error``)
+    the response status was 5xx.  In that case, every buffered record is passed
+    to the ``target`` handler in one batch.
+
+    Records logged outside of requests are passed to ``target`` immediately.
+
+    :param target: the handler to pass the records to
+    :param trigger_level: the level that makes the request’s records written
+    :param capacity: the maximum number of records kept per request
+    :param flush_on_server_error: write the records if the response is a 5xx
+    :param app: the app to handle requests of.  If not set, the handler hooks
+                into the app of the first request it sees
+
+    Usage:
+
+    .. code-block:: python
+
+       target = logging.FileHandler('app.log')
+       target.setFormatter(FlaskExtraLoggerFormatter(fmt='[%(bp)s] %(message)s'))
+
+       handler = FlaskExtraFingersCrossedHandler(target, trigger_level=logging.ERROR, capacity=500)
+       handler.setLevel(logging.DEBUG)
+       logging.getLogger('my_app').addHandler(handler)
+    """
+
+    def __init__(self, target, trigger_level=logging.ERROR, capacity=1000, flush_on_server_error=True, app=None):
+        super(FlaskExtraFingersCrossedHandler, self).__init__()
+
+        self.target = target
+        self.trigger_level = trigger_level
+        self.capacity = capacity
+        self.flush_on_server_error = flush_on_server_error
+        self._environ_key = 'flask_logging_extras.fingers_crossed.{}'.format(id(self))
+        self._capture = _ContextCaptureFormatter()
+        self._apps = weakref.WeakSet()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Start buffering the records of the requests of ``app``
+        """
+
+        if app in self._apps:
+            return
+
+        request_finished.connect(self._request_finished, app)
+        request_tearing_down.connect(self._request_tearing_down, app)
+        self._apps.add(app)
+
+    def emit(self, record):
+        if not has_request_context():
+            self.target.handle(record)
+
+            return
+
+        environ = request.environ
+        buffer = environ.get(self._environ_key, False)
+
+        if buffer is None:
+            # The request has already been torn down
+            self.target.handle(record)
+
+            return
+
+        if buffer is False:
+            self.init_app(current_app._get_current_object())
+            buffer = environ[self._environ_key] = _RequestBuffer(self.capacity)
+
+        self._capture.enrich(record)
+        _evaluate_lazy_values(record)
+        buffer.records.append(record)
+
+        if record.levelno >= self.trigger_level:
+            buffer.triggered = True
+
+    def _request_finished(self, sender, response=None, **kwargs):
+        buffer = request.environ.get(self._environ_key)
+
+        if buffer and self.flush_on_server_error and response is not None and response.status_code >= 500:
+            buffer.triggered = True
+
+    def _request_tearing_down(self, sender, exc=None, **kwargs):
+        buffer = request.environ.get(self._environ_key)
+        request.environ[self._environ_key] = None
+
+        if not buffer:
+            return
+
+        if buffer.triggered or exc is not None:
+            _write_batch(self.target, buffer.records)
+
+    def flush(self):
+        self.target.flush()
+
+    def close(self):
+        for app in list(self._apps):
+            request_finished.disconnect(self._request_finished, app)
+            request_tearing_down.disconnect(self._request_tearing_down, app)
+
+        self._apps.clear()
+
+        super(FlaskExtraFingersCrossedHandler, self).close()
+
+
+class FlaskExtraQueueHandler(QueueHandler):
+    """A queue handler that captures the Flask context before handing records over
+
+    The blueprint name and the resolved keywords are added to the record in the
+    thread that logs it, so a :class:`FlaskExtraQueueListener` can format and
+    write it in a background thread, where there is no request context.
+
+    Lazy resolvers are evaluated before enqueueing, too.  Unlike
+    :class:`logging.handlers.QueueHandler`, the message is not rendered before
+    enqueueing; avoid passing arguments that are modified after the
+    logging call.
+
+    :param queue: the queue to put records in.  If ``None``, a new
+                  :class:`queue.Queue` is created with ``maxsize`` slots
+    :param maxsize: the size of the queue created if ``queue`` is ``None``
+    :param overflow: what to do if the queue is full.  ``'block'`` waits for a
+                     free slot (at most ``timeout`` seconds, if set),
+                     ``'drop-oldest'`` discards the oldest queued record, and
+                     ``'drop-newest'`` discards the record being logged
+    :param timeout: the maximum time to block in ``'block'`` mode
+
+    Usage:
+
+    .. code-block:: python
+
+       file_handler = logging.FileHandler('app.log')
+       file_handler.setFormatter(FlaskExtraLoggerFormatter(fmt='[%(bp)s] %(message)s'))
+
+       queue_handler = FlaskExtraQueueHandler(maxsize=10000, overflow='drop-oldest')
+       listener = FlaskExtraQueueListener(queue_handler.queue, file_handler, batch_size=100)
+       listener.start()
+
+       logging.getLogger('my_app').addHandler(queue_handler)
+    """
+
+    OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+    def __init__(self, queue=None, maxsize=10000, overflow='block', timeout=None):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy {overflow!r}'.format(overflow=overflow))
+
+        if queue is None:
+            queue = _queue_module.Queue(maxsize)
+
+        super(FlaskExtraQueueHandler, self).__init__(queue)
+
+        self.overflow = overflow
+        self.timeout = timeout
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self._capture = _ContextCaptureFormatter()
+        self._drop_lock = threading.Lock()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        self._capture.enrich(record)
+        _evaluate_lazy_values(record)
+
+        return record
+
+    def enqueue(self, record):
+        if self.overflow == 'block':
+            try:
+                self.queue.put(record, True, self.timeout)
+            except _queue_module.Full:
+                with self._drop_lock:
+                    self.dropped_newest += 1
+
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(record)
+
+                return
+            except _queue_module.Full:
+                pass
+
+            with self._drop_lock:
+                if self.overflow == 'drop-newest':
+                    self.dropped_newest += 1
+
+                    return
+
+                try:
+                    evicted = self.queue.get_nowait()
+                except _queue_module.Empty:
+                    continue
+
+                if hasattr(self.queue, 'task_done'):
+                    self.queue.task_done()
+
+                if evicted is QueueListener._sentinel:
+                    # Never drop the request of a listener to stop; drop the
+                    # new record instead.  Another thread may have taken the
+                    # freed slot, so wait for the listener to make room
+                    self.queue.put(evicted)
+                    self.dropped_newest += 1
+
+                    return
+
+                self.dropped_oldest += 1
+
+
+class FlaskExtraQueueListener(QueueListener):
+    """A queue listener that handles records in batches
+
+    Whenever the listener wakes up, it takes at most ``batch_size`` records
+    from the queue, and passes them to each handler at once: stream handlers
+    get them in a single write, and handlers with an ``emit_batch`` method (like
+    :class:`FlaskExtraBufferedFileHandler`) in a single call.
+    """
+
+    def __init__(self, queue, *handlers, **kwargs):
+        self.batch_size = kwargs.pop('batch_size', 100)
+
+        super(FlaskExtraQueueListener, self).__init__(queue, *handlers, **kwargs)
+
+    def _monitor(self):
+        q = self.queue
+        has_task_done = hasattr(q, 'task_done')
+
+        while True:
+            batch = [self.dequeue(True)]
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except _queue_module.Empty:
+                    break
+
+            records = [self.prepare(record) for record in batch if record is not self._sentinel]
+            stop = len(records) < len(batch)
+
+            for handler in self.handlers:
+                _write_batch(handler, records, self.respect_handler_level)
+
+            if has_task_done:
+                for _ in batch:
+                    q.task_done()
+
+            if stop:
+                break
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class FlaskExtraBufferedFileHandler(logging.Handler):
+    """A file handler that writes records in batches
+
+    Formatted records are collected in memory, and written to the file with a
+    single ``write`` call when ``buffer_size`` bytes are collected, or by a
+    background thread every ``flush_interval`` seconds.  The handler lock is
+    not held while formatting or writing, so logging threads only wait for each
+    other while appending to the buffer.  Batches are always written in the
+    order they were collected.
+
+    :param filename: the log file
+    :param mode: ``'a'`` to append to the file, ``'w'`` to truncate it
+    :param encoding: the encoding of the file
+    :param buffer_size: the number of bytes to collect before writing
+    :param flush_interval: write the buffer at least this often (in seconds).
+                           If ``None``, there is no background thread, and the
+                           buffer is written only when it’s full or when
+                           :meth:`flush` is called
+    :param fsync: ``None`` to never call :func:`os.fsync`, ``'always'`` to
+                  call it after every write, or ``'interval'`` to call it from
+                  the background thread, if anything was written since the
+                  last call
+
+    The buffer is written when the handler is flushed or closed, including at
+    interpreter exit.  With a ``mode`` of ``'a'``, several processes can write
+    the same file safely, as every batch is a single ``O_APPEND`` write.
+    """
+
+    FSYNC_POLICIES = (None, 'always', 'interval')
+    terminator = '\n'
+
+    def __init__(self, filename, mode='a', encoding='utf-8', buffer_size=64 * 1024, flush_interval=1.0, fsync=None):
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError('Unknown fsync policy {fsync!r}'.format(fsync=fsync))
+
+        super(FlaskExtraBufferedFileHandler, self).__init__()
+
+        self.baseFilename = os.path.abspath(filename)
+        self.encoding = encoding
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if mode.startswith('a') else os.O_TRUNC)
+        self._fd = os.open(self.baseFilename, flags, 0o644)
+        self._chunks = []
+        self._size = 0
+        # Full batches waiting to be written, oldest first
+        self._batches = collections.deque()
+        self._unsynced = False
+        self._init_locks()
+
+        self._stop = threading.Event()
+        self._flusher = None
+        self._start_flusher()
+
+        _buffered_file_handlers.add(self)
+
+    def _init_locks(self):
+        self._buffer_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+
+    def _start_flusher(self):
+        if self.flush_interval is None or self._fd is None:
+            return
+
+        self._flusher = threading.Thread(target=self._flush_periodically, name='FlaskExtraBufferedFileHandler')
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+            if self.fsync == 'interval' and self._unsynced:
+                with self._io_lock:
+                    self._unsynced = False
+
+                    if self._fd is not None:
+                        os.fsync(self._fd)
+
+    def handle(self, record):
+        # Unlike logging.Handler.handle(), this doesn’t hold the handler lock
+        # while formatting and writing
+        rv = self.filter(record)
+
+        if isinstance(rv, logging.LogRecord):  # pragma: no cover
+            # Since Python 3.12, filters may return a replacement record
+            record = rv
+
+        if rv:
+            self.emit(record)
+
+        return rv
+
+    def _encode(self, record):
+        return (self.format(record) + self.terminator).encode(self.encoding)
+
+    def emit(self, record):
+        try:
+            self._append([self._encode(record)])
+        except Exception:
+            self.handleError(record)
+
+    def emit_batch(self, records):
+        """Format and append several records at once
+        """
+
+        chunks = []
+
+        for record in records:
+            try:
+                chunks.append(self._encode(record))
+            except Exception:
+                self.handleError(record)
+
+        self._append(chunks)
+
+    def _append(self, chunks):
+        with self._buffer_lock:
+            self._chunks.extend(chunks)
+            self._size += sum(len(chunk) for chunk in chunks)
+
+            if self._size < self.buffer_size:
+                return
+
+            self._take_buffer()
+
+        self._write_batches()
+
+    def _take_buffer(self):
+        if self._chunks:
+            self._batches.append(self._chunks)
+            self._chunks = []
+            self._size = 0
+
+    def _write_batches(self):
+        with self._io_lock:
+            while True:
+                with self._buffer_lock:
+                    if not self._batches:
+                        return
+
+                    batch = self._batches.popleft()
+
+                if self._fd is None:
+                    continue
+
+                data = memoryview(b''.join(batch))
+
+                try:
+                    while data:
+                        data = data[os.write(self._fd, data):]
+
+                    if self.fsync == 'always':
+                        os.fsync(self._fd)
+                    else:
+                        self._unsynced = True
+                except OSError:
+                    self.handleError(logging.makeLogRecord({'msg': 'Could not write to %s',
+                                                            'args': (self.baseFilename,)}))
+
+    def flush(self):
+        with self._buffer_lock:
+            self._take_buffer()
+
+        self._write_batches()
+
+    def close(self):
+        self._stop.set()
+
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+
+        self.flush()
+
+        with self._io_lock:
+            if self._fd is not None:
+                if self.fsync is not None:
+                    os.fsync(self._fd)
+
+                os.close(self._fd)
+                self._fd = None
+
+        _buffered_file_handlers.discard(self)
+
+        super(FlaskExtraBufferedFileHandler, self).close()
+
+
+# The open buffered file handlers, flushed at interpreter exit
+_buffered_file_handlers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_buffered_file_handlers():
+    for handler in list(_buffered_file_handlers):
+        handler.flush()
+
+
+def _buffered_file_handlers_after_fork_in_child():
+    # Locks may have been held by other threads at fork time, and the flusher
+    # threads don’t exist in the child.  The buffered records are written by
+    # the parent.
+    for handler in list(_buffered_file_handlers):
+        handler._init_locks()
+        handler._chunks = []
+        handler._size = 0
+        handler._batches.clear()
+        handler._stop = threading.Event()
+        handler._start_flusher()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_buffered_file_handlers_after_fork_in_child)
+
+
+class _ZlibCompressor(object):
+    def __init__(self, level, wbits):
+        self._compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, wbits)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def sync(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _ZstdCompressor(object):
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def sync(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class _Lz4Compressor(object):
+    def __init__(self, level):
+        self._compressor = lz4_frame.LZ4FrameCompressor(compression_level=level or 0, auto_flush=True)
+        self._header = self._compressor.begin()
+
+    def compress(self, data):
+        header, self._header = self._header, b''
+
+        return header + self._compressor.compress(data)
+
+    def sync(self):
+        # Blocks are flushed on every compress() call
+        return b''
+
+    def finish(self):
+        return self._header + self._compressor.flush()
+
+
+# compression: (file extension, module needed, compressor factory, whether a
+# new stream can be appended to an existing file; zlib readers stop at the end
+# of the first one)
+_COMPRESSIONS = {
+    'gzip': ('.gz', None, lambda level: _ZlibCompressor(level, 16 + zlib.MAX_WBITS), True),
+    'zlib': ('.zz', None, lambda level: _ZlibCompressor(level, zlib.MAX_WBITS), False),
+    'zstd': ('.zst', 'zstandard', _ZstdCompressor, True),
+    'lz4': ('.lz4', 'lz4', _Lz4Compressor, True),
+}
+
+
+class FlaskExtraCompressedFileHandler(logging.Handler):
+    """A file handler that compresses its output, and rotates it by size or time
+
+    Formatted records are collected in memory, and every ``block_size`` bytes
+    are handed over to a background thread that compresses them and appends
+    them to the file.  Rotation happens in the same thread: the current segment
+    is finished, closed and renamed, and a new one is started, while logging
+    threads go on appending to the next block.
+
+    The file being written is ``filename`` with the extension of the
+    compression (for example, ``app.log.gz``).  Rotated segments are named
+    after the time they were started (``app.log.20170115-172958-000000.gz``).
+    New records are appended to an existing file, except with zlib
+    compression: a zlib file holds a single stream, so an existing one is
+    rotated first.
+
+    :param filename: the log file, without the compression extension
+    :param compression: ``'gzip'``, ``'zlib'``, ``'zstd'`` (needs the
+                        :mod:`zstandard` package) or ``'lz4'`` (needs the
+                        :mod:`lz4` package)
+    :param compression_level: the compression level.  If ``None``, the
+                              default level of the compression is used
+    :param encoding: the encoding of the log records
+    :param block_size: the number of bytes to collect before compressing them
+    :param max_bytes: rotate the file before its uncompressed size would exceed
+                      this many bytes.  If ``0``, the file is not rotated by
+                      size
+    :param rotate_interval: rotate the file every this many seconds.  If
+                            ``None``, the file is not rotated by time
+    :param backup_count: the number of rotated segments to keep.  If ``0``,
+                         every segment is kept
+    :param flush_interval: compress the collected records, and make the
+                           compressed stream readable up to the last record at
+                           least this often (in seconds)
+
+    Records are only written by the background thread; call :meth:`flush` to
+    wait until every record logged so far is in the file.  Use a separate
+    handler (and file) in every process.
+    """
+
+    terminator = '\n'
+
+    def __init__(self, filename, compression='gzip', compression_level=None, encoding='utf-8', block_size=256 * 1024,
+                 max_bytes=0, rotate_interval=None, backup_count=0, flush_interval=1.0):
+        if compression not in _COMPRESSIONS:
+            raise ValueError('Unknown compression {compression!r}'.format(compression=compression))
+
+        extension, module, self._compressor_factory, self._appendable = _COMPRESSIONS[compression]
+
+        if (compression == 'zstd' and zstandard is None) or (compression == 'lz4' and lz4_frame is None):
+            raise ValueError('{compression} compression needs the {module} package'.format(compression=compression,
+                                                                                         module=module))
+
+        super(FlaskExtraCompressedFileHandler, self).__init__()
+
+        filename = os.path.abspath(filename)
+        self.baseFilename = filename + extension
+        self.compression = compression
+        self.compression_level = compression_level
+        self.encoding = encoding
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+
+        self._segment_pattern = re.compile(re.escape(os.path.basename(filename)) + r'\.\d{8}-\d{6}-\d{6}' +
+                                           re.escape(extension) + '$')
+        self._buffer_lock = threading.Lock()
+        self._chunks = []
+        self._size = 0
+        self._closed = False
+        self._rollover_at = None if rotate_interval is None else time.time() + rotate_interval
+
+        self._queue = _queue_module.Queue()
+        self._stream = None
+        self._compressor = None
+        self._segment_started = None
+        self._unsynced = False
+        self._open_segment()
+        # The uncompressed size of the current segment, including the buffer.
+        # The compressed size of an existing file is the best guess we have
+        self._segment_size = os.path.getsize(self.baseFilename)
+
+        self._worker = threading.Thread(target=self._work, name='FlaskExtraCompressedFileHandler')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def handle(self, record):
+        # Unlike logging.Handler.handle(), this doesn’t hold the handler lock
+        # while formatting
+        rv = self.filter(record)
+
+        if isinstance(rv, logging.LogRecord):  # pragma: no cover
+            # Since Python 3.12, filters may return a replacement record
+            record = rv
+
+        if rv:
+            self.emit(record)
+
+        return rv
+
+    def emit(self, record):
+        try:
+            data = (self.format(record) + self.terminator).encode(self.encoding)
+        except Exception:
+            self.handleError(record)
+
+            return
+
+        with self._buffer_lock:
+            if self._closed:
+                return
+
+            rotate = self.max_bytes and self._segment_size + len(data) > self.max_bytes
+
+            if self._rollover_at is not None and record.created >= self._rollover_at:
+                rotate = True
+                self._rollover_at = record.created + self.rotate_interval
+
+            if rotate and self._segment_size:
+                self._submit('rotate')
+                self._segment_size = 0
+
+            self._chunks.append(data)
+            self._size += len(data)
+            self._segment_size += len(data)
+
+            if self._size >= self.block_size:
+                self._submit()
+
+    def _submit(self, command=None):
+        # Must be called with the buffer lock held, so commands are queued in
+        # the order the records were collected
+        if self._chunks:
+            self._queue.put(('write', b''.join(self._chunks)))
+            self._chunks = []
+            self._size = 0
+
+        if command is not None:
+            self._queue.put((command, None))
+
+    def _work(self):
+        while True:
+            try:
+                command, data = self._queue.get(True, self.flush_interval)
+            except _queue_module.Empty:
+                with self._buffer_lock:
+                    if not self._closed:
+                        self._submit('sync')
+
+                continue
+
+            try:
+                if command == 'write':
+                    self._stream.write(self._compressor.compress(data))
+                    self._unsynced = True
+                elif command == 'sync':
+                    if self._unsynced:
+                        self._stream.write(self._compressor.sync())
+                        self._stream.flush()
+                        self._unsynced = False
+                elif command == 'rotate':
+                    self._rotate()
+                elif command == 'stop':
+                    self._close_segment()
+            except Exception:
+                # Whatever the compressor raises (like zstandard.ZstdError), the
+                # worker must go on, or flush() and close() would wait forever
+                self.handleError(logging.makeLogRecord({'msg': 'Could not write to %s', 'args': (self.baseFilename,)}))
+            finally:
+                self._queue.task_done()
+
+            if command == 'stop':
+                return
+
+    def _rotate(self):
+        try:
+            self._close_segment()
+            os.replace(self.baseFilename, self._segment_name())
+        finally:
+            # Even if the old segment couldn’t be finished or renamed, go on
+            # with a new one (appended to the old file, if it’s still there
+            # and the compression allows it)
+            self._open_segment()
+
+        self._remove_old_segments()
+
+    def _open_segment(self):
+        if not self._appendable and os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            # The file can’t hold another stream, so move it out of the way as
+            # a segment started when it was last written
+            self._segment_started = os.path.getmtime(self.baseFilename)
+            os.replace(self.baseFilename, self._segment_name())
+
+        self._stream = open(self.baseFilename, 'ab')
+        self._compressor = self._compressor_factory(self.compression_level)
+        self._segment_started = time.time()
+        self._unsynced = False
+
+    def _close_segment(self):
+        try:
+            self._stream.write(self._compressor.finish())
+        finally:
+            self._stream.close()
+
+    def _segment_name(self):
+        started = self._segment_started
+        stem, extension = os.path.splitext(self.baseFilename)
+
+        return '{stem}.{time}-{microseconds:06d}{extension}'.format(
+            stem=stem,
+            time=time.strftime('%Y%m%d-%H%M%S', time.localtime(started)),
+            microseconds=int(started % 1 * 1e6),
+            extension=extension)
+
+    def get_segments(self):
+        """Get the paths of the rotated segments, oldest first
+        """
+
+        directory = os.path.dirname(self.baseFilename)
+
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                if self._segment_pattern.match(name)]
+
+    def _remove_old_segments(self):
+        if not self.backup_count:
+            return
+
+        segments = self.get_segments()
+
+        for path in segments[:-self.backup_count]:
+            os.remove(path)
+
+    def flush(self):
+        """Write every record logged so far to the file, and wait until it’s done
+        """
+
+        with self._buffer_lock:
+            if self._closed:
+                return
+
+            self._submit('sync')
+
+        self._queue.join()
+
+    def close(self):
+        with self._buffer_lock:
+            if not self._closed:
+                self._submit('stop')
+                self._closed = True
+
+        if self._worker is not threading.current_thread():
+            self._worker.join()
+
+        super(FlaskExtraCompressedFileHandler, self).close()
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+A crash-surviving ring buffer of recent log records
+
+:class:`FlaskExtraRingBufferHandler` keeps the last records of each process in
+a memory-mapped file.  Writing a record is a plain memory copy, so the records
+are in the page cache even if the process is killed before its other handlers
+flush their buffers.
+
+After a crash, dump the rings of every worker, merged in time order:
+
+.. code-block:: sh
+
+   $ flask-logging-ringdump /var/run/my_app/rings
+
+The file starts with a header, followed by fixed-size slots; record number
+``n`` is written to slot ``n % slots``.  Each slot holds the sequence number,
+creation time and level of the record, a CRC of its payload (so records torn
+by a crash are skipped), and the payload: the logger name, the formatted
+record and the keyword fields, as length-prefixed UTF-8 strings.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import weakref
+import zlib
+
+from . import _RECORD_EXTRAS_ATTR
+
+MAGIC = b'FLXRING1'
+# magic, version, slot size, number of slots, process ID, creation time
+_FILE_HEADER = struct.Struct('<8sHIIId')
+# sequence number, creation time, level, flags, payload length, payload CRC
+_SLOT_HEADER = struct.Struct('<QdHHII')
+_STRING_LENGTH = struct.Struct('<H')
+_HEADER_SIZE = 64
+_STANDARD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | frozenset(('message', 'asctime',
+                                                                                  _RECORD_EXTRAS_ATTR))
+
+
+def _pack_strings(strings, limit):
+    parts = []
+    size = 0
+
+    for value in strings:
+        value = (value if isinstance(value, str) else str(value)).encode('utf-8', 'replace')[:0xFFFF]
+        chunk = _STRING_LENGTH.pack(len(value)) + value
+
+        if size + len(chunk) > limit:
+            # Truncate the last string that fits partially, and drop the rest
+            room = limit - size - _STRING_LENGTH.size
+
+            if room > 0:
+                parts.append(_STRING_LENGTH.pack(room) + value[:room])
+
+            break
+
+        parts.append(chunk)
+        size += len(chunk)
+
+    return b''.join(parts)
+
+
+def _unpack_strings(payload):
+    strings = []
+    offset = 0
+
+    while offset + _STRING_LENGTH.size <= len(payload):
+        length, = _STRING_LENGTH.unpack_from(payload, offset)
+        offset += _STRING_LENGTH.size
+        strings.append(payload[offset:offset + length].decode('utf-8', 'replace'))
+        offset += length
+
+    return strings
+
+
+def _record_fields(record):
+    """Get the keyword fields of a formatted record (blueprint name, resolvers, request fields)
+    """
+
+    fields = {}
+    extras = record.__dict__.get(_RECORD_EXTRAS_ATTR)
+
+    if extras is not None:
+        fields.update(extras.as_dict())
+
+    fields.update((name, value) for name, value in record.__dict__.items() if name not in _STANDARD_ATTRIBUTES)
+
+    return fields
+
+
+class FlaskExtraRingBufferHandler(logging.Handler):
+    """A handler that keeps the last ``slots`` formatted records of the process in a memory-mapped file
+
+    Each process writes its own file in ``directory``, named after its process
+    ID; if a file with the same name exists, it is kept with a ``.prev``
+    suffix.  Records longer than ``slot_size`` bytes (including a 28 byte
+    header) are truncated.
+
+    Use it with a :class:`~flask_logging_extras.FlaskExtraLoggerFormatter`, so
+    the blueprint name and the resolver values are stored with each record.
+    """
+
+    def __init__(self, directory, slots=4096, slot_size=1024):
+        super(FlaskExtraRingBufferHandler, self).__init__()
+
+        if slot_size <= _SLOT_HEADER.size:
+            raise ValueError('slot_size must be greater than {}'.format(_SLOT_HEADER.size))
+
+        self.directory = directory
+        self.slots = slots
+        self.slot_size = slot_size
+        self.path = None
+        self._map = None
+        self._seq = 0
+
+        _ring_buffer_handlers.add(self)
+
+    def _open(self):
+        pid = os.getpid()
+        path = os.path.join(self.directory, 'ring-{pid}.bin'.format(pid=pid))
+
+        if os.path.exists(path):
+            os.replace(path, path + '.prev')
+
+        size = _HEADER_SIZE + self.slots * self.slot_size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+
+        try:
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self._map[:_FILE_HEADER.size] = _FILE_HEADER.pack(MAGIC, 1, self.slot_size, self.slots, pid,
+                                                          time.time())
+        self.path = path
+        self._seq = 0
+
+    def emit(self, record):
+        try:
+            text = self.format(record)
+
+            if self._map is None:
+                self._open()
+
+            strings = [record.name, text]
+
+            for name, value in sorted(_record_fields(record).items()):
+                strings.extend((name, value))
+
+            payload = _pack_strings(strings, self.slot_size - _SLOT_HEADER.size)
+            self._seq += 1
+            offset = _HEADER_SIZE + (self._seq % self.slots) * self.slot_size
+            end = offset + _SLOT_HEADER.size + len(payload)
+
+            self._map[offset + _SLOT_HEADER.size:end] = payload
+            self._map[offset:offset + _SLOT_HEADER.size] = _SLOT_HEADER.pack(
+                self._seq, record.created, record.levelno & 0xFFFF, 0, len(payload), zlib.crc32(payload) & 0xFFFFFFFF)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """Write the ring to disk
+
+        This is only needed to survive a crash of the whole machine; the
+        records survive the crash of the process without it.
+        """
+
+        self.acquire()
+
+        try:
+            if self._map is not None:
+                self._map.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+
+        try:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+        finally:
+            self.release()
+
+        _ring_buffer_handlers.discard(self)
+
+        super(FlaskExtraRingBufferHandler, self).close()
+
+
+# The open ring buffer handlers, whose mappings are dropped in forked children
+_ring_buffer_handlers = weakref.WeakSet()
+
+
+def _ring_buffer_handlers_after_fork_in_child():
+    # The inherited mappings belong to the files of the parent process; the
+    # child opens its own file with its first record
+    for handler in list(_ring_buffer_handlers):
+        if handler._map is not None:
+            handler._map.close()
+            handler._map = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_ring_buffer_handlers_after_fork_in_child)
+
+
+def read_ring(path):
+    """Read the records of a ring file
+
+    Returns the process ID of the writer, and the list of valid records (as
+    dictionaries with ``pid``, ``seq``, ``created``, ``levelno``, ``name``,
+    ``message`` and ``fields`` keys), oldest first.
+    """
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    magic, _, slot_size, slots, pid, _ = _FILE_HEADER.unpack_from(data)
+
+    if magic != MAGIC:
+        raise ValueError('{path} is not a ring buffer file'.format(path=path))
+
+    records = []
+
+    for slot in range(slots):
+        offset = _HEADER_SIZE + slot * slot_size
+        seq, created, levelno, _, length, crc = _SLOT_HEADER.unpack_from(data, offset)
+
+        if not seq or length > slot_size - _SLOT_HEADER.size:
+            continue
+
+        start = offset + _SLOT_HEADER.size
+        payload = data[start:start + length]
+
+        if zlib.crc32(payload) & 0xFFFFFFFF != crc:
+            continue
+
+        strings = _unpack_strings(payload)
+
+        records.append({
+            'pid': pid,
+            'seq': seq,
+            'created': created,
+            'levelno': levelno,
+            'name': strings[0] if strings else '',
+            'message': strings[1] if len(strings) > 1 else '',
+            'fields': dict(zip(strings[2::2], strings[3::2])),
+        })
+
+    records.sort(key=lambda record: record['seq'])
+
+    return pid, records
+
+
+def _ring_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.startswith('ring-') and (name.endswith('.bin') or name.endswith('.bin.prev')):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def main(argv=None):
+    """Dump the records of ring buffer files, merged in time order
+    """
+
+    parser = argparse.ArgumentParser(description='Dump the records of Flask-Logging-Extras ring buffer files')
+    parser.add_argument('paths', nargs='+', metavar='PATH', help='ring files, or directories containing them')
+    parser.add_argument('--json', action='store_true', help='print each record as a JSON object')
+    parser.add_argument('--last', type=int, metavar='N', help='only print the last N records')
+    args = parser.parse_args(argv)
+
+    records = []
+
+    for path in _ring_files(args.paths):
+        try:
+            records.extend(read_ring(path)[1])
+        except (OSError, ValueError, struct.error) as exc:
+            sys.stderr.write('Skipping {path}: {exc}\n'.format(path=path, exc=exc))
+
+    records.sort(key=lambda record: (record['created'], record['pid'], record['seq']))
+
+    if args.last is not None:
+        records = records[-args.last:] if args.last else []
+
+    for record in records:
+        if args.json:
+            line = json.dumps(record, sort_keys=True)
+        else:
+            line = '{time} [{pid}] #{seq} {message}'.format(
+                time=datetime.datetime.fromtimestamp(record['created']).isoformat(),
+                **record)
+
+        sys.stdout.write(line + '\n')
+
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
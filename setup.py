@@ -19,7 +19,14 @@ setup(name='Flask-Logging-Extras',
       packages=['flask_logging_extras'],
       zip_safe=False,
       platforms='any',
-      install_requires=['Flask'],
+      python_requires='>=3.7',
+      # Flask only requires blinker, needed for its signals, since 2.3
+      install_requires=['Flask', 'blinker'],
+      entry_points={
+          'console_scripts': [
+              'flask-logging-ringdump = flask_logging_extras.ringbuffer:main',
+          ],
+      },
       classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Web Environment',
@@ -27,12 +34,15 @@ setup(name='Flask-Logging-Extras',
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
+        'Programming Language :: Python :: 3.13',
         'Topic :: Internet :: WWW/HTTP :: Dynamic Content',
         'Topic :: Software Development :: Libraries :: Python Modules'
       ])
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""Async views for the tests in test_async_views
+
+``async def`` is a syntax error before Python 3.5, so this module must only be
+imported on newer versions.
+"""
+
+import asyncio
+
+
+def add_async_route(blueprint, logger):
+    async def log_async():
+        logger.info('Message')
+
+    @blueprint.route('/async')
+    async def async_route():
+        await asyncio.get_running_loop().create_task(log_async())
+
+        return ''
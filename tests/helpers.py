@@ -3,3 +3,40 @@ EXTRA_VAR = 'extra variable'
 
 def get_extra_keyword():
     return 'extra callable'
+
+
+CALL_COUNT = {'counting': 0}
+
+
+def counting_resolver():
+    CALL_COUNT['counting'] += 1
+
+    return 'call {}'.format(CALL_COUNT['counting'])
+
+
+def failing_resolver():
+    CALL_COUNT['failing'] = CALL_COUNT.get('failing', 0) + 1
+
+    raise RuntimeError('backend unavailable')
+
+
+def slow_resolver():
+    import time
+
+    time.sleep(0.02)
+
+    return 'slow value'
+
+
+def get_user():
+    CALL_COUNT['user'] = CALL_COUNT.get('user', 0) + 1
+
+    return {'name': 'alice', 'tenant': 'acme', 'plan': 'gold'}
+
+
+def get_client(user):
+    return 'client of {}'.format(user['name'])
+
+
+def get_account(user):
+    return {'tenant': user['tenant'], 'plan': user['plan']}
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the Flask-Logging-Extras log aggregator
+"""
+
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock, skipUnless
+
+from flask import Flask, Blueprint
+
+from flask_logging_extras import FlaskExtraLoggerFormatter
+from flask_logging_extras.aggregator import FlaskExtraAggregator, FlaskExtraAggregatorHandler, decode_record, \
+    encode_record
+
+from test_logger_keywords import ListHandler
+
+WORKERS = 4
+REQUESTS = 25
+
+
+def run_worker(address, worker_id):
+    logger = logging.getLogger('test_aggregator_worker')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(FlaskExtraAggregatorHandler(address))
+
+    app = Flask('test_app')
+    app.config['FLASK_LOGGING_EXTRAS'] = {
+        'BLUEPRINT': {
+            'FORMAT_NAME': 'bp',
+        },
+        'RESOLVERS': {
+            'extra_keyword': 'helpers.get_extra_keyword',
+        },
+    }
+
+    bp = Blueprint('test_blueprint', 'test_bp')
+
+    @bp.route('/blueprint')
+    def route():
+        logger.info('Message from worker %d', worker_id)
+
+        return ''
+
+    app.register_blueprint(bp)
+
+    with app.test_client() as client:
+        for _ in range(REQUESTS):
+            client.get('/blueprint')
+
+    for handler in logger.handlers:
+        handler.close()
+
+
+class EncodingTestCase(TestCase):
+    def test_round_trip(self):
+        record = logging.LogRecord('selftest', logging.WARNING, __file__, 42, 'Message %s', ('ü',), None)
+        record.bp = 'test_blueprint'
+        record.missing = None
+
+        decoded = decode_record(encode_record(record)[4:])
+
+        self.assertEqual(decoded.getMessage(), 'Message ü')
+        self.assertEqual(decoded.levelname, 'WARNING')
+        self.assertEqual(decoded.lineno, 42)
+        self.assertEqual(decoded.created, record.created)
+        self.assertEqual(decoded.relativeCreated, record.relativeCreated)
+        self.assertEqual(decoded.thread, record.thread)
+        self.assertEqual(decoded.pathname, record.pathname)
+        self.assertEqual(decoded.filename, record.filename)
+        self.assertEqual(decoded.module, record.module)
+        self.assertEqual(decoded.bp, 'test_blueprint')
+        self.assertIsNone(decoded.missing)
+
+    def test_exception_formatted(self):
+        try:
+            raise ValueError('test')
+        except ValueError:
+            record = logging.LogRecord('selftest', logging.ERROR, __file__, 1, 'Failed', None, sys.exc_info())
+
+        decoded = decode_record(encode_record(record)[4:])
+
+        self.assertIn('ValueError: test', decoded.exc_text)
+
+    def test_no_pathname(self):
+        record = logging.LogRecord('selftest', logging.INFO, None, 1, 'Message', None, None)
+
+        decoded = decode_record(encode_record(record)[4:])
+
+        self.assertIsNone(decoded.filename)
+        self.assertEqual(decoded.module, 'Unknown module')
+
+
+@skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets are not available')
+class AggregatorTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmpdir, 'log.sock')
+
+        self.target = ListHandler()
+        self.target.setFormatter(FlaskExtraLoggerFormatter(fmt='%(message)s %(bp)s %(extra_keyword)s'))
+
+        self.aggregator = FlaskExtraAggregator(self.address, [self.target])
+        self.aggregator.start()
+
+    def tearDown(self):
+        self.aggregator.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def wait_for_logs(self, count):
+        # The connection threads aren't waited for by stop()
+        deadline = time.time() + 10
+
+        while len(self.target.logs) < count and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_multiple_workers(self):
+        workers = [multiprocessing.Process(target=run_worker, args=(self.address, worker_id))
+                   for worker_id in range(WORKERS)]
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join(30)
+            self.assertEqual(worker.exitcode, 0)
+
+        self.aggregator.stop()
+
+        self.assertEqual(len(self.target.logs), WORKERS * REQUESTS)
+
+        for worker_id in range(WORKERS):
+            expected = 'Message from worker {} test_blueprint extra callable'.format(worker_id)
+            self.assertEqual(self.target.logs.count(expected), REQUESTS)
+
+    def test_aggregator_unavailable(self):
+        handler = FlaskExtraAggregatorHandler(os.path.join(self.tmpdir, 'missing.sock'))
+        handler.handle(logging.LogRecord('selftest', logging.INFO, __file__, 1, 'Message', None, None))
+
+        self.assertEqual(handler.dropped, 1)
+
+    def test_in_process(self):
+        handler = FlaskExtraAggregatorHandler(self.address)
+        handler.handle(logging.makeLogRecord({'msg': 'Message %d', 'args': (1,), 'levelno': logging.INFO,
+                                              'bp': 'test_blueprint', 'extra_keyword': 'extra'}))
+        handler.close()
+        self.wait_for_logs(1)
+        self.aggregator.stop()
+
+        self.assertEqual(self.target.logs, ['Message 1 test_blueprint extra'])
+
+    def test_encoding_error(self):
+        errors = []
+        handler = FlaskExtraAggregatorHandler(self.address)
+        handler.handleError = errors.append
+        record = logging.LogRecord('selftest', logging.INFO, __file__, 1, 'Message %d', ('one',), None)
+
+        handler.handle(record)
+        handler.close()
+
+        self.assertEqual(errors, [record])
+
+    def test_send_error(self):
+        handler = FlaskExtraAggregatorHandler(self.address)
+        handler.handle(logging.makeLogRecord({'msg': 'First', 'levelno': logging.INFO, 'bp': 'test_blueprint',
+                                              'extra_keyword': 'extra'}))
+        handler._sock.close()
+        handler._sock = mock.Mock(**{'sendall.side_effect': OSError, 'close.side_effect': OSError})
+
+        handler.handle(logging.LogRecord('selftest', logging.INFO, __file__, 1, 'Second', None, None))
+
+        self.assertEqual(handler.dropped, 1)
+        self.assertIsNone(handler._sock)
+
+        handler.close()
+
+    def test_truncated_frame(self):
+        conn, sender = socket.socketpair()
+        sender.sendall(encode_record(logging.LogRecord('selftest', logging.INFO, __file__, 1, 'Message', None,
+                                                       None))[:10])
+        sender.close()
+
+        self.aggregator._read_connection(conn)
+
+        self.assertTrue(self.aggregator._queue.empty())
+
+    def test_stale_socket_file(self):
+        self.aggregator.stop()
+        open(self.address, 'w').close()
+
+        self.aggregator = FlaskExtraAggregator(self.address, [self.target])
+
+        self.assertTrue(os.path.exists(self.address))
+
+    def test_serve_forever(self):
+        self.aggregator.stop()
+        self.aggregator = FlaskExtraAggregator(self.address, [self.target])
+        thread = threading.Thread(target=self.aggregator.serve_forever)
+        thread.start()
+
+        handler = FlaskExtraAggregatorHandler(self.address)
+        handler.handle(logging.makeLogRecord({'msg': 'Message', 'levelno': logging.INFO, 'bp': 'test_blueprint',
+                                              'extra_keyword': 'extra'}))
+        handler.close()
+        self.wait_for_logs(1)
+
+        self.aggregator._stop.set()
+        thread.join(10)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.target.logs, ['Message test_blueprint extra'])
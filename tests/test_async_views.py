@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for context propagation into Flask async views
+"""
+
+from unittest import TestCase, skipIf
+
+try:
+    import asgiref
+except ImportError:
+    asgiref = None
+
+from flask import Flask, Blueprint
+
+from test_logger_keywords import configure_loggers
+
+
+@skipIf(asgiref is None, 'Flask async views require asgiref')
+class AsyncViewTestCase(TestCase):
+    def setUp(self):
+        from async_views import add_async_route
+
+        app = Flask('test_app')
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+                'NO_REQUEST_BLUEPRINT': '<norequest>',
+            },
+        }
+        self.logger, self.handler = configure_loggers('bp')
+
+        bp = Blueprint('test_blueprint', 'test_bp')
+        add_async_route(bp, self.logger)
+        app.register_blueprint(bp)
+        self.client = app.test_client()
+
+    def test_async_view(self):
+        self.client.get('/async')
+
+        self.assertEqual(['Message test_blueprint'], self.handler.logs)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the Flask-Logging-Extras filters
+"""
+
+import logging
+from unittest import TestCase
+
+from flask import Flask, Blueprint
+
+from flask_logging_extras.filters import FlaskExtraRateLimitFilter
+
+from test_logger_keywords import ListHandler
+
+
+class RateLimitFilterTestCase(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test_rate_limit')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+        self.handler = ListHandler()
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+        self.filter = FlaskExtraRateLimitFilter()
+        self.handler.addFilter(self.filter)
+        self.logger.addHandler(self.handler)
+
+        self.summary_handler = ListHandler()
+        self.summary_handler.setFormatter(logging.Formatter('%(message)s'))
+        summary_logger = logging.getLogger('flask_logging_extras')
+        summary_logger.propagate = False
+        summary_logger.addHandler(self.summary_handler)
+
+        self.app = Flask('test_app')
+        self.app.config['FLASK_LOGGING_EXTRAS'] = {
+            'RESOLVERS': {
+                'extra_keyword': 'helpers.get_extra_keyword',
+            },
+            'RATE_LIMIT': {
+                'RATE': 0.0001,
+                'BURST': 2,
+                'SUMMARY_INTERVAL': 3600,
+                'BLUEPRINTS': {
+                    'quiet': {'BURST': 1},
+                },
+            },
+        }
+
+        bp = Blueprint('quiet', 'test_bp')
+
+        @self.app.route('/app')
+        def app_route():
+            for i in range(5):
+                self.logger.info('app %d', i)
+
+            return ''
+
+        @bp.route('/quiet')
+        def bp_route():
+            for i in range(5):
+                self.logger.info('quiet %d', i)
+
+            return ''
+
+        self.app.register_blueprint(bp)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        logging.getLogger('flask_logging_extras').removeHandler(self.summary_handler)
+
+    def test_no_configuration(self):
+        del self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT']
+        self.client.get('/app')
+
+        self.assertEqual(5, len(self.handler.logs))
+
+    def test_outside_request(self):
+        self.logger.info('no app')
+
+        with self.app.app_context():
+            for _ in range(3):
+                self.logger.info('no request')
+
+        self.assertEqual(['no app', 'no request', 'no request'], self.handler.logs)
+        self.assertEqual({('<not a request>', logging.INFO): 1}, self.filter.suppressed)
+
+    def test_rate_limit_per_blueprint(self):
+        self.client.get('/app')
+        self.client.get('/quiet')
+
+        self.assertEqual(['app 0', 'app 1', 'quiet 0'], self.handler.logs)
+        self.assertEqual({('<app>', logging.INFO): 3, ('quiet', logging.INFO): 4}, self.filter.suppressed)
+
+    def test_rate_limit_per_level(self):
+        with self.app.test_request_context('/app'):
+            for _ in range(3):
+                self.logger.info('info')
+                self.logger.debug('debug')
+
+        self.assertEqual(['info', 'debug', 'info', 'debug'], self.handler.logs)
+
+    def test_exempt_level(self):
+        with self.app.test_request_context('/app'):
+            for _ in range(5):
+                self.logger.error('error')
+
+        self.assertEqual(5, len(self.handler.logs))
+
+    def test_exempt_level_name(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT']['EXEMPT_LEVEL'] = 'WARNING'
+
+        with self.app.test_request_context('/app'):
+            for _ in range(5):
+                self.logger.warning('warning')
+
+        self.assertEqual(5, len(self.handler.logs))
+
+    def test_logger_name(self):
+        self.handler.removeFilter(self.filter)
+        self.handler.addFilter(FlaskExtraRateLimitFilter('other'))
+        self.client.get('/app')
+
+        self.assertEqual([], self.handler.logs)
+
+    def test_summary_records_kept(self):
+        with self.app.test_request_context('/app'):
+            for _ in range(5):
+                self.logger.info('summary', extra={'rate_limit_summary': True})
+
+        self.assertEqual(5, len(self.handler.logs))
+
+    def test_no_rate(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT'] = {'SAMPLE_RATE': 1}
+        self.client.get('/app')
+
+        self.assertEqual(5, len(self.handler.logs))
+
+    def test_keywords(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT']['KEYWORDS'] = ['extra_keyword']
+
+        with self.app.test_request_context('/app'):
+            for value in ('a', 'a', 'a', 'b'):
+                self.logger.info(value, extra={'extra_keyword': value})
+
+            self.logger.info('resolved')
+
+        self.assertEqual(['a', 'a', 'b', 'resolved'], self.handler.logs)
+        self.assertIn(('<app>', logging.INFO, 'a'), self.filter.suppressed)
+
+    def test_failing_resolver(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['failing'] = 'helpers.failing_resolver'
+        self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT']['KEYWORDS'] = ['failing']
+
+        with self.app.test_request_context('/app'):
+            for _ in range(3):
+                self.logger.info('message')
+
+        self.assertEqual(['message', 'message'], self.handler.logs)
+        self.assertEqual({('<app>', logging.INFO, None): 1}, self.filter.suppressed)
+
+    def test_unhashable_keyword(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['user'] = 'helpers.get_user'
+        self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT']['KEYWORDS'] = ['user']
+
+        with self.app.test_request_context('/app'):
+            for _ in range(3):
+                self.logger.info('message')
+
+        self.assertEqual(['message', 'message'], self.handler.logs)
+        self.assertEqual({('<app>', logging.INFO, repr({'name': 'alice', 'tenant': 'acme', 'plan': 'gold'})): 1},
+                         self.filter.suppressed)
+
+    def test_max_keys(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT'].update({'KEYWORDS': ['extra_keyword'], 'MAX_KEYS': 2,
+                                                                     'BURST': 1})
+
+        with self.app.test_request_context('/app'):
+            for value in ('a', 'b', 'c', 'd'):
+                self.logger.info(value, extra={'extra_keyword': value})
+                self.logger.info(value, extra={'extra_keyword': value})
+
+        self.assertEqual(2, len(self.filter._buckets))
+        self.assertEqual({('<app>', logging.INFO, 'a'): 1, ('<app>', logging.INFO, 'b'): 1,
+                          ('<app>', logging.INFO, '<other>'): 2}, self.filter.suppressed)
+
+    def test_sampling(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT'] = {'SAMPLE_RATE': 0}
+        self.client.get('/app')
+
+        self.assertEqual([], self.handler.logs)
+
+    def test_summary(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RATE_LIMIT']['SUMMARY_INTERVAL'] = 0
+        self.client.get('/quiet')
+
+        self.assertIn('Dropped 1 INFO records from blueprint quiet', self.summary_handler.logs)
+        self.assertEqual(4, sum(int(log.split()[1]) for log in self.summary_handler.logs))
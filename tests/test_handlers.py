@@ -0,0 +1,846 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the Flask-Logging-Extras handlers
+"""
+
+import logging
+import os
+import queue
+import sys
+from unittest import TestCase, mock, skipIf
+
+from flask import Flask, Blueprint
+
+from flask_logging_extras import FlaskExtraLoggerFormatter
+from flask_logging_extras import handlers
+from flask_logging_extras.handlers import FlaskExtraBufferedFileHandler, FlaskExtraCompressedFileHandler, \
+    FlaskExtraFingersCrossedHandler, FlaskExtraQueueHandler, FlaskExtraQueueListener
+
+from test_logger_keywords import ListHandler
+
+
+def make_app(logger):
+    app = Flask('test_app')
+    app.config['FLASK_LOGGING_EXTRAS'] = {
+        'BLUEPRINT': {
+            'FORMAT_NAME': 'bp',
+            'APP_BLUEPRINT': '<app>',
+        },
+        'RESOLVERS': {
+            'extra_keyword': 'helpers.get_extra_keyword',
+        },
+    }
+
+    bp = Blueprint('test_blueprint', 'test_bp')
+
+    @bp.route('/blueprint')
+    def route():
+        logger.info('Message')
+
+        return ''
+
+    app.register_blueprint(bp)
+
+    return app
+
+
+def make_record(msg):
+    return logging.LogRecord('selftest', logging.INFO, __file__, 1, msg, None, None)
+
+
+class QueueHandlerTestCase(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test_queue_handler')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+        self.target = ListHandler()
+        self.target.setFormatter(FlaskExtraLoggerFormatter(fmt='%(message)s %(bp)s %(extra_keyword)s'))
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+
+    def test_context_captured_before_handoff(self):
+        handler = FlaskExtraQueueHandler()
+        listener = FlaskExtraQueueListener(handler.queue, self.target, batch_size=10)
+        self.logger.addHandler(handler)
+        app = make_app(self.logger)
+
+        listener.start()
+        app.test_client().get('/blueprint')
+        listener.stop()
+
+        self.assertEqual(['Message test_blueprint extra callable'], self.target.logs)
+
+    def test_lazy_values_evaluated_before_handoff(self):
+        import helpers
+
+        helpers.CALL_COUNT['counting'] = 0
+        handler = FlaskExtraQueueHandler()
+        listener = FlaskExtraQueueListener(handler.queue, self.target)
+        self.logger.addHandler(handler)
+        app = make_app(self.logger)
+        app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['extra_keyword'] = {
+            'RESOLVER': 'helpers.counting_resolver',
+            'LAZY': True,
+        }
+
+        app.test_client().get('/blueprint')
+
+        self.assertEqual(1, helpers.CALL_COUNT['counting'])
+
+        listener.start()
+        listener.stop()
+
+        self.assertEqual(['Message test_blueprint call 1'], self.target.logs)
+
+    def test_drop_newest(self):
+        handler = FlaskExtraQueueHandler(maxsize=1, overflow='drop-newest')
+
+        handler.handle(make_record('first'))
+        handler.handle(make_record('second'))
+
+        self.assertEqual(1, handler.dropped_newest)
+        self.assertEqual('first', handler.queue.get_nowait().msg)
+
+    def test_drop_oldest(self):
+        handler = FlaskExtraQueueHandler(maxsize=1, overflow='drop-oldest')
+
+        handler.handle(make_record('first'))
+        handler.handle(make_record('second'))
+
+        self.assertEqual(1, handler.dropped_oldest)
+        self.assertEqual('second', handler.queue.get_nowait().msg)
+
+        # Evicted records must not be waited for
+        handler.queue.task_done()
+        handler.queue.join()
+
+    def test_drop_oldest_keeps_sentinel(self):
+        handler = FlaskExtraQueueHandler(maxsize=1, overflow='drop-oldest')
+        listener = FlaskExtraQueueListener(handler.queue, self.target)
+
+        listener.enqueue_sentinel()
+        handler.handle(make_record('first'))
+
+        self.assertEqual(1, handler.dropped_newest)
+        self.assertIs(listener._sentinel, handler.queue.get_nowait())
+
+    def test_listener_single_write(self):
+        target = StreamListHandler()
+        target.setFormatter(logging.Formatter('%(message)s'))
+        handler = FlaskExtraQueueHandler()
+        listener = FlaskExtraQueueListener(handler.queue, target, batch_size=10)
+
+        for message in ('first', 'second', 'third'):
+            handler.handle(make_record(message))
+
+        listener.start()
+        listener.stop()
+
+        self.assertEqual(['first\nsecond\nthird\n'], target.writes)
+
+    @skipIf(sys.version_info < (3, 12), 'Filters can return a replacement record since Python 3.12')
+    def test_listener_filter_replaces_record(self):
+        target = StreamListHandler()
+        target.setFormatter(logging.Formatter('%(message)s'))
+        target.addFilter(replace_message)
+        handler = FlaskExtraQueueHandler()
+        listener = FlaskExtraQueueListener(handler.queue, target, batch_size=10)
+
+        handler.handle(make_record('first'))
+        listener.start()
+        listener.stop()
+
+        self.assertEqual(['replaced\n'], target.writes)
+
+    def test_drop_oldest_emptied_meanwhile(self):
+        class RacingQueue(queue.Queue):
+            def put_nowait(self, item):
+                if self.full():
+                    # The listener takes the queued record before it can be evicted
+                    self.get_nowait()
+
+                    raise queue.Full
+
+                super(RacingQueue, self).put_nowait(item)
+
+        handler = FlaskExtraQueueHandler(queue=RacingQueue(1), overflow='drop-oldest')
+
+        handler.handle(make_record('first'))
+        handler.handle(make_record('second'))
+
+        self.assertEqual(0, handler.dropped_oldest)
+        self.assertEqual('second', handler.queue.get_nowait().msg)
+
+    def test_listener_handler_level(self):
+        target = StreamListHandler()
+        target.setFormatter(logging.Formatter('%(message)s'))
+        target.setLevel(logging.WARNING)
+        handler = FlaskExtraQueueHandler()
+        listener = FlaskExtraQueueListener(handler.queue, target, respect_handler_level=True)
+
+        handler.handle(make_record('info'))
+        handler.handle(logging.LogRecord('selftest', logging.WARNING, __file__, 1, 'warning', None, None))
+        listener.start()
+        listener.stop()
+
+        self.assertEqual(['warning\n'], target.writes)
+
+    def test_listener_emit_batch(self):
+        target = BatchListHandler()
+        handler = FlaskExtraQueueHandler()
+        listener = FlaskExtraQueueListener(handler.queue, target, batch_size=10)
+
+        for message in ('first', 'second'):
+            handler.handle(make_record(message))
+
+        listener.start()
+        listener.stop()
+
+        self.assertEqual([['first', 'second']], target.batches)
+
+    def test_listener_unformattable_batch(self):
+        target = StreamListHandler()
+        target.setFormatter(logging.Formatter('%(missing)s'))
+        errors = []
+        target.handleError = errors.append
+        handler = FlaskExtraQueueHandler()
+        listener = FlaskExtraQueueListener(handler.queue, target, batch_size=10)
+
+        handler.handle(make_record('first'))
+        listener.start()
+        listener.stop()
+
+        self.assertEqual(['first'], [record.msg for record in errors])
+        self.assertEqual([], target.writes)
+
+    def test_listener_write_error(self):
+        target = StreamListHandler()
+        target.setFormatter(logging.Formatter('%(message)s'))
+        target.stream.write = mock.Mock(side_effect=OSError(28, 'No space left'))
+        errors = []
+        target.handleError = errors.append
+        handler = FlaskExtraQueueHandler()
+        listener = FlaskExtraQueueListener(handler.queue, target, batch_size=10)
+
+        for message in ('first', 'second'):
+            handler.handle(make_record(message))
+
+        listener.start()
+        listener.stop()
+
+        self.assertEqual(['second'], [record.msg for record in errors])
+
+    def test_block_timeout(self):
+        handler = FlaskExtraQueueHandler(maxsize=1, overflow='block', timeout=0.01)
+
+        handler.handle(make_record('first'))
+        handler.handle(make_record('second'))
+
+        self.assertEqual(1, handler.dropped_newest)
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            FlaskExtraQueueHandler(overflow='explode')
+
+
+class ListStream(object):
+    """A stream that records the individual writes"""
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def flush(self):
+        pass
+
+
+class StreamListHandler(logging.StreamHandler):
+    def __init__(self):
+        super(StreamListHandler, self).__init__(ListStream())
+
+        self.writes = self.stream.writes
+
+
+class BatchListHandler(logging.Handler):
+    def __init__(self):
+        super(BatchListHandler, self).__init__()
+
+        self.batches = []
+
+    def emit_batch(self, records):
+        self.batches.append([record.msg for record in records])
+
+
+class FingersCrossedHandlerTestCase(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger('test_fingers_crossed')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+        self.target = StreamListHandler()
+        self.target.setFormatter(FlaskExtraLoggerFormatter(fmt='%(levelname)s %(bp)s %(message)s'))
+        self.handler = FlaskExtraFingersCrossedHandler(self.target, capacity=3)
+        self.logger.addHandler(self.handler)
+
+        app = Flask('test_app')
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+                'NO_REQUEST_BLUEPRINT': '<norequest>',
+            },
+        }
+        bp = Blueprint('test_blueprint', 'test_bp')
+
+        @bp.route('/<int:status>')
+        def route(status):
+            self.logger.debug('debug')
+            self.logger.info('info')
+
+            if status == 0:
+                self.logger.error('error')
+                status = 200
+
+            if status == 1:
+                raise RuntimeError('failure')
+
+            return '', status
+
+        app.register_blueprint(bp)
+        self.app = app
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def test_discarded_on_success(self):
+        self.client.get('/200')
+
+        self.assertEqual([], self.target.writes)
+
+    def test_flushed_on_trigger_level(self):
+        self.client.get('/0')
+
+        self.assertEqual(['DEBUG test_blueprint debug\nINFO test_blueprint info\nERROR test_blueprint error\n'],
+                         self.target.writes)
+
+    def test_flushed_on_server_error(self):
+        self.client.get('/503')
+
+        self.assertEqual(['DEBUG test_blueprint debug\nINFO test_blueprint info\n'], self.target.writes)
+
+    def test_flushed_on_exception(self):
+        self.app.config['PROPAGATE_EXCEPTIONS'] = False
+        self.client.get('/1')
+
+        self.assertEqual(['DEBUG test_blueprint debug\nINFO test_blueprint info\n'], self.target.writes)
+
+    def test_capacity(self):
+        self.handler.capacity = 2
+        self.client.get('/0')
+
+        self.assertEqual(['INFO test_blueprint info\nERROR test_blueprint error\n'], self.target.writes)
+
+    def test_outside_request(self):
+        with self.app.app_context():
+            self.logger.info('message')
+
+        self.assertEqual(['INFO <norequest> message\n'], self.target.writes)
+
+    def test_app_given(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        self.handler = FlaskExtraFingersCrossedHandler(self.target, app=self.app)
+        self.logger.addHandler(self.handler)
+
+        with self.app.test_request_context('/0'):
+            pass
+
+        self.client.get('/0')
+
+        self.assertEqual(['DEBUG test_blueprint debug\nINFO test_blueprint info\nERROR test_blueprint error\n'],
+                         self.target.writes)
+
+    def test_after_teardown(self):
+        with self.app.test_request_context('/0'):
+            self.logger.info('buffered')
+            self.handler._request_tearing_down(self.app)
+            self.logger.info('late')
+
+        self.assertEqual(['INFO test_blueprint late\n'], self.target.writes)
+
+    def test_unformattable_record(self):
+        class FailingFormatter(FlaskExtraLoggerFormatter):
+            def format(self, record):
+                if record.msg == 'unformattable':
+                    raise ValueError(record.msg)
+
+                return super(FailingFormatter, self).format(record)
+
+        errors = []
+        self.target.handleError = errors.append
+        self.target.setFormatter(FailingFormatter(fmt='%(levelname)s %(bp)s %(message)s'))
+
+        with self.app.test_request_context('/0'):
+            self.logger.info('unformattable')
+            self.logger.error('error')
+
+        self.assertEqual(['unformattable'], [record.msg for record in errors])
+        self.assertEqual(['ERROR test_blueprint error\n'], self.target.writes)
+
+    def test_emit_overridden(self):
+        target = ListHandler()
+        target.setFormatter(FlaskExtraLoggerFormatter(fmt='%(levelname)s %(message)s'))
+        self.handler.target = target
+
+        self.client.get('/0')
+
+        self.assertEqual(['DEBUG debug', 'INFO info', 'ERROR error'], target.logs)
+        self.assertEqual([], self.target.writes)
+
+    def test_emit_overridden_filtered_once(self):
+        calls = []
+
+        def counting_filter(record):
+            calls.append(record.msg)
+
+            return True
+
+        target = ListHandler()
+        target.setFormatter(FlaskExtraLoggerFormatter(fmt='%(levelname)s %(message)s'))
+        target.addFilter(counting_filter)
+        self.handler.target = target
+
+        self.client.get('/0')
+
+        self.assertEqual(['debug', 'info', 'error'], calls)
+
+
+def replace_message(record):
+    record = logging.makeLogRecord(record.__dict__)
+    record.msg = 'replaced'
+
+    return record
+
+
+class BufferedFileHandlerTestCase(TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'app.log')
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.directory)
+
+    def read(self):
+        with open(self.filename) as f:
+            return f.read()
+
+    def make_handler(self, **kwargs):
+        handler = FlaskExtraBufferedFileHandler(self.filename, **kwargs)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.addCleanup(handler.close)
+
+        return handler
+
+    def test_buffered_until_full(self):
+        handler = self.make_handler(buffer_size=10, flush_interval=None)
+
+        handler.handle(make_record('first'))
+        self.assertEqual('', self.read())
+
+        handler.handle(make_record('second'))
+        self.assertEqual('first\nsecond\n', self.read())
+
+    def test_flush_and_close(self):
+        handler = self.make_handler(flush_interval=None)
+
+        handler.handle(make_record('first'))
+        handler.flush()
+        self.assertEqual('first\n', self.read())
+
+        handler.handle(make_record('second'))
+        handler.close()
+        self.assertEqual('first\nsecond\n', self.read())
+
+    def test_background_flush(self):
+        import time
+
+        handler = self.make_handler(flush_interval=0.01, fsync='interval')
+        handler.handle(make_record('first'))
+
+        for _ in range(100):
+            if self.read():
+                break
+
+            time.sleep(0.01)
+
+        self.assertEqual('first\n', self.read())
+
+    def test_emit_batch(self):
+        handler = self.make_handler(flush_interval=None, fsync='always')
+
+        handler.emit_batch([make_record('first'), make_record('second')])
+        handler.flush()
+
+        self.assertEqual('first\nsecond\n', self.read())
+
+    def test_threads(self):
+        import threading
+
+        handler = self.make_handler(buffer_size=100, flush_interval=0.001)
+
+        def log(thread_no):
+            for i in range(200):
+                handler.handle(make_record('{}-{}'.format(thread_no, i)))
+
+        threads = [threading.Thread(target=log, args=(thread_no,)) for thread_no in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        handler.close()
+        lines = self.read().splitlines()
+
+        self.assertEqual(800, len(lines))
+
+        for thread_no in range(4):
+            self.assertEqual(['{}-{}'.format(thread_no, i) for i in range(200)],
+                             [line for line in lines if line.startswith('{}-'.format(thread_no))])
+
+    def test_invalid_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            FlaskExtraBufferedFileHandler(self.filename, fsync='sometimes')
+
+    @skipIf(sys.version_info < (3, 12), 'Filters can return a replacement record since Python 3.12')
+    def test_filter_replaces_record(self):
+        handler = self.make_handler(flush_interval=None)
+        handler.addFilter(replace_message)
+
+        handler.handle(make_record('first'))
+        handler.flush()
+
+        self.assertEqual('replaced\n', self.read())
+
+    def test_unformattable_record(self):
+        handler = self.make_handler(flush_interval=None)
+        handler.setFormatter(logging.Formatter('%(missing)s'))
+        errors = []
+        handler.handleError = errors.append
+        first = make_record('first')
+        second = make_record('second')
+
+        handler.emit(first)
+        handler.emit_batch([second])
+        handler.flush()
+
+        self.assertEqual([first, second], errors)
+        self.assertEqual('', self.read())
+
+    def test_write_error(self):
+        handler = self.make_handler(flush_interval=None)
+        errors = []
+        handler.handleError = errors.append
+        fd = handler._fd
+        handler._fd = os.open(self.filename, os.O_RDONLY)
+
+        try:
+            handler.handle(make_record('first'))
+            handler.flush()
+        finally:
+            os.close(handler._fd)
+            handler._fd = fd
+
+        self.assertEqual(['Could not write to %s'], [record.msg for record in errors])
+
+    def test_after_close(self):
+        handler = self.make_handler(flush_interval=None)
+        handler.close()
+
+        handler.handle(make_record('first'))
+        handler.flush()
+
+        self.assertEqual('', self.read())
+
+    def test_flushed_at_exit(self):
+        handler = self.make_handler(flush_interval=None)
+        handler.handle(make_record('first'))
+
+        handlers._flush_buffered_file_handlers()
+
+        self.assertEqual('first\n', self.read())
+
+    def test_after_fork_in_child(self):
+        handler = self.make_handler(flush_interval=60)
+        handler.handle(make_record('parent'))
+        flusher, stop = handler._flusher, handler._stop
+
+        # What the child of a fork runs; it can't report its coverage
+        handlers._buffered_file_handlers_after_fork_in_child()
+        stop.set()
+        flusher.join()
+
+        self.assertTrue(handler._flusher.is_alive())
+
+        handler.flush()
+
+        self.assertEqual('', self.read())
+
+    def test_close_unregisters(self):
+        handler = self.make_handler(flush_interval=None)
+
+        self.assertIn(handler, handlers._buffered_file_handlers)
+
+        handler.close()
+
+        self.assertNotIn(handler, handlers._buffered_file_handlers)
+
+
+class CompressedFileHandlerTestCase(TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'app.log')
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.directory)
+
+    def make_handler(self, **kwargs):
+        handler = FlaskExtraCompressedFileHandler(self.filename, **kwargs)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.addCleanup(handler.close)
+
+        return handler
+
+    def read(self, path):
+        import gzip
+
+        with gzip.open(path, 'rt') as f:
+            return f.read()
+
+    def read_unfinished(self, path):
+        import zlib
+
+        with open(path, 'rb') as f:
+            return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(f.read()).decode('utf-8')
+
+    def test_flush_and_close(self):
+        handler = self.make_handler(flush_interval=None)
+
+        handler.handle(make_record('first'))
+        handler.flush()
+        self.assertEqual('first\n', self.read_unfinished(self.filename + '.gz'))
+
+        handler.handle(make_record('second'))
+        handler.close()
+        self.assertEqual('first\nsecond\n', self.read(self.filename + '.gz'))
+
+    def test_background_flush(self):
+        import time
+
+        handler = self.make_handler(flush_interval=0.01)
+        handler.handle(make_record('first'))
+
+        for _ in range(100):
+            if self.read_unfinished(handler.baseFilename):
+                break
+
+            time.sleep(0.01)
+
+        self.assertEqual('first\n', self.read_unfinished(handler.baseFilename))
+
+    def test_rotate_by_size(self):
+        handler = self.make_handler(block_size=10, max_bytes=20, flush_interval=None)
+
+        for i in range(10):
+            handler.handle(make_record('record {}'.format(i)))
+
+        handler.close()
+        segments = handler.get_segments()
+
+        self.assertEqual(['record {}\nrecord {}\n'.format(i, i + 1) for i in range(0, 10, 2)],
+                         [self.read(path) for path in segments + [handler.baseFilename]])
+
+    def test_rotate_by_time(self):
+        handler = self.make_handler(rotate_interval=60, flush_interval=None)
+
+        first = make_record('first')
+        second = make_record('second')
+        second.created = first.created + 61
+        handler.handle(first)
+        handler.handle(second)
+        handler.close()
+
+        segments = handler.get_segments()
+
+        self.assertEqual(1, len(segments))
+        self.assertEqual('first\n', self.read(segments[0]))
+        self.assertEqual('second\n', self.read(handler.baseFilename))
+
+    def test_backup_count(self):
+        handler = self.make_handler(max_bytes=1, backup_count=2, flush_interval=None)
+
+        for i in range(5):
+            handler.handle(make_record('record {}'.format(i)))
+
+        handler.close()
+
+        self.assertEqual(['record 2\n', 'record 3\n'], [self.read(path) for path in handler.get_segments()])
+        self.assertEqual('record 4\n', self.read(handler.baseFilename))
+
+    def test_zlib(self):
+        import zlib
+
+        handler = self.make_handler(compression='zlib', compression_level=9, flush_interval=None)
+        handler.handle(make_record('first'))
+        handler.close()
+
+        with open(self.filename + '.zz', 'rb') as f:
+            self.assertEqual(b'first\n', zlib.decompress(f.read()))
+
+    def test_zlib_existing_file(self):
+        import zlib
+
+        for i in range(2):
+            handler = self.make_handler(compression='zlib', flush_interval=None)
+            handler.handle(make_record('run {}'.format(i)))
+            handler.close()
+
+        segments = handler.get_segments()
+
+        self.assertEqual(1, len(segments))
+
+        with open(segments[0], 'rb') as f:
+            self.assertEqual(b'run 0\n', zlib.decompress(f.read()))
+
+        with open(self.filename + '.zz', 'rb') as f:
+            self.assertEqual(b'run 1\n', zlib.decompress(f.read()))
+
+    @skipIf(handlers.zstandard is None, 'zstandard is not installed')
+    def test_zstd(self):
+        handler = self.make_handler(compression='zstd', flush_interval=None)
+        handler.handle(make_record('first'))
+        handler.flush()
+        handler.handle(make_record('second'))
+        handler.close()
+
+        with open(self.filename + '.zst', 'rb') as f:
+            self.assertEqual(b'first\nsecond\n',
+                             handlers.zstandard.ZstdDecompressor().decompressobj().decompress(f.read()))
+
+    @skipIf(handlers.lz4_frame is None, 'lz4 is not installed')
+    def test_lz4(self):
+        handler = self.make_handler(compression='lz4', flush_interval=None)
+        handler.handle(make_record('first'))
+        handler.flush()
+        handler.handle(make_record('second'))
+        handler.close()
+
+        with open(self.filename + '.lz4', 'rb') as f:
+            self.assertEqual(b'first\nsecond\n', handlers.lz4_frame.decompress(f.read()))
+
+    def test_invalid_compression(self):
+        with self.assertRaises(ValueError):
+            FlaskExtraCompressedFileHandler(self.filename, compression='bzip2')
+
+    def test_compression_unavailable(self):
+        with mock.patch.object(handlers, 'zstandard', None):
+            with self.assertRaises(ValueError):
+                FlaskExtraCompressedFileHandler(self.filename, compression='zstd')
+
+    def test_unformattable_record(self):
+        handler = self.make_handler(flush_interval=None)
+        handler.setFormatter(logging.Formatter('%(missing)s'))
+        errors = []
+        handler.handleError = errors.append
+        record = make_record('first')
+
+        handler.handle(record)
+        handler.close()
+
+        self.assertEqual([record], errors)
+        self.assertEqual('', self.read(handler.baseFilename))
+
+    def test_after_close(self):
+        handler = self.make_handler(flush_interval=None)
+        handler.handle(make_record('first'))
+        handler.close()
+
+        handler.handle(make_record('second'))
+        handler.flush()
+
+        self.assertEqual('first\n', self.read(handler.baseFilename))
+
+    def test_logger(self):
+        handler = self.make_handler(flush_interval=None)
+        logger = logging.getLogger('test_compressed_file_handler')
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        handler.setLevel(logging.INFO)
+        logger.debug('hidden')
+        logger.info('first')
+        handler.close()
+
+        self.assertEqual('first\n', self.read(handler.baseFilename))
+
+    @skipIf(sys.version_info < (3, 12), 'Filters can return a replacement record since Python 3.12')
+    def test_filter_replaces_record(self):
+        handler = self.make_handler(flush_interval=None)
+        handler.addFilter(replace_message)
+
+        handler.handle(make_record('first'))
+        handler.close()
+
+        self.assertEqual('replaced\n', self.read(handler.baseFilename))
+
+    def test_failed_rotation(self):
+        handler = self.make_handler(max_bytes=1, flush_interval=None)
+        errors = []
+        handler.handleError = errors.append
+
+        with mock.patch('flask_logging_extras.handlers.os.replace', side_effect=OSError(28, 'No space left')):
+            handler.handle(make_record('first'))
+            handler.handle(make_record('second'))
+            handler.flush()
+
+        handler.handle(make_record('third'))
+        handler.close()
+
+        self.assertEqual(1, len(errors))
+        self.assertEqual('first\nsecond\nthird\n',
+                         ''.join(self.read(path) for path in handler.get_segments() + [handler.baseFilename]))
+
+    def test_compressor_error(self):
+        class CompressorError(Exception):
+            pass
+
+        def fail(data):
+            raise CompressorError()
+
+        handler = self.make_handler(flush_interval=None)
+        errors = []
+        handler.handleError = errors.append
+        handler._compressor.compress = fail
+
+        handler.handle(make_record('first'))
+        handler.flush()
+        handler.close()
+
+        self.assertEqual(1, len(errors))
+        self.assertFalse(handler._worker.is_alive())
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Tests for the import cost of Flask-Logging-Extras
+"""
+
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+IMPORT_SCRIPT = '''
+import sys
+import time
+
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start, 'flask' in sys.modules)
+'''
+
+
+def measure_import(module):
+    """Import ``module`` in a new interpreter, and get the time it took and whether Flask got imported
+    """
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (root, os.environ.get('PYTHONPATH')))))
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT.format(module=module)], env=env)
+    elapsed, flask_imported = output.decode('ascii').split()
+
+    return float(elapsed), flask_imported == 'True'
+
+
+class ImportTestCase(TestCase):
+    def test_flask_not_imported(self):
+        _, flask_imported = measure_import('flask_logging_extras')
+
+        self.assertFalse(flask_imported)
+
+    def test_import_cost(self):
+        elapsed, _ = measure_import('flask_logging_extras')
+        flask_elapsed, _ = measure_import('flask')
+
+        self.assertLess(elapsed, flask_elapsed)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for FlaskExtraJSONFormatter
+"""
+
+import json
+import logging
+import sys
+from unittest import TestCase, mock, skipIf
+
+from flask import Flask
+
+import flask_logging_extras
+from flask_logging_extras import FlaskExtraJSONFormatter
+
+
+def make_record(msg='Message', exc_info=None):
+    return logging.LogRecord('selftest', logging.INFO, __file__, 1, msg, None, exc_info)
+
+
+class JSONFormatterTestCase(TestCase):
+    def setUp(self):
+        self.app = Flask('test_app')
+        self.app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+            },
+            'RESOLVERS': {
+                'extra_keyword': 'helpers.get_extra_keyword',
+                'unused_keyword': 'helpers.counting_resolver',
+            },
+        }
+
+    def test_fields(self):
+        formatter = FlaskExtraJSONFormatter(fields=['levelname', 'bp', 'extra_keyword', 'message'])
+
+        with self.app.test_request_context('/'):
+            output = formatter.format(make_record())
+
+        self.assertEqual({
+            'levelname': 'INFO',
+            'bp': '<app>',
+            'extra_keyword': 'extra callable',
+            'message': 'Message',
+        }, json.loads(output))
+        self.assertNotIn('unused_keyword', output)
+
+    def test_fields_from_format(self):
+        formatter = FlaskExtraJSONFormatter(fmt='{levelname} {message}', style='{')
+
+        self.assertEqual(('levelname', 'message'), formatter.json_fields)
+
+    def test_static_fields(self):
+        formatter = FlaskExtraJSONFormatter(fields=['message'], static_fields={'app': 'my_app'}, hostname='host')
+
+        output = formatter.format(make_record())
+
+        self.assertTrue(output.startswith('{"app":"my_app","host":'))
+        self.assertEqual('Message', json.loads(output)['message'])
+
+    def test_static_field_duplicate(self):
+        with self.assertRaises(ValueError):
+            FlaskExtraJSONFormatter(fields=['message'], static_fields={'message': 'static'})
+
+    def test_exception(self):
+        formatter = FlaskExtraJSONFormatter(fields=['message'])
+
+        try:
+            raise RuntimeError('failure')
+        except RuntimeError:
+            output = formatter.format(make_record(exc_info=sys.exc_info()))
+
+        self.assertIn('RuntimeError: failure', json.loads(output)['exc_info'])
+
+    def test_stdlib_fallback(self):
+        formatter = FlaskExtraJSONFormatter(fields=['message', 'args'])
+
+        with mock.patch.object(flask_logging_extras, 'orjson', None), \
+                mock.patch.object(flask_logging_extras, 'ujson', None):
+            output = formatter.format(make_record())
+
+        self.assertEqual({'message': 'Message', 'args': None}, json.loads(output))
+
+    def test_stdlib_fallback_tuple_keys(self):
+        formatter = FlaskExtraJSONFormatter(fields=['message', 'args'])
+        record = make_record('message')
+        record.args = {'items': [{(1, 2): 'tuple key'}]}
+
+        with mock.patch.object(flask_logging_extras, 'orjson', None), \
+                mock.patch.object(flask_logging_extras, 'ujson', None):
+            output = formatter.format(record)
+
+        self.assertEqual({'message': 'message', 'args': {'items': [{'(1, 2)': 'tuple key'}]}}, json.loads(output))
+
+    @skipIf(flask_logging_extras.ujson is None, 'ujson is not installed')
+    def test_ujson(self):
+        formatter = FlaskExtraJSONFormatter(fields=['message', 'args'])
+        record = make_record('message')
+
+        with mock.patch.object(flask_logging_extras, 'orjson', None):
+            self.assertEqual({'message': 'message', 'args': None}, json.loads(formatter.format(record)))
+
+            record.args = {'data': b'bytes'}
+
+            self.assertEqual({'message': 'message', 'args': {'data': "b'bytes'"}}, json.loads(formatter.format(record)))
+
+    def test_default_fields(self):
+        formatter = FlaskExtraJSONFormatter()
+        record = make_record()
+
+        output = json.loads(formatter.format(record))
+
+        self.assertEqual(['asctime', 'levelname', 'name', 'message'], list(output))
+        self.assertEqual(logging.Formatter().formatTime(record), output['asctime'])
+
+    def test_missing_field(self):
+        formatter = FlaskExtraJSONFormatter(fields=['message', 'missing'])
+
+        self.assertEqual({'message': 'Message', 'missing': None}, json.loads(formatter.format(make_record())))
+
+    def test_stack_info(self):
+        formatter = FlaskExtraJSONFormatter(fields=['message'])
+        record = make_record()
+        record.stack_info = 'Stack (most recent call last):\n  somewhere'
+
+        self.assertEqual(record.stack_info, json.loads(formatter.format(record))['stack_info'])
+
+    def test_static_fields_only(self):
+        formatter = FlaskExtraJSONFormatter(fields=[], static_fields={'app': 'my_app'})
+
+        self.assertEqual('{"app":"my_app"}', formatter.format(make_record()))
+
+    @skipIf(flask_logging_extras.orjson is None, 'orjson is not installed')
+    def test_orjson_fallback(self):
+        formatter = FlaskExtraJSONFormatter(fields=['message', 'args'])
+        record = make_record('%(big)d')
+        record.args = {1: 'non-string key', 'big': 2 ** 70}
+
+        output = formatter.format(record)
+
+        self.assertEqual({'message': str(2 ** 70), 'args': {'1': 'non-string key', 'big': 2 ** 70}},
+                         json.loads(output))
+
+        record = make_record('message')
+        record.args = {(1, 2): {(3, 4): 'tuple key'}}
+
+        output = formatter.format(record)
+
+        self.assertEqual({'message': 'message', 'args': {'(1, 2)': {'(3, 4)': 'tuple key'}}}, json.loads(output))
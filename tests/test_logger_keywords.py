@@ -2,10 +2,12 @@
 """Unit tests for Flask-Logging-Extras
 """
 
+import json
 import logging
 from logging.config import dictConfig
 import sys
 from unittest import TestCase
+import warnings
 
 from flask import Flask, Blueprint, current_app
 
@@ -160,12 +162,75 @@ class LoggerKeywordsTestCase(TestCase):
             'extra_keyword': 'helpers.invalid_import',
         }
 
+        with self.assertWarns(RuntimeWarning) as cm:
+            flask_logging_extras.FlaskLoggingExtras(self.app)
+
+        self.assertIn('extra_keyword', str(cm.warning))
+        self.assertIn('helpers.invalid_import', str(cm.warning))
+
         with self.app.app_context():
             self.logger.info('message')
 
-        log = self.handler.logs[0]
         self.assertIn('message helpers.invalid_import', self.handler.logs)
 
+    def test_explicit_resolver_import_error(self):
+        """Test explicit resolver if its module exists but the resolver doesn’t
+        """
+
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS'] = {
+            'extra_keyword': {'RESOLVER': 'helpers.invalid_import'},
+        }
+
+        with self.assertRaises(ImportError) as cm:
+            flask_logging_extras.FlaskLoggingExtras(self.app)
+
+        self.assertIn('extra_keyword', str(cm.exception))
+        self.assertIn('invalid_import not found in helpers', str(cm.exception))
+
+    def test_resolver_module_not_found(self):
+        """Test resolver if its module cannot be imported
+        """
+
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS'] = {
+            'extra_keyword': 'no_such_module.resolver',
+        }
+
+        with self.assertWarns(RuntimeWarning) as cm:
+            flask_logging_extras.FlaskLoggingExtras(self.app)
+
+        self.assertIn('no_such_module.resolver', str(cm.warning))
+
+    def test_explicit_resolver_module_not_found(self):
+        """Test explicit resolver if its module cannot be imported
+        """
+
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS'] = {
+            'extra_keyword': {'RESOLVER': 'no_such_module.resolver'},
+        }
+
+        with self.assertRaises(ImportError) as cm:
+            flask_logging_extras.FlaskLoggingExtras(self.app)
+
+        self.assertIn('extra_keyword', str(cm.exception))
+        self.assertIn('no_such_module', str(cm.exception))
+
+    def test_static_resolver_no_warning(self):
+        """Test that static values that don’t look like a name don’t warn
+        """
+
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS'] = {
+            'extra_keyword': 'eu-west 1',
+        }
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            flask_logging_extras.FlaskLoggingExtras(self.app)
+
+        with self.app.app_context():
+            self.logger.info('message')
+
+        self.assertIn('message eu-west 1', self.handler.logs)
+
     def test_resolver_none(self):
         """Test resolver if its value is ``None``
         """
@@ -231,3 +296,1311 @@ class LoggerBlueprintTestCase(TestCase):
             self.logger.info('Message')
 
         self.assertIn('Message <norequest>', self.handler.logs)
+
+
+class ResolverCacheTestCase(TestCase):
+    def setUp(self):
+        import helpers
+
+        helpers.CALL_COUNT['counting'] = 0
+
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': None,
+            },
+            'RESOLVERS': {
+                'extra_keyword': {
+                    'RESOLVER': 'helpers.counting_resolver',
+                    'CACHE': True,
+                },
+            },
+        }
+
+        self.logger, self.handler = configure_loggers('extra_keyword')
+
+        @app.route('/')
+        def route():
+            self.logger.info('first')
+            self.logger.info('second')
+
+            return ''
+
+        self.client = app.test_client()
+
+    def test_cached_resolver_called_once_per_request(self):
+        self.client.get('/')
+        self.client.get('/')
+
+        self.assertEqual(['first call 1', 'second call 1', 'first call 2', 'second call 2'],
+                         self.handler.logs)
+
+    def test_uncached_resolver_called_every_time(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['extra_keyword']['CACHE'] = False
+        self.client.get('/')
+
+        self.assertEqual(['first call 1', 'second call 2'], self.handler.logs)
+
+    def test_cache_default(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['CACHE_RESOLVERS'] = True
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS'] = {
+            'extra_keyword': 'helpers.counting_resolver',
+        }
+        self.client.get('/')
+
+        self.assertEqual(['first call 1', 'second call 1'], self.handler.logs)
+
+
+class FormatterPlanTestCase(TestCase):
+    def test_format_fields_percent(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(bp)s')
+
+        self.assertEqual({'message', 'bp'}, formatter._fields)
+
+    def test_format_fields_str_format(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(
+            fmt='{message} {bp!r:>10} {client.name}', style='{')
+
+        self.assertEqual({'message', 'bp', 'client'}, formatter._fields)
+
+    def test_format_fields_template(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(
+            fmt='$message ${bp} $$literal', style='$')
+
+        self.assertEqual({'message', 'bp'}, formatter._fields)
+
+    def test_format_fields_invalid(self):
+        self.assertIsNone(flask_logging_extras._format_fields('{message', logging.StrFormatStyle('{message')))
+
+    def test_unreferenced_resolver_not_called(self):
+        import helpers
+
+        helpers.CALL_COUNT['counting'] = 0
+
+        app = Flask('test_app')
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'RESOLVERS': {
+                'extra_keyword': 'helpers.EXTRA_VAR',
+                'unused_keyword': 'helpers.counting_resolver',
+            },
+        }
+        logger, handler = configure_loggers('extra_keyword')
+
+        with app.test_request_context():
+            logger.info('message')
+
+        self.assertEqual(['message extra variable'], handler.logs)
+        self.assertEqual(0, helpers.CALL_COUNT['counting'])
+
+
+class InitAppTestCase(TestCase):
+    def setUp(self):
+        self.app = Flask('test_app')
+        self.app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+                'NO_REQUEST_BLUEPRINT': '<norequest>',
+            },
+        }
+        self.logger, self.handler = configure_loggers('bp')
+
+    def test_extension_init_app(self):
+        flask_logging_extras.FlaskLoggingExtras(self.app)
+
+        self.assertIn('flask_logging_extras', self.app.extensions)
+        self.assertEqual('bp', self.handler.formatter.bp_var)
+
+    def test_config_read_once(self):
+        """Without resolvers, the configuration must not be re-read for every record
+        """
+
+        with self.app.app_context():
+            self.logger.info('Message')
+            self.app.config['FLASK_LOGGING_EXTRAS']['BLUEPRINT']['NO_REQUEST_BLUEPRINT'] = '<changed>'
+            self.logger.info('Message')
+
+        self.assertEqual(['Message <norequest>', 'Message <norequest>'], self.handler.logs)
+
+
+class MultiAppTestCase(TestCase):
+    def setUp(self):
+        self.logger, self.handler = configure_loggers('bp')
+
+    def make_app(self, name):
+        app = Flask(name)
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+                'APP_BLUEPRINT': '<{}>'.format(name),
+            },
+        }
+
+        @app.route('/')
+        def route():
+            self.logger.info('Message')
+
+            return ''
+
+        return app
+
+    def test_per_app_configuration(self):
+        app1 = self.make_app('app1')
+        app2 = self.make_app('app2')
+
+        app1.test_client().get('/')
+        app2.test_client().get('/')
+        app1.test_client().get('/')
+
+        self.assertEqual(['Message <app1>', 'Message <app2>', 'Message <app1>'], self.handler.logs)
+
+    def test_app_not_kept_alive(self):
+        import gc
+
+        app = self.make_app('app1')
+        app.test_client().get('/')
+        self.assertEqual(1, len(self.handler.formatter._plans))
+
+        del app
+        gc.collect()
+
+        self.assertEqual(0, len(self.handler.formatter._plans))
+
+
+class ContextPropagationTestCase(TestCase):
+    def setUp(self):
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+                'NO_REQUEST_BLUEPRINT': '<norequest>',
+            },
+        }
+        self.logger, self.handler = configure_loggers('bp')
+
+        bp = Blueprint('test_blueprint', 'test_bp')
+
+        @bp.route('/executor')
+        def executor_route():
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(1) as executor:
+                flask_logging_extras.submit(executor, self.logger.info, 'Message').result()
+
+            return ''
+
+        @bp.route('/thread')
+        def thread_route():
+            import threading
+
+            self.thread = threading.Thread(
+                target=flask_logging_extras.copy_current_logging_context(self.logger.info),
+                args=('Message',))
+
+            return ''
+
+        app.register_blueprint(bp)
+        self.client = app.test_client()
+
+    def test_executor(self):
+        self.client.get('/executor')
+
+        self.assertEqual(['Message test_blueprint'], self.handler.logs)
+
+    def test_thread_after_request(self):
+        self.client.get('/thread')
+        self.thread.start()
+        self.thread.join()
+
+        self.assertEqual(['Message test_blueprint'], self.handler.logs)
+
+    def test_state_released(self):
+        self.client.get('/executor')
+
+        with self.app.app_context():
+            self.logger.info('Message')
+
+        self.assertEqual('Message <norequest>', self.handler.logs[-1])
+
+    def test_state_released_in_other_context(self):
+        import contextvars
+
+        app_config = flask_logging_extras._AppConfig.for_app(self.app)
+
+        with self.app.test_request_context('/'):
+            app_config._capture_request_state(self.app)
+            contextvars.copy_context().run(app_config._release_request_state, self.app)
+            app_config._release_request_state(self.app)
+
+        self.assertIsNone(flask_logging_extras._current_request_state())
+
+
+class LazyResolverTestCase(TestCase):
+    def setUp(self):
+        import helpers
+
+        helpers.CALL_COUNT['counting'] = 0
+
+        self.app = Flask('test_app')
+        self.app.config['FLASK_LOGGING_EXTRAS'] = {
+            'RESOLVERS': {
+                'extra_keyword': {
+                    'RESOLVER': 'helpers.counting_resolver',
+                    'LAZY': True,
+                },
+            },
+        }
+
+    def make_record(self):
+        return logging.LogRecord('selftest', logging.INFO, __file__, 1, 'message', None, None)
+
+    def test_not_evaluated_until_rendered(self):
+        import helpers
+
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(extra_keyword)s')
+        record = self.make_record()
+
+        with self.app.app_context():
+            formatter.enrich(record)
+            self.assertEqual(0, helpers.CALL_COUNT['counting'])
+
+            self.assertEqual('message call 1', formatter.format(record))
+
+    def test_shared_between_formatters(self):
+        import helpers
+
+        record = self.make_record()
+
+        with self.app.app_context():
+            for fmt in ('%(message)s %(extra_keyword)s', '%(extra_keyword)r'):
+                flask_logging_extras.FlaskExtraLoggerFormatter(fmt=fmt).format(record)
+
+            output = flask_logging_extras.FlaskExtraLoggerFormatter(
+                fmt='{message} {extra_keyword:>8}', style='{').format(record)
+
+        self.assertEqual('message   call 1', output)
+        self.assertEqual(1, helpers.CALL_COUNT['counting'])
+
+    def test_str_format_style(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='{message} {extra_keyword}', style='{')
+
+        with self.app.app_context():
+            self.assertEqual('message call 1', formatter.format(self.make_record()))
+
+    def test_context_enrichment(self):
+        import helpers
+
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(extra_keyword)s',
+                                                                   enrichment='context')
+        record = self.make_record()
+
+        with self.app.app_context():
+            formatter.enrich(record)
+            self.assertEqual(0, helpers.CALL_COUNT['counting'])
+
+            self.assertEqual('message call 1', formatter.format(record))
+
+
+class SharedFormattingTestCase(TestCase):
+    def setUp(self):
+        import helpers
+
+        helpers.CALL_COUNT['counting'] = 0
+
+        self.app = Flask('test_app')
+        self.app.config['FLASK_LOGGING_EXTRAS'] = {
+            'SHARE_FORMATTED': True,
+            'RESOLVERS': {
+                'extra_keyword': 'helpers.counting_resolver',
+            },
+        }
+
+    def make_record(self):
+        return logging.LogRecord('selftest', logging.INFO, __file__, 1, 'message', None, None)
+
+    def test_equivalent_formatters_share_output(self):
+        formatters = [flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(extra_keyword)s')
+                      for _ in range(3)]
+        record = self.make_record()
+
+        with self.app.app_context():
+            outputs = [formatter.format(record) for formatter in formatters]
+
+        self.assertEqual('message call 1', outputs[0])
+        self.assertTrue(all(output is outputs[0] for output in outputs))
+
+    def test_different_formatters(self):
+        import helpers
+
+        record = self.make_record()
+
+        with self.app.app_context():
+            first = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(extra_keyword)s')
+            second = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(extra_keyword)s')
+            json_formatter = flask_logging_extras.FlaskExtraJSONFormatter(fields=['extra_keyword'])
+
+            self.assertEqual('message call 1', first.format(record))
+            self.assertEqual('call 1', second.format(record))
+            self.assertEqual('{"extra_keyword":"call 1"}', json_formatter.format(record))
+
+        self.assertEqual(1, helpers.CALL_COUNT['counting'])
+
+    def test_disabled(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['SHARE_FORMATTED'] = False
+        record = self.make_record()
+
+        with self.app.app_context():
+            outputs = [flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(levelname)s').format(record)
+                       for _ in range(2)]
+
+        self.assertIsNot(outputs[0], outputs[1])
+
+
+class TimeModeTestCase(TestCase):
+    def make_record(self, created):
+        record = logging.LogRecord('selftest', logging.INFO, __file__, 1, 'message', None, None)
+        record.created = created
+        record.msecs = (created - int(created)) * 1000
+
+        return record
+
+    def test_cached_identical_to_stock(self):
+        import random
+
+        timestamps = [1525265088 + random.random() * 5 for _ in range(200)]
+
+        for datefmt in (None, '%Y-%m-%d %H:%M:%S', '%d/%b/%Y:%H:%M:%S %z'):
+            stock = logging.Formatter(fmt='%(asctime)s %(message)s', datefmt=datefmt)
+            cached = flask_logging_extras.FlaskExtraLoggerFormatter(
+                fmt='%(asctime)s %(message)s', datefmt=datefmt, time_mode='cached')
+
+            for timestamp in timestamps:
+                record = self.make_record(timestamp)
+
+                self.assertEqual(stock.format(record), cached.format(record))
+
+    def test_default_identical_to_stock(self):
+        stock = logging.Formatter(fmt='%(asctime)s %(message)s')
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(asctime)s %(message)s')
+        record = self.make_record(1525265088.9445)
+
+        self.assertEqual(stock.format(record), formatter.format(record))
+
+    def test_iso8601(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(asctime)s', time_mode='iso8601')
+
+        self.assertEqual('2018-05-02T12:44:48.944Z', formatter.format(self.make_record(1525265088.9445)))
+
+    def test_epoch_ns(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(asctime)s', time_mode='epoch_ns')
+
+        self.assertEqual('1525265088500000000', formatter.format(self.make_record(1525265088.5)))
+
+        record = self.make_record(1525265088.5)
+        record.created_ns = 1525265088500000123
+
+        self.assertEqual('1525265088500000123', formatter.format(record))
+
+    def test_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            flask_logging_extras.FlaskExtraLoggerFormatter(time_mode='sundial')
+
+
+class GuardedResolverTestCase(TestCase):
+    def setUp(self):
+        import helpers
+
+        helpers.CALL_COUNT['failing'] = 0
+
+        self.app = Flask('test_app')
+        self.app.config['FLASK_LOGGING_EXTRAS'] = {
+            'RESOLVER_DEFAULTS': {
+                'MAX_FAILURES': 2,
+                'COOLDOWN': 60,
+            },
+            'RESOLVERS': {
+                'extra_keyword': {
+                    'RESOLVER': 'helpers.failing_resolver',
+                    'FALLBACK': '<failed>',
+                },
+            },
+        }
+        self.logger, self.handler = configure_loggers('extra_keyword')
+
+    def test_circuit_breaker(self):
+        import helpers
+
+        with self.app.app_context():
+            for _ in range(4):
+                self.logger.info('message')
+
+        self.assertEqual(['message <failed>'] * 4, self.handler.logs)
+        self.assertEqual(2, helpers.CALL_COUNT['failing'])
+
+        stats = flask_logging_extras.get_resolver_stats(self.app)['extra_keyword']
+        self.assertEqual(2, stats['calls'])
+        self.assertEqual(2, stats['errors'])
+        self.assertEqual(2, stats['short_circuited'])
+        self.assertTrue(stats['open'])
+
+    def test_timeout(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['extra_keyword'] = {
+            'RESOLVER': 'helpers.slow_resolver',
+            'TIMEOUT': 0.001,
+            'FALLBACK': '<slow>',
+        }
+
+        with self.app.app_context():
+            for _ in range(3):
+                self.logger.info('message')
+
+        self.assertEqual(['message slow value', 'message slow value', 'message <slow>'], self.handler.logs)
+
+        stats = flask_logging_extras.get_resolver_stats(self.app)['extra_keyword']
+        self.assertEqual(2, stats['slow_calls'])
+        self.assertEqual(2, sum(count for bound, count in stats['histogram'] if bound >= 0.01))
+
+    def test_metrics_only(self):
+        self.app.config['FLASK_LOGGING_EXTRAS'] = {
+            'RESOLVER_METRICS': True,
+            'RESOLVERS': {
+                'extra_keyword': 'helpers.get_extra_keyword',
+                'static_keyword': 'static',
+            },
+        }
+
+        with self.app.app_context():
+            self.logger.info('message')
+
+        self.assertEqual(['message extra callable'], self.handler.logs)
+        self.assertEqual(['extra_keyword'], list(flask_logging_extras.get_resolver_stats(self.app)))
+        self.assertEqual(1, flask_logging_extras.get_resolver_stats(self.app)['extra_keyword']['calls'])
+
+
+class RequestFieldsTestCase(TestCase):
+    def setUp(self):
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'REQUEST': {
+                'DURATION_NAME': 'elapsed',
+                'ID_NAME': 'request_id',
+                'COUNT_NAME': 'record_no',
+            },
+        }
+
+        self.logger = logging.getLogger('test_request_fields')
+        self.logger.propagate = False
+        self.handler = ListHandler()
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(
+            fmt='%(record_no)s %(request_id)s %(elapsed)s'))
+        self.logger.addHandler(self.handler)
+
+        @app.route('/')
+        def route():
+            self.logger.warning('first')
+            self.logger.warning('second')
+
+            return ''
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_request_fields(self):
+        self.client.get('/', headers={'X-Request-ID': 'abc123'})
+
+        first, second = [log.split() for log in self.handler.logs]
+
+        self.assertEqual(['1', 'abc123'], first[:2])
+        self.assertEqual(['2', 'abc123'], second[:2])
+        self.assertLessEqual(float(first[2]), float(second[2]))
+
+    def test_generated_request_id(self):
+        self.client.get('/')
+        self.client.get('/')
+
+        ids = set(log.split()[1] for log in self.handler.logs)
+
+        self.assertEqual(2, len(ids))
+        self.assertTrue(all(len(request_id) == 32 for request_id in ids))
+
+    def test_no_request(self):
+        with self.app.app_context():
+            self.logger.warning('message')
+
+        self.assertEqual(['- - -'], self.handler.logs)
+
+    def test_extra_kept(self):
+        with self.app.test_request_context('/'):
+            self.logger.warning('message', extra={'request_id': 'given'})
+
+        self.assertEqual('given', self.handler.logs[0].split()[1])
+
+    def test_context_enrichment(self):
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(
+            fmt='%(record_no)s %(request_id)s %(elapsed)s', enrichment='context'))
+        self.client.get('/', headers={'X-Request-ID': 'abc123'})
+
+        first, second = [log.split() for log in self.handler.logs]
+
+        self.assertEqual(['1', 'abc123'], first[:2])
+        self.assertEqual(['2', 'abc123'], second[:2])
+        self.assertLessEqual(float(first[2]), float(second[2]))
+
+
+class ResolverDependencyTestCase(TestCase):
+    def setUp(self):
+        import helpers
+
+        helpers.CALL_COUNT['user'] = 0
+
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'RESOLVERS': {
+                'client': {'RESOLVER': 'helpers.get_client', 'DEPENDS': ['user']},
+                'account': {'RESOLVER': 'helpers.get_account', 'DEPENDS': ['user'], 'KEYWORDS': ['tenant', 'plan']},
+                'user': {'RESOLVER': 'helpers.get_user'},
+            },
+        }
+
+        self.logger = logging.getLogger('test_resolver_dependencies')
+        self.logger.propagate = False
+        self.handler = ListHandler()
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(
+            fmt='%(message)s %(client)s %(tenant)s %(plan)s'))
+        self.logger.addHandler(self.handler)
+
+        @app.route('/')
+        def route():
+            self.logger.warning('first')
+            self.logger.warning('second')
+
+            return ''
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_dependency_resolved_once_per_record(self):
+        import helpers
+
+        self.client.get('/')
+
+        self.assertEqual(['first client of alice acme gold', 'second client of alice acme gold'], self.handler.logs)
+        self.assertEqual(2, helpers.CALL_COUNT['user'])
+
+    def test_cached_dependency(self):
+        import helpers
+
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['user']['CACHE'] = True
+        self.client.get('/')
+
+        self.assertEqual(1, helpers.CALL_COUNT['user'])
+
+    def test_lazy_mapping_resolver(self):
+        import helpers
+
+        self.app.config['FLASK_LOGGING_EXTRAS']['LAZY_RESOLVERS'] = True
+
+        with self.app.test_request_context('/'):
+            record = logging.LogRecord('selftest', logging.INFO, __file__, 1, 'message', None, None)
+            self.handler.formatter.enrich(record)
+
+            self.assertEqual(0, helpers.CALL_COUNT['user'])
+            self.assertEqual('acme', str(record.tenant))
+            self.assertEqual('gold', str(record.plan))
+            self.assertEqual(1, helpers.CALL_COUNT['user'])
+
+    def test_dependencies_not_added_to_record(self):
+        with self.app.test_request_context('/'):
+            record = logging.LogRecord('selftest', logging.INFO, __file__, 1, 'message', None, None)
+            self.handler.formatter.enrich(record)
+
+        self.assertFalse(hasattr(record, 'user'))
+        self.assertFalse(hasattr(record, 'account'))
+
+    def test_app_config_resolve(self):
+        with self.app.test_request_context('/'):
+            app_config = flask_logging_extras._AppConfig.for_app(self.app)
+
+            self.assertEqual('gold', app_config.resolve('plan'))
+            self.assertIsNone(app_config.resolve('nothing'))
+
+    def test_app_config_resolve_cached(self):
+        import helpers
+
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['user']['CACHE'] = True
+        app_config = flask_logging_extras._AppConfig.for_app(self.app)
+
+        @self.app.route('/resolve')
+        def resolve_route():
+            return app_config.resolve('plan') + app_config.resolve('tenant')
+
+        with self.app.test_request_context('/'):
+            self.assertEqual('gold', app_config.resolve('plan'))
+            self.assertEqual('acme', app_config.resolve('tenant'))
+
+        self.assertEqual('goldacme', self.client.get('/resolve').get_data(as_text=True))
+        self.assertEqual(2, helpers.CALL_COUNT['user'])
+
+    def test_given_dependency(self):
+        import helpers
+
+        with self.app.test_request_context('/'):
+            self.logger.warning('message', extra={'user': {'name': 'bob', 'tenant': 'corp', 'plan': 'free'}})
+
+        self.assertEqual(['message client of bob corp free'], self.handler.logs)
+        self.assertEqual(0, helpers.CALL_COUNT['user'])
+
+    def test_context_enrichment(self):
+        import helpers
+
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['user']['CACHE'] = True
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(
+            fmt='%(message)s %(client)s %(tenant)s %(plan)s', enrichment='context'))
+        self.client.get('/')
+
+        self.assertEqual(['first client of alice acme gold', 'second client of alice acme gold'], self.handler.logs)
+        self.assertEqual(1, helpers.CALL_COUNT['user'])
+
+    def test_keyword_also_resolver(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['tenant'] = 'static tenant'
+
+        with self.assertRaises(ValueError):
+            flask_logging_extras.FlaskLoggingExtras(self.app)
+
+    def test_guarded_mapping_resolver(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['account'] = {
+            'RESOLVER': 'helpers.failing_resolver',
+            'KEYWORDS': ['tenant', 'plan'],
+            'TIMEOUT': 1,
+            'FALLBACK': '<failed>',
+        }
+
+        self.client.get('/')
+
+        self.assertEqual(['first client of alice None None', 'second client of alice None None'],
+                         self.handler.logs)
+
+    def test_cycle(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['user']['DEPENDS'] = ['client']
+
+        with self.assertRaises(ValueError) as cm:
+            flask_logging_extras.FlaskLoggingExtras(self.app)
+
+        self.assertIn('cycle', str(cm.exception))
+
+    def test_unknown_dependency(self):
+        self.app.config['FLASK_LOGGING_EXTRAS']['RESOLVERS']['user']['DEPENDS'] = ['nothing']
+
+        with self.assertRaises(ValueError):
+            flask_logging_extras.FlaskLoggingExtras(self.app)
+
+
+class DisabledTestCase(TestCase):
+    def setUp(self):
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'ENABLED': False,
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+                'NO_REQUEST_BLUEPRINT': '<no request>',
+            },
+            'REQUEST': {
+                'ID_NAME': 'request_id',
+            },
+            'RESOLVERS': {
+                'static': 'static value',
+                'extra_keyword': 'helpers.get_extra_keyword',
+            },
+        }
+
+        self.logger = logging.getLogger('test_disabled')
+        self.logger.propagate = False
+        self.handler = ListHandler()
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(
+            fmt='%(message)s %(bp)s %(request_id)s %(static)s %(extra_keyword)s'))
+        self.logger.addHandler(self.handler)
+
+        bp = Blueprint('test_blueprint', 'test_bp')
+
+        @bp.route('/')
+        def route():
+            self.logger.warning('message')
+
+            return ''
+
+        app.register_blueprint(bp)
+        flask_logging_extras.FlaskLoggingExtras(app)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_request_context_ignored(self):
+        self.app.test_client().get('/')
+        self.logger.warning('outside')
+
+        self.assertEqual(['message <no request> - static value None', 'outside <no request> - static value None'],
+                         self.handler.logs)
+
+    def test_extra_kept(self):
+        self.logger.warning('message', extra={'bp': 'given'})
+
+        self.assertEqual(['message given - static value None'], self.handler.logs)
+
+    def test_other_apps_unaffected(self):
+        other = Flask('other_app')
+        other.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+            },
+            'REQUEST': {
+                'ID_NAME': 'request_id',
+            },
+            'RESOLVERS': {
+                'static': 'other value',
+                'extra_keyword': 'helpers.get_extra_keyword',
+            },
+        }
+
+        @other.route('/')
+        def route():
+            self.logger.warning('message')
+
+            return ''
+
+        flask_logging_extras.FlaskLoggingExtras(other)
+        other.test_client().get('/', headers={'X-Request-ID': 'abc'})
+        self.app.test_client().get('/')
+
+        self.assertEqual(['message <app> abc other value extra callable', 'message <no request> - static value None'],
+                         self.handler.logs)
+
+    def test_enrich(self):
+        record = logging.LogRecord('selftest', logging.INFO, __file__, 1, 'message', None, None)
+
+        self.handler.formatter.enrich(record)
+
+        self.assertEqual(('<no request>', '-', 'static value', None),
+                         (record.bp, record.request_id, record.static, record.extra_keyword))
+
+    def test_format_shortcut(self):
+        formatter = self.handler.formatter
+
+        self.assertEqual(formatter._format_disabled, formatter.format)
+
+        flask_logging_extras.FlaskLoggingExtras(Flask('other_app'))
+
+        self.assertNotEqual(formatter._format_disabled, formatter.format)
+
+    def test_uninitialised_app_unaffected(self):
+        other = Flask('other_app')
+        other.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+            },
+            'REQUEST': {
+                'ID_NAME': 'request_id',
+            },
+            'RESOLVERS': {
+                'static': 'other value',
+                'extra_keyword': 'helpers.get_extra_keyword',
+            },
+        }
+
+        @other.route('/')
+        def route():
+            self.logger.warning('message')
+
+            return ''
+
+        other.test_client().get('/', headers={'X-Request-ID': 'abc'})
+        self.logger.warning('outside')
+
+        self.assertEqual(['message <app> abc other value extra callable', 'outside <no request> - static value None'],
+                         self.handler.logs)
+
+
+class RecordListHandler(ListHandler):
+    def __init__(self, *args, **kwargs):
+        super(RecordListHandler, self).__init__(*args, **kwargs)
+
+        self.records = []
+
+    def emit(self, record):
+        super(RecordListHandler, self).emit(record)
+
+        self.records.append(record)
+
+
+class ContextEnrichmentTestCase(TestCase):
+    def setUp(self):
+        import helpers
+
+        helpers.CALL_COUNT['counting'] = 0
+
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+            },
+            'REQUEST': {
+                'ID_NAME': 'request_id',
+                'COUNT_NAME': 'record_no',
+            },
+            'RESOLVERS': {
+                'cached': {'RESOLVER': 'helpers.counting_resolver', 'CACHE': True},
+                'uncached': 'helpers.get_extra_keyword',
+                'static': 'static value',
+            },
+        }
+
+        self.logger = logging.getLogger('test_context_enrichment')
+        self.logger.propagate = False
+        self.handler = RecordListHandler()
+        self.handler.setFormatter(self.make_formatter('%(message)s %(bp)s %(request_id)s %(record_no)s %(cached)s '
+                                                      '%(uncached)s %(static)s'))
+        self.logger.addHandler(self.handler)
+
+        bp = Blueprint('test_blueprint', 'test_bp')
+
+        @bp.route('/')
+        def route():
+            self.logger.warning('first')
+            self.logger.warning('second', extra={'static': 'overridden'})
+
+            return ''
+
+        app.register_blueprint(bp)
+
+    def make_formatter(self, fmt, **kwargs):
+        return flask_logging_extras.FlaskExtraLoggerFormatter(fmt=fmt, enrichment='context', **kwargs)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_shared_context(self):
+        self.app.test_client().get('/', headers={'X-Request-ID': 'abc'})
+
+        self.assertEqual(['first test_blueprint abc 1 call 1 extra callable static value',
+                          'second test_blueprint abc 2 call 1 extra callable overridden'],
+                         self.handler.logs)
+
+        first, second = self.handler.records
+
+        self.assertNotIn('bp', first.__dict__)
+        self.assertNotIn('cached', first.__dict__)
+        self.assertIs(first._flask_logging_extras.context, second._flask_logging_extras.context)
+        self.assertEqual({'record_no', 'uncached'}, set(first._flask_logging_extras.values))
+
+    def test_no_request(self):
+        with self.app.app_context():
+            self.logger.warning('message')
+
+        self.assertEqual(['message <not a request> - - call 1 extra callable static value'], self.handler.logs)
+
+    def test_no_request_several_formatters(self):
+        other = RecordListHandler()
+        other.setFormatter(self.make_formatter('%(message)s %(static)s %(uncached)s'))
+        self.logger.addHandler(other)
+        self.addCleanup(self.logger.removeHandler, other)
+        self.handler.setFormatter(self.make_formatter('%(message)s %(bp)s'))
+
+        with self.app.app_context():
+            self.logger.warning('message')
+
+        self.assertEqual(['message <not a request>'], self.handler.logs)
+        self.assertEqual(['message static value extra callable'], other.logs)
+
+    def test_context_attached_without_record_values(self):
+        self.handler.setFormatter(self.make_formatter('%(message)s %(bp)s %(cached)s %(static)s'))
+        self.app.test_client().get('/')
+
+        first, second = self.handler.records
+
+        self.assertIs(first._flask_logging_extras, second._flask_logging_extras)
+        self.assertEqual(['first test_blueprint call 1 static value', 'second test_blueprint call 1 overridden'],
+                         self.handler.logs)
+
+    def test_str_format_style(self):
+        self.handler.setFormatter(self.make_formatter('{message} {bp} {static}', style='{'))
+        self.app.test_client().get('/')
+
+        self.assertEqual(['first test_blueprint static value', 'second test_blueprint overridden'], self.handler.logs)
+
+    def test_template_style(self):
+        self.handler.setFormatter(self.make_formatter('$message $bp ${static}', style='$'))
+        self.app.test_client().get('/')
+
+        self.assertEqual(['first test_blueprint static value', 'second test_blueprint overridden'], self.handler.logs)
+
+    def test_enrich_sets_attributes(self):
+        formatter = self.make_formatter('%(message)s %(bp)s %(cached)s')
+
+        with self.app.test_request_context('/'):
+            record = logging.LogRecord('selftest', logging.INFO, __file__, 1, 'message', None, None)
+            formatter.enrich(record)
+
+        self.assertEqual('test_blueprint', record.bp)
+        self.assertEqual('call 1', record.cached)
+
+    def test_json_formatter(self):
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraJSONFormatter(
+            fields=['message', 'bp', 'cached', 'static'], enrichment='context'))
+        self.app.test_client().get('/')
+
+        self.assertEqual({'message': 'first', 'bp': 'test_blueprint', 'cached': 'call 1', 'static': 'static value'},
+                         json.loads(self.handler.logs[0]))
+
+    def test_json_formatter_record_values(self):
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraJSONFormatter(
+            fields=['message', 'bp', 'record_no', 'missing'], enrichment='context'))
+        self.app.test_client().get('/')
+
+        self.assertEqual({'message': 'first', 'bp': 'test_blueprint', 'record_no': 1, 'missing': None},
+                         json.loads(self.handler.logs[0]))
+
+    def test_no_request_other_formatter_first(self):
+        other = RecordListHandler()
+        other.setFormatter(self.make_formatter('%(message)s %(bp)s %(uncached)s'))
+        self.logger.addHandler(other)
+        self.addCleanup(self.logger.removeHandler, other)
+        self.handler.setFormatter(self.make_formatter('%(message)s %(static)s'))
+
+        with self.app.app_context():
+            self.logger.warning('message')
+
+        self.assertEqual(['message static value'], self.handler.logs)
+        self.assertEqual(['message <not a request> extra callable'], other.logs)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s', enrichment='slots')
+
+
+def raise_chained():
+    try:
+        {}['missing']
+    except KeyError as exc:
+        raise RuntimeError('backend failed') from exc
+
+
+class TracebackCacheTestCase(TestCase):
+    def setUp(self):
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+            },
+        }
+
+        self.logger = logging.getLogger('test_traceback_cache')
+        self.logger.propagate = False
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+
+        bp = Blueprint('test_blueprint', 'test_bp')
+
+        @bp.route('/')
+        def route():
+            for number in range(3):
+                try:
+                    raise_chained()
+                except RuntimeError:
+                    self.logger.exception('failure %d', number)
+
+            return ''
+
+        app.register_blueprint(bp)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_same_output_as_stock(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s', traceback_cache=10)
+
+        for _ in range(2):
+            try:
+                raise_chained()
+            except RuntimeError:
+                exc_info = sys.exc_info()
+
+            self.assertEqual(logging.Formatter().formatException(exc_info), formatter.formatException(exc_info))
+
+        self.assertEqual((1, 1), (formatter._tracebacks.hits, formatter._tracebacks.misses))
+
+    def test_implicit_context(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s', traceback_cache=10)
+
+        try:
+            try:
+                raise ValueError('first')
+            except ValueError:
+                raise RuntimeError('second')
+        except RuntimeError:
+            exc_info = sys.exc_info()
+
+        self.assertEqual(logging.Formatter().formatException(exc_info), formatter.formatException(exc_info))
+
+    def test_cause_not_raised(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s', traceback_cache=10)
+
+        try:
+            raise RuntimeError('failure') from KeyError('never raised')
+        except RuntimeError:
+            exc_info = sys.exc_info()
+
+        self.assertEqual(logging.Formatter().formatException(exc_info), formatter.formatException(exc_info))
+
+    def test_no_exception(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s', traceback_cache=10)
+        output = formatter.format(logging.LogRecord('selftest', logging.ERROR, __file__, 1, 'message', None,
+                                                    (None, None, None)))
+
+        self.assertEqual('message\nNoneType: None', output)
+
+    def test_exception_group_in_chain(self):
+        try:
+            group_class = ExceptionGroup
+        except NameError:
+            self.skipTest('Exception groups need Python 3.11')
+
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s', traceback_cache=10)
+
+        try:
+            try:
+                raise group_class('several failures', [ValueError('first'), KeyError('second')])
+            except group_class as exc:
+                error = RuntimeError('backend failed')
+                error.__cause__ = exc
+
+                raise error
+        except RuntimeError:
+            exc_info = sys.exc_info()
+
+        self.assertEqual(logging.Formatter().formatException(exc_info), formatter.formatException(exc_info))
+
+    def test_messages_not_cached(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s', traceback_cache=10)
+
+        for message in ('first', 'second'):
+            try:
+                raise ValueError(message)
+            except ValueError:
+                self.assertTrue(formatter.formatException(sys.exc_info()).endswith('ValueError: ' + message))
+
+    def test_cache_bounded(self):
+        formatter = flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s', traceback_cache=1)
+
+        for exc_class in (ValueError, KeyError, ValueError):
+            try:
+                raise exc_class('message')
+            except exc_class:
+                formatter.formatException(sys.exc_info())
+
+        self.assertEqual(3, formatter._tracebacks.misses)
+
+    def test_collapse(self):
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(bp)s',
+                                                                                 collapse_tracebacks=60))
+        self.app.test_client().get('/')
+
+        first, second, third = self.handler.logs
+        digest = first.splitlines()[-1][len('(traceback '):-1]
+
+        self.assertIn('Traceback (most recent call last):', first)
+        self.assertEqual(['failure 1 test_blueprint',
+                          'Traceback {} repeated (2 times in 60s, blueprint test_blueprint)'.format(digest),
+                          'RuntimeError: backend failed'],
+                         second.splitlines())
+        self.assertIn('(3 times in 60s', third)
+
+
+class FormatStatsTestCase(TestCase):
+    def setUp(self):
+        flask_logging_extras.reset_format_stats()
+
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+            },
+            'STATS_ROUTE': '/_logging/stats',
+        }
+
+        self.logger = logging.getLogger('test_format_stats')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = ListHandler()
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(bp)s',
+                                                                                 collect_stats=True))
+        self.logger.addHandler(self.handler)
+
+        bp = Blueprint('test_blueprint', 'test_bp')
+
+        @bp.route('/')
+        def route():
+            self.logger.info('first')
+            self.logger.warning('second')
+
+            return ''
+
+        app.register_blueprint(bp)
+        flask_logging_extras.FlaskLoggingExtras(app)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_counters(self):
+        self.app.test_client().get('/')
+
+        with self.app.app_context():
+            self.logger.info('outside')
+
+        stats = flask_logging_extras.get_format_stats()
+
+        self.assertEqual({('test_blueprint', 'INFO', 'test_format_stats'),
+                          ('test_blueprint', 'WARNING', 'test_format_stats'),
+                          ('<not a request>', 'INFO', 'test_format_stats')},
+                         set(stats))
+        self.assertEqual(1, stats[('test_blueprint', 'INFO', 'test_format_stats')]['count'])
+        self.assertEqual(len('first test_blueprint'), stats[('test_blueprint', 'INFO', 'test_format_stats')]['bytes'])
+        self.assertGreater(stats[('test_blueprint', 'INFO', 'test_format_stats')]['format_ns'], 0)
+
+    def test_threads(self):
+        import threading
+
+        def log():
+            with self.app.app_context():
+                for _ in range(100):
+                    self.logger.info('message')
+
+        threads = [threading.Thread(target=log) for _ in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        # The counters of the finished threads are folded when a new one starts counting
+        thread = threading.Thread(target=log)
+        thread.start()
+        thread.join()
+
+        stats = flask_logging_extras.get_format_stats()
+
+        self.assertEqual(500, stats[('<not a request>', 'INFO', 'test_format_stats')]['count'])
+
+    def test_prometheus_route(self):
+        client = self.app.test_client()
+        client.get('/')
+        response = client.get('/_logging/stats')
+
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn('flask_logging_extras_records_total{blueprint="test_blueprint",level="INFO",'
+                      'logger="test_format_stats"} 1',
+                      response.get_data(as_text=True).splitlines())
+
+    def test_blueprint_not_formatted(self):
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s',
+                                                                                 collect_stats=True))
+        self.app.test_client().get('/')
+
+        with self.app.app_context():
+            self.logger.info('outside')
+
+        self.assertEqual({('test_blueprint', 'INFO', 'test_format_stats'),
+                          ('test_blueprint', 'WARNING', 'test_format_stats'),
+                          ('<not a request>', 'INFO', 'test_format_stats')},
+                         set(flask_logging_extras.get_format_stats()))
+
+    def test_context_enrichment(self):
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(bp)s',
+                                                                                 collect_stats=True,
+                                                                                 enrichment='context'))
+        self.app.test_client().get('/')
+
+        self.assertEqual({('test_blueprint', 'INFO', 'test_format_stats'),
+                          ('test_blueprint', 'WARNING', 'test_format_stats')},
+                         set(flask_logging_extras.get_format_stats()))
+
+    def test_disabled_by_default(self):
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(message)s %(bp)s'))
+        self.app.test_client().get('/')
+
+        self.assertEqual({}, flask_logging_extras.get_format_stats())
+
+
+class RequestProfilerTestCase(TestCase):
+    def setUp(self):
+        app = Flask('test_app')
+        self.app = app
+        app.config['FLASK_LOGGING_EXTRAS'] = {
+            'BLUEPRINT': {
+                'FORMAT_NAME': 'bp',
+            },
+            'PROFILER': {
+                'EVERY': 2,
+                'LOGGER': 'test_request_profiler',
+                'LIMIT': 5,
+            },
+        }
+
+        self.logger = logging.getLogger('test_request_profiler')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = ListHandler()
+        self.handler.setFormatter(flask_logging_extras.FlaskExtraLoggerFormatter(fmt='%(bp)s %(message)s'))
+        self.logger.addHandler(self.handler)
+
+        bp = Blueprint('test_blueprint', 'test_bp')
+
+        @bp.route('/blueprint')
+        def profiled_route():
+            return ''
+
+        app.register_blueprint(bp)
+        flask_logging_extras.FlaskLoggingExtras(app)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_every_nth_request(self):
+        client = self.app.test_client()
+
+        for _ in range(4):
+            client.get('/blueprint')
+
+        self.assertEqual(2, len(self.handler.logs))
+
+        for log in self.handler.logs:
+            lines = log.splitlines()
+
+            self.assertTrue(lines[0].startswith('test_blueprint Profile of GET /blueprint ('))
+            self.assertEqual(6, len(lines))
+
+    def test_disabled_logger(self):
+        self.logger.setLevel(logging.WARNING)
+        client = self.app.test_client()
+
+        for _ in range(4):
+            client.get('/blueprint')
+
+        self.assertEqual([], self.handler.logs)
+
+    def test_invalid_sort(self):
+        app = Flask('test_app')
+        app.config['FLASK_LOGGING_EXTRAS'] = {'PROFILER': {'EVERY': 1, 'SORT': 'calls'}}
+
+        with self.assertRaises(ValueError):
+            flask_logging_extras.FlaskLoggingExtras(app)
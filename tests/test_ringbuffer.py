@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Unit tests for the Flask-Logging-Extras ring buffer handler
+"""
+
+import io
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from unittest import TestCase, skipUnless
+
+from flask import Flask, Blueprint
+
+from flask_logging_extras import FlaskExtraLoggerFormatter
+from flask_logging_extras import ringbuffer
+from flask_logging_extras.ringbuffer import FlaskExtraRingBufferHandler, main, read_ring
+
+WORKERS = 3
+REQUESTS = 10
+
+
+def make_app(logger):
+    app = Flask('test_app')
+    app.config['FLASK_LOGGING_EXTRAS'] = {
+        'BLUEPRINT': {
+            'FORMAT_NAME': 'bp',
+        },
+        'RESOLVERS': {
+            'extra_keyword': 'helpers.get_extra_keyword',
+        },
+    }
+
+    bp = Blueprint('test_blueprint', 'test_bp')
+
+    @bp.route('/blueprint/<int:number>')
+    def route(number):
+        logger.info('Message %d', number)
+
+        return ''
+
+    app.register_blueprint(bp)
+
+    return app
+
+
+def crashing_worker(directory, worker_id):
+    logger = logging.getLogger('test_ringbuffer_worker')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler = FlaskExtraRingBufferHandler(directory, slots=16, slot_size=256)
+    handler.setFormatter(FlaskExtraLoggerFormatter(fmt='worker {} %(message)s [%(bp)s]'.format(worker_id)))
+    logger.addHandler(handler)
+
+    with make_app(logger).test_client() as client:
+        for number in range(REQUESTS):
+            client.get('/blueprint/{}'.format(number))
+
+    # Die without closing or flushing the handler
+    os._exit(1)
+
+
+class RingBufferTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.logger = logging.getLogger('test_ringbuffer')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = FlaskExtraRingBufferHandler(self.tmpdir, slots=8, slot_size=256)
+        self.handler.setFormatter(FlaskExtraLoggerFormatter(fmt='%(message)s [%(bp)s] %(extra_keyword)s'))
+        self.logger.addHandler(self.handler)
+        self.app = make_app(self.logger)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        shutil.rmtree(self.tmpdir)
+
+    def log_requests(self, count):
+        with self.app.test_client() as client:
+            for number in range(count):
+                client.get('/blueprint/{}'.format(number))
+
+    def test_fields(self):
+        self.log_requests(1)
+
+        pid, records = read_ring(self.handler.path)
+
+        self.assertEqual(pid, os.getpid())
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['seq'], 1)
+        self.assertEqual(records[0]['name'], 'test_ringbuffer')
+        self.assertEqual(records[0]['levelno'], logging.INFO)
+        self.assertEqual(records[0]['message'], 'Message 0 [test_blueprint] extra callable')
+        self.assertEqual(records[0]['fields'], {'bp': 'test_blueprint', 'extra_keyword': 'extra callable'})
+
+    def test_context_enrichment(self):
+        self.handler.setFormatter(FlaskExtraLoggerFormatter(fmt='%(message)s [%(bp)s] %(extra_keyword)s',
+                                                            enrichment='context'))
+        self.log_requests(1)
+
+        _, records = read_ring(self.handler.path)
+
+        self.assertEqual(records[0]['message'], 'Message 0 [test_blueprint] extra callable')
+        self.assertEqual(records[0]['fields'], {'bp': 'test_blueprint', 'extra_keyword': 'extra callable'})
+
+    def test_slot_size_too_small(self):
+        with self.assertRaises(ValueError):
+            FlaskExtraRingBufferHandler(self.tmpdir, slot_size=16)
+
+    def test_open_error(self):
+        errors = []
+        handler = FlaskExtraRingBufferHandler(os.path.join(self.tmpdir, 'missing'))
+        handler.handleError = errors.append
+        record = logging.makeLogRecord({'msg': 'Message'})
+
+        handler.emit(record)
+        handler.close()
+
+        self.assertEqual(errors, [record])
+
+    def test_flush(self):
+        self.handler.flush()
+        self.log_requests(1)
+        self.handler.flush()
+
+        self.assertEqual(len(read_ring(self.handler.path)[1]), 1)
+
+    def test_wrap_around(self):
+        self.log_requests(20)
+
+        _, records = read_ring(self.handler.path)
+
+        self.assertEqual([record['seq'] for record in records], list(range(13, 21)))
+        self.assertEqual(records[-1]['message'], 'Message 19 [test_blueprint] extra callable')
+
+    def test_truncated(self):
+        with self.app.test_request_context('/blueprint/0'):
+            self.logger.info('x' * 1000)
+
+        _, records = read_ring(self.handler.path)
+
+        self.assertEqual(len(records), 1)
+        self.assertTrue(records[0]['message'].startswith('xxx'))
+        self.assertLess(len(records[0]['message']), 256)
+
+    def test_torn_record_skipped(self):
+        self.log_requests(2)
+        # Corrupt the payload of the second record, as if the process died while writing it
+        self.handler._map[64 + 2 * 256 + 40] ^= 0xFF
+
+        _, records = read_ring(self.handler.path)
+
+        self.assertEqual([record['seq'] for record in records], [1])
+
+    @skipUnless(hasattr(os, 'fork'), 'fork() is not available')
+    def test_fork(self):
+        with self.app.test_request_context('/blueprint/0'):
+            self.logger.info('parent')
+
+        pid = os.fork()
+
+        if pid == 0:
+            try:
+                with self.app.test_request_context('/blueprint/0'):
+                    self.logger.info('child')
+            finally:
+                os._exit(0)
+
+        os.waitpid(pid, 0)
+
+        self.assertEqual(['parent [test_blueprint] extra callable'],
+                         [record['message'] for record in read_ring(self.handler.path)[1]])
+        self.assertEqual(['child [test_blueprint] extra callable'],
+                         [record['message'] for record in read_ring(os.path.join(self.tmpdir,
+                                                                                 'ring-{}.bin'.format(pid)))[1]])
+
+    def test_after_fork_in_child(self):
+        self.log_requests(1)
+        path = self.handler.path
+
+        # What the child of a fork runs; it can't report its coverage
+        ringbuffer._ring_buffer_handlers_after_fork_in_child()
+
+        self.assertIsNone(self.handler._map)
+
+        self.log_requests(1)
+
+        self.assertEqual(len(read_ring(path + '.prev')[1]), 1)
+        self.assertEqual(len(read_ring(path)[1]), 1)
+
+    def test_previous_file_kept(self):
+        with self.app.test_request_context('/blueprint/0'):
+            self.logger.info('First')
+
+        path = self.handler.path
+        self.handler.close()
+
+        self.handler = FlaskExtraRingBufferHandler(self.tmpdir, slots=8, slot_size=256)
+        self.logger.handlers = [self.handler]
+        self.logger.info('Second')
+
+        self.assertEqual(self.handler.path, path)
+        self.assertEqual(read_ring(path + '.prev')[1][0]['message'], 'First [test_blueprint] extra callable')
+        self.assertEqual(read_ring(path)[1][0]['message'], 'Second')
+
+
+class RingDumpTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def dump(self, *args):
+        stdout = sys.stdout
+        sys.stdout = output = io.StringIO()
+
+        try:
+            self.assertEqual(main(list(args)), 0)
+        finally:
+            sys.stdout = stdout
+
+        return output.getvalue().splitlines()
+
+    def test_files(self):
+        handler = FlaskExtraRingBufferHandler(self.tmpdir, slots=8, slot_size=256)
+        handler.emit(logging.makeLogRecord({'msg': 'Message', 'levelno': logging.INFO}))
+        handler.close()
+
+        bogus = os.path.join(self.tmpdir, 'ring-0.bin')
+
+        with open(bogus, 'wb') as f:
+            f.write(b'\0' * 128)
+
+        stderr = sys.stderr
+        sys.stderr = errors = io.StringIO()
+
+        try:
+            lines = self.dump(handler.path, bogus)
+        finally:
+            sys.stderr = stderr
+
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].endswith(' #1 Message'))
+        self.assertIn('Skipping {}: '.format(bogus), errors.getvalue())
+
+    def test_crashed_workers(self):
+        workers = [multiprocessing.Process(target=crashing_worker, args=(self.tmpdir, worker_id))
+                   for worker_id in range(WORKERS)]
+
+        for worker in workers:
+            worker.start()
+
+        for worker in workers:
+            worker.join(30)
+            self.assertEqual(worker.exitcode, 1)
+
+        lines = [json.loads(line) for line in self.dump('--json', self.tmpdir)]
+
+        self.assertEqual(len(lines), WORKERS * REQUESTS)
+        self.assertEqual(set(line['pid'] for line in lines), set(worker.pid for worker in workers))
+        self.assertEqual([line['created'] for line in lines], sorted(line['created'] for line in lines))
+
+        for worker_id in range(WORKERS):
+            messages = [line['message'] for line in lines if line['message'].startswith('worker {} '.format(worker_id))]
+            self.assertEqual(messages, ['worker {} Message {} [test_blueprint]'.format(worker_id, number)
+                                        for number in range(REQUESTS)])
+
+        last = self.dump('--last', '2', self.tmpdir)
+
+        self.assertEqual(len(last), 2)
+        self.assertIn(' #{} worker '.format(REQUESTS), last[-1])